@@ -0,0 +1,119 @@
+"""
+Avatar upload: bytes sent to the image host, handler latency and event loop stalls.
+
+Sends ``--requests`` ``PATCH /api/users/avatar`` requests with a ``--width`` x ``--height`` JPEG photo through the
+ASGI app (no network), ``--concurrency`` at a time. Cloudinary is replaced by an uploader that blocks for the time
+the image would take to go over a ``--bandwidth`` Mbit/s link. ``direct`` is the old behaviour (the original file
+uploaded synchronously on the event loop), ``pipeline`` resizes in the pool and uploads off the loop; every request
+sends a different image. ``repeated`` sends the same image every time, after the first upload it is found by its
+content hash and neither resized nor uploaded.
+
+    python -m benchmarks.bench_avatar --width 4000 --height 3000 --bandwidth 20
+"""
+import asyncio
+import io
+import random
+import time
+
+import httpx
+from PIL import Image
+
+from benchmarks.bench_db_concurrency import heartbeat
+from benchmarks.common import base_parser, make_engine, seed_user, percentile, Timer
+from main import app
+from src.database.db import get_db
+from src.services.auth import auth_service
+from src.services.avatars import AvatarPipeline, avatar_pipeline
+
+
+class SimulatedCloud:
+    def __init__(self, bandwidth_mbit: float):
+        self.bytes_per_second = bandwidth_mbit * 125_000
+        self.uploaded = 0
+
+    def upload(self, file, public_id: str, overwrite: bool = True) -> dict:
+        size = len(file.read())
+        self.uploaded += size
+        time.sleep(size / self.bytes_per_second)
+        return {"version": 1, "secure_url": f"https://res.cloudinary.com/bench/{public_id}.jpg"}
+
+
+class DirectUpload(AvatarPipeline):
+    """The behaviour before the pipeline: the original file is uploaded on the event loop."""
+
+    async def store(self, upload, public_id: str) -> str:
+        result = self.uploader.upload(upload.file, public_id)
+        return result["secure_url"]
+
+
+def photo(width: int, height: int) -> bytes:
+    # noise makes the JPEG about as large as a real photo of that size
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=90)
+    return output.getvalue()
+
+
+async def run_mode(pipeline: AvatarPipeline, user, data: bytes, concurrency: int, total: int, unique: bool) -> dict:
+    # the route calls avatar_pipeline.store, point it to the pipeline under test
+    avatar_pipeline.store = pipeline.store
+    app.dependency_overrides[auth_service.get_current_user] = lambda: user
+    queue = iter(range(total))
+    timings = []
+
+    async def worker(client: httpx.AsyncClient):
+        for n in queue:
+            # bytes after the end of the JPEG are ignored by decoders but change the content hash
+            body = data + f"{time.time_ns()}:{n}".encode() if unique else data
+            start = time.perf_counter()
+            response = await client.patch("/api/users/avatar", files={"file": ("photo.jpg", body, "image/jpeg")})
+            response.raise_for_status()
+            timings.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop))
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+        with Timer() as t:
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    stop.set()
+    timings.sort()
+    return {"rps": total / t.elapsed, "p50": percentile(timings, 0.5), "p95": percentile(timings, 0.95),
+            "stall": await beat, "uploaded": pipeline.uploader.uploaded / total}
+
+
+async def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--bandwidth", type=float, default=20, help="upload bandwidth in Mbit/s")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    random.seed(1)
+
+    engine, session_factory = await make_engine(args.url)
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    user = await seed_user(session_factory, "avatar@bench.example", 0)
+    data = photo(args.width, args.height)
+    print(f"photo {args.width}x{args.height}, {len(data) / 1024:.0f} KiB, link {args.bandwidth} Mbit/s")
+    print(f"{'mode':<9} {'req/s':>7} {'p50':>9} {'p95':>9} {'loop stall':>11} {'uploaded':>10}")
+    modes = (("direct", DirectUpload, True), ("pipeline", AvatarPipeline, True), ("repeated", AvatarPipeline, False))
+    for name, pipeline_class, unique in modes:
+        pipeline = pipeline_class(SimulatedCloud(args.bandwidth), size=avatar_pipeline.size,
+                                  max_bytes=len(data) + 100)
+        result = await run_mode(pipeline, user, data, args.concurrency, args.requests, unique)
+        pipeline.executor.shutdown()
+        print(f"{name:<9} {result['rps']:>7.1f} {result['p50'] * 1000:>7.0f}ms {result['p95'] * 1000:>7.0f}ms "
+              f"{result['stall'] * 1000:>9.0f}ms {result['uploaded'] / 1024:>7.0f}KiB")
+    del avatar_pipeline.store
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Batch endpoints against one request per contact: statements, commits and time for ``--items`` contacts.
+
+Runs through the ASGI app (no network). ``single`` is the old way of a client syncing an address book, one
+``GET``/``PUT``/``DELETE /api/contacts/{id}`` per contact; ``batch`` sends the same work as one
+``POST /api/contacts/batch/get|update|delete``. Statements and commits are counted on the engine.
+
+    python -m benchmarks.bench_batch --items 200
+"""
+import asyncio
+
+import httpx
+from sqlalchemy import event, select
+
+from benchmarks.common import base_parser, make_engine, seed_user, Timer
+from main import app
+from src.database.db import get_db
+from src.database.models import Contact, Role
+from src.services.auth import auth_service, Principal
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.statements = self.commits = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self.statement)
+        event.listen(engine.sync_engine, "commit", self.commit)
+
+    def statement(self, *args):
+        self.statements += 1
+
+    def commit(self, *args):
+        self.commits += 1
+
+    def take(self) -> tuple[int, int]:
+        counts = self.statements, self.commits
+        self.statements = self.commits = 0
+        return counts
+
+
+def contact_body(contact: dict, n: int) -> dict:
+    return {**{key: contact[key] for key in ("firstname", "lastname", "email", "phone", "birthday")},
+            "additionally": f"synced {n}"}
+
+
+async def single(client: httpx.AsyncClient, contacts: list[dict], operation: str):
+    for n, contact in enumerate(contacts):
+        url = f"/api/contacts/{contact['id']}"
+        if operation == "get":
+            response = await client.get(url)
+        elif operation == "update":
+            response = await client.put(url, json=contact_body(contact, n))
+        else:
+            response = await client.delete(url)
+        response.raise_for_status()
+
+
+async def batch(client: httpx.AsyncClient, contacts: list[dict], operation: str):
+    ids = [contact["id"] for contact in contacts]
+    if operation == "update":
+        body = {"items": [{"id": contact["id"], "additionally": f"synced {n}"} for n, contact in enumerate(contacts)]}
+    else:
+        body = {"ids": ids}
+    response = await client.post(f"/api/contacts/batch/{operation}", json=body)
+    response.raise_for_status()
+
+
+async def load_contacts(session_factory, user) -> list[dict]:
+    async with session_factory() as db:
+        contacts = await db.execute(select(Contact).filter(Contact.user_id == user.id).order_by(Contact.id))
+        return [{"id": contact.id, "firstname": contact.firstname, "lastname": contact.lastname,
+                 "email": contact.email, "phone": contact.phone, "birthday": str(contact.birthday)}
+                for contact in contacts.scalars()]
+
+
+async def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--items", type=int, default=200)
+    args = parser.parse_args()
+
+    engine, session_factory = await make_engine(args.url)
+    counter = StatementCounter(engine)
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    print(f"{args.items} contacts")
+    print(f"{'operation':<10} {'mode':<7} {'statements':>10} {'commits':>8} {'time':>9}")
+    for mode, run in (("single", single), ("batch", batch)):
+        user = await seed_user(session_factory, "batch@bench.example", args.items)
+        user.roles = Role.admin
+        app.dependency_overrides[auth_service.get_principal] = lambda: Principal.from_user(user)
+        contacts = await load_contacts(session_factory, user)
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            for operation in ("get", "update", "delete"):
+                counter.take()
+                with Timer() as t:
+                    await run(client, contacts, operation)
+                statements, commits = counter.take()
+                print(f"{operation:<10} {mode:<7} {statements:>10} {commits:>8} {t.elapsed * 1000:>7.0f}ms")
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Polling the contact list: bytes sent and server CPU per poll with and without conditional GET.
+
+A client polls ``GET /api/contacts/?limit=--limit`` ``--requests`` times through the ASGI app (no network) with
+fakeredis standing in for Redis. ``full`` ignores the validators and downloads the page every time, ``etag`` sends
+the ETag of its copy in If-None-Match and gets 304 Not Modified, answered from the collection version in Redis
+without a database query. ``--changes`` contacts are updated at even intervals in between, every change costs the
+``etag`` client one full download.
+
+    python -m benchmarks.bench_conditional --contacts 1000 --limit 100 --requests 500
+"""
+import asyncio
+import time
+
+import httpx
+from fakeredis import aioredis
+from fastapi_limiter import FastAPILimiter
+
+from benchmarks.bench_http import unlimited_identifier
+from benchmarks.common import base_parser, make_engine, seed_user
+from main import app
+from src.database.db import get_db
+from src.database.redis_db import init_redis
+from src.services.auth import auth_service, Principal
+
+
+async def poll(client: httpx.AsyncClient, total: int, limit: int, changes: int, conditional: bool,
+               first_id: int) -> dict:
+    etag = None
+    sent = not_modified = 0
+    every = total // (changes + 1) if changes else 0
+    cpu = wall = 0.0
+    for n in range(1, total + 1):
+        if every and n % every == 0:
+            response = await client.put(f"/api/contacts/{first_id}", json={
+                "firstname": "First0", "lastname": "Last0", "email": f"changed{n}@bench.example",
+                "phone": "+380000000000", "birthday": None, "additionally": f"change {n}"})
+            response.raise_for_status()
+        headers = {"If-None-Match": etag} if conditional and etag else {}
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        response = await client.get("/api/contacts/", params={"limit": limit}, headers=headers)
+        cpu += time.process_time() - cpu_start
+        wall += time.perf_counter() - wall_start
+        if response.status_code == 304:
+            not_modified += 1
+        else:
+            response.raise_for_status()
+            etag = response.headers.get("etag")
+        sent += len(response.content) + sum(len(name) + len(value) + 4 for name, value in response.headers.raw)
+    return {"bytes": sent / total, "cpu": cpu / total, "wall": wall / total, "not_modified": not_modified}
+
+
+async def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--changes", type=int, default=5)
+    args = parser.parse_args()
+
+    engine, session_factory = await make_engine(args.url)
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    user = await seed_user(session_factory, "conditional@bench.example", args.contacts)
+    app.dependency_overrides[auth_service.get_principal] = lambda: Principal.from_user(user)
+    redis = aioredis.FakeRedis(decode_responses=True, single_connection_client=True)
+    await FastAPILimiter.init(redis, identifier=unlimited_identifier)
+    init_redis(redis)
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        first_id = (await client.get("/api/contacts/", params={"limit": 1})).json()[0]["id"]
+        print(f"contacts={args.contacts} limit={args.limit} polls={args.requests} changes={args.changes}")
+        print(f"{'mode':<6} {'bytes/poll':>11} {'cpu/poll':>10} {'wall/poll':>10} {'304s':>6}")
+        for name, conditional in (("full", False), ("etag", True)):
+            result = await poll(client, args.requests, args.limit, args.changes, conditional, first_id)
+            print(f"{name:<6} {result['bytes']:>11.0f} {result['cpu'] * 1000:>8.2f}ms "
+                  f"{result['wall'] * 1000:>8.2f}ms {result['not_modified']:>6}")
+
+    init_redis(None)
+    await redis.close()
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
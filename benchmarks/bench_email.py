@@ -0,0 +1,91 @@
+"""
+Outbound email throughput.
+
+Sends ``--messages`` confirmation emails to a local aiosmtpd server, first the way send_email used to (a new
+FastMail, i.e. a new SMTP connection and a template read from disk, per message), then through MailSender with
+every pool size in ``--pool-sizes``. ``--connect-latency`` and ``--latency`` make the server answer the greeting
+and every message later, to model the round trips of a remote server (the TLS handshake and login of a real one
+make a new connection even dearer than here).
+
+    python -m benchmarks.bench_email --messages 500 --pool-sizes 1,4,8 --connect-latency 0.05 --latency 0.01
+"""
+import argparse
+import asyncio
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+
+from benchmarks.common import Timer
+from src.services.auth import auth_service
+from src.services.email import MailSender, confirmation_message, TEMPLATE_FOLDER
+
+
+class SlowInbox:
+    def __init__(self, connect_latency: float, latency: float):
+        self.connect_latency = connect_latency
+        self.latency = latency
+        self.received = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.connect_latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latency)
+        self.received += 1
+        return "250 OK"
+
+
+async def send_per_message(port: int, messages: int, concurrency: int) -> None:
+    conf = ConnectionConfig(MAIL_USERNAME="", MAIL_PASSWORD="", MAIL_FROM="app@example.com", MAIL_PORT=port,
+                            MAIL_SERVER="127.0.0.1", MAIL_FROM_NAME="ContactsApp", MAIL_STARTTLS=False,
+                            MAIL_SSL_TLS=False, USE_CREDENTIALS=False, VALIDATE_CERTS=False,
+                            TEMPLATE_FOLDER=TEMPLATE_FOLDER)
+    queue = iter(range(messages))
+
+    async def worker():
+        for n in queue:
+            message = MessageSchema(subject="Confirm your email", recipients=[f"user{n}@example.com"],
+                                    template_body={"host": "http://bench/", "username": f"user{n}",
+                                                   "token": auth_service.create_email_token({"sub": "bench"})},
+                                    subtype=MessageType.html)
+            await FastMail(conf).send_message(message, template_name="email_template.html")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--pool-sizes", default="1,4,8")
+    parser.add_argument("--connect-latency", type=float, default=0.02)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    inbox = SlowInbox(args.connect_latency, args.latency)
+    controller = Controller(inbox, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    pool_sizes = [int(size) for size in args.pool_sizes.split(",")]
+    print(f"{'sender':<16} {'emails/s':>9} {'connections':>12}")
+    try:
+        with Timer() as t:
+            await send_per_message(args.port, args.messages, max(pool_sizes))
+        print(f"{'per message':<16} {args.messages / t.elapsed:>9.1f} {args.messages:>12}")
+        for pool_size in pool_sizes:
+            sender = MailSender("127.0.0.1", args.port, "app@example.com", use_tls=False, pool_size=pool_size)
+            with Timer() as t:
+                batch = [confirmation_message(f"user{n}@example.com", f"user{n}", "http://bench/", sender)
+                         for n in range(args.messages)]
+                errors = [error for error in await sender.send_batch(batch) if error is not None]
+            await sender.close()
+            if errors:
+                print(f"pool {pool_size}: {len(errors)} errors, first: {errors[0]!r}")
+            print(f"{f'pool {pool_size}':<16} {args.messages / t.elapsed:>9.1f} {sender.connects:>12}")
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
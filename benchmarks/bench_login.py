@@ -0,0 +1,96 @@
+"""
+Login throughput against the size of the bcrypt pool.
+
+Sends concurrent ``POST /api/auth/login`` requests through the ASGI app (no network) for every pool size in
+``--workers`` and prints logins per second with the worst event loop stall. bcrypt releases the GIL, so throughput
+should grow with the pool up to the number of cores while the loop stays responsive; ``inline`` runs bcrypt on the
+event loop thread for comparison.
+
+    python -m benchmarks.bench_login --rounds 12 --workers inline,1,2,4,8
+"""
+import asyncio
+import os
+
+import httpx
+from sqlalchemy import select
+
+from benchmarks.bench_db_concurrency import heartbeat
+from benchmarks.common import base_parser, make_engine, Timer
+from main import app
+from src.database.db import get_db
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.passwords import PasswordHasher
+
+EMAIL = "login@bench.example"
+PASSWORD = "bench-password"
+
+
+class InlineHasher(PasswordHasher):
+    """Runs bcrypt on the calling thread, i.e. the behaviour before the pool."""
+
+    async def run(self, func, *args):
+        self.completed += 1
+        return func(*args)
+
+
+async def seed_login_user(session_factory, hasher: PasswordHasher) -> None:
+    async with session_factory() as db:
+        user = (await db.execute(select(User).filter_by(email=EMAIL))).scalar_one_or_none()
+        if user is None:
+            user = User(username="login", email=EMAIL, confirmed=True)
+            db.add(user)
+        user.password = hasher.context.hash(PASSWORD)
+        await db.commit()
+
+
+async def run_level(hasher: PasswordHasher, concurrency: int, total: int) -> tuple[float, float]:
+    auth_service.hasher = hasher
+    queue = iter(range(total))
+
+    async def worker(client: httpx.AsyncClient):
+        for _ in queue:
+            response = await client.post("/api/auth/login", data={"username": EMAIL, "password": PASSWORD})
+            response.raise_for_status()
+
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop))
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        with Timer() as t:
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    stop.set()
+    return total / t.elapsed, await beat
+
+
+async def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", default=",".join(["inline"] + [str(2 ** i) for i in range(
+        (os.cpu_count() or 1).bit_length() + 1)]))
+    args = parser.parse_args()
+
+    engine, session_factory = await make_engine(args.url)
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    await seed_login_user(session_factory, PasswordHasher(args.rounds, 1))
+
+    print(f"cores={os.cpu_count()} rounds={args.rounds}")
+    print(f"{'workers':>8} {'logins/s':>10} {'max loop stall':>15}")
+    for workers in args.workers.split(","):
+        if workers == "inline":
+            hasher = InlineHasher(args.rounds, 1)
+        else:
+            hasher = PasswordHasher(args.rounds, int(workers), max_pending=args.requests)
+        rps, stall = await run_level(hasher, max(4, hasher.workers * 2), args.requests)
+        hasher.executor.shutdown()
+        print(f"{workers:>8} {rps:>10.1f} {stall * 1000:>13.2f}ms")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""
+Overhead of MetricsMiddleware per request.
+
+Serves a trivial endpoint through the ASGI stack (no network) with and without the middleware and prints
+the latency distribution of both; the difference is the cost of the metrics.
+
+    python -m benchmarks.bench_metrics --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.common import report
+from src.services.metrics import MetricsMiddleware, MetricsRegistry
+
+
+def make_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware, registry=MetricsRegistry())
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    return app
+
+
+async def run(name: str, app: FastAPI, requests: int) -> dict:
+    timings = []
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for i in range(requests):
+            start = time.perf_counter()
+            await client.get(f"/items/{i}")
+            timings.append(time.perf_counter() - start)
+    return report(name, timings)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    # warm up both stacks before measuring
+    await run("warm up", make_app(True), 500)
+    plain = await run("without metrics", make_app(False), args.requests)
+    measured = await run("with metrics", make_app(True), args.requests)
+    print(f"overhead: {(measured['mean_ms'] - plain['mean_ms']) * 1000:.1f} us per request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
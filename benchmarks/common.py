@@ -0,0 +1,115 @@
+"""
+Helpers shared by the benchmark scripts: engine creation for an arbitrary database url and simple data seeding.
+
+The benchmarks are run as modules from the project root, e.g. ``python -m benchmarks.bench_db_concurrency``.
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+
+from src.conf.config import settings
+from src.database.db import get_async_url
+from src.database.models import Base, Contact, User, birthday_key
+
+DEFAULT_BENCH_URL = "sqlite:///./bench.db"
+
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    """
+    The base_parser function builds the argument parser with the options every benchmark accepts.
+
+    :param description: str: Help text of the benchmark
+    :return: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--url", default=DEFAULT_BENCH_URL,
+                        help=f"database url (sync or async form), e.g. {settings.sqlalchemy_database_url}")
+    return parser
+
+
+async def make_engine(url: str) -> tuple[AsyncEngine, async_sessionmaker]:
+    """
+    The make_engine function creates the async engine and session factory for the benchmark database
+    and makes sure the tables exist.
+
+    :param url: str: Database url
+    :return: The engine and the session factory
+    """
+    engine = create_async_engine(get_async_url(url), pool_size=50, max_overflow=0) \
+        if not url.startswith("sqlite") else create_async_engine(get_async_url(url))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine, async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+async def seed_user(session_factory: async_sessionmaker, email: str, contacts: int) -> User:
+    """
+    The seed_user function (re)creates a benchmark user with the given number of contacts.
+
+    :param session_factory: async_sessionmaker: Session factory of the benchmark database
+    :param email: str: Email of the benchmark user
+    :param contacts: int: Number of contacts to create
+    :return: The user
+    """
+    async with session_factory() as db:
+        user = (await db.execute(select(User).filter_by(email=email))).scalar_one_or_none()
+        if user is None:
+            user = User(username="bench", email=email, password="x", confirmed=True)
+            db.add(user)
+            await db.flush()
+        await db.execute(delete(Contact).where(Contact.user_id == user.id))
+        start = date(1970, 1, 1)
+        birthdays = [start + timedelta(days=i * 37 % 20000) for i in range(contacts)]
+        rows = [dict(firstname=f"First{i}", lastname=f"Last{i}", email=f"{user.id}.{i}@bench.example",
+                     phone=f"+380{i:09d}", birthday=birthday, birthday_md=birthday_key(birthday),
+                     additionally="", user_id=user.id) for i, birthday in enumerate(birthdays)]
+        for i in range(0, len(rows), 5000):
+            await db.execute(insert(Contact), rows[i:i + 5000])
+        await db.commit()
+        return user
+
+
+def percentile(timings: list[float], fraction: float) -> float:
+    """
+    The percentile function returns the value below which the given fraction of the sorted timings falls.
+
+    :param timings: list[float]: Sorted timings
+    :param fraction: float: E.g. 0.95 for p95
+    :return: float
+    """
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def report(name: str, timings: list[float]) -> dict:
+    """
+    The report function prints and returns the summary statistics of a series of timings (in seconds).
+
+    :param name: str: Label of the series
+    :param timings: list[float]: Measured durations
+    :return: Summary dictionary
+    """
+    timings = sorted(timings)
+    summary = {
+        "name": name,
+        "n": len(timings),
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "p50_ms": percentile(timings, 0.5) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+    }
+    print(f"{name:<40} n={summary['n']:<6} mean={summary['mean_ms']:.3f}ms "
+          f"p50={summary['p50_ms']:.3f}ms p95={summary['p95_ms']:.3f}ms p99={summary['p99_ms']:.3f}ms")
+    return summary
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
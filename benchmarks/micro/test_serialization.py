@@ -0,0 +1,47 @@
+"""
+pytest-benchmark microbenchmarks of the serialization of a page of contacts.
+
+``response_model`` is what FastAPI does for ``response_model=List[ContactResponse]`` (validation of every row,
+jsonable_encoder, stdlib json), ``fast_json`` is the opt-in path of src.services.fast_json. No database is needed,
+the rows are ORM objects built in memory:
+
+    pytest benchmarks/micro/test_serialization.py --benchmark-group-by=param:rows
+"""
+from datetime import date
+from typing import List
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from pydantic.fields import ModelField
+
+from src.database.models import Contact
+from src.schemas import ContactResponse
+from src.services.fast_json import FastJSON
+
+FIELD = ModelField.infer(name="Response", value=None, annotation=List[ContactResponse], class_validators={},
+                         config=ContactResponse.__config__)
+
+
+@pytest.fixture(scope="module", params=[10, 100, 1000], ids=lambda rows: f"{rows}_rows")
+def rows(request):
+    return [Contact(id=i, firstname=f"First{i}", lastname=f"Last{i}", email=f"{i}@bench.example",
+                    phone=f"+380{i:09d}", birthday=date(1990, i % 12 + 1, i % 28 + 1) if i % 3 else None,
+                    additionally="bench", user_id=1) for i in range(request.param)]
+
+
+def response_model(rows: list) -> bytes:
+    # serialize_response never suspends for a coroutine endpoint, it is driven without an event loop
+    coroutine = serialize_response(field=FIELD, response_content=rows, is_coroutine=True)
+    try:
+        coroutine.send(None)
+    except StopIteration as result:
+        return JSONResponse(result.value).body
+
+
+def test_response_model(benchmark, rows):
+    assert benchmark(response_model, rows) == FastJSON(ContactResponse).encode(rows)
+
+
+def test_fast_json(benchmark, rows):
+    benchmark(FastJSON(ContactResponse).encode, rows)
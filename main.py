@@ -1,3 +1,4 @@
+import asyncio
 import time
 from ipaddress import ip_address
 from typing import Callable
@@ -9,15 +10,24 @@ from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
 from fastapi.middleware.cors import CORSMiddleware
 
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
-from src.database.db import get_db
+from src.database.db import get_db, async_engine, pool_monitor
+from src.database.redis_db import init_redis, get_redis
 from src.routes import contacts, auth, users  # підключення роутів до апі
 from src.conf.config import settings
+from src.services.user_cache import user_cache
+from src.services.metrics import metrics, MetricsMiddleware, RedisRoundTripCounter, instrument_engine
+from src.services.passwords import password_hasher
+from src.services.token_cache import token_cache
+from src.services.jobs import job_queue
+from src.services.contact_cache import contact_cache
+from src.services.avatars import avatar_pipeline
+from src.services.body_limit import BodySizeLimitMiddleware
 
 app = FastAPI()
 
@@ -27,7 +37,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[contacts.NEXT_CURSOR_HEADER],
 )
+app.add_middleware(BodySizeLimitMiddleware, limits={'/api/users/avatar': avatar_pipeline.max_body_bytes})
+# added last, so it is the outermost middleware and times the whole request
+app.add_middleware(MetricsMiddleware)
+
+instrument_engine(async_engine.sync_engine)
+metrics.register_collector('db_pool', pool_monitor.stats)
+metrics.register_collector('user_cache', user_cache.stats)
+metrics.register_collector('token_cache', token_cache.stats)
+metrics.register_collector('password_hasher', password_hasher.stats)
+metrics.register_collector('jobs', job_queue.stats)
+metrics.register_collector('contact_cache', contact_cache.stats)
 
 app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')  # підключення роутів до апі
@@ -60,15 +82,30 @@ ALLOWED_IPS = [ip_address('192.168.1.0'), ip_address('172.16.0.0'), ip_address("
 
 @app.on_event("startup")
 async def startup():
-    r = await redis.Redis(
+    r = await redis.Redis(connection_pool=redis.ConnectionPool(
+        connection_class=RedisRoundTripCounter,
         host=settings.redis_host,
         port=settings.redis_port,
         password=settings.redis_password,
         db=0,
         encoding="utf-8",
         decode_responses=True,
-    )
+    ))
     await FastAPILimiter.init(r)
+    init_redis(r)
+    app.state.user_cache_listener = asyncio.create_task(user_cache.listen())
+    app.state.metrics_flush = asyncio.create_task(metrics.flush_periodically(settings.metrics_flush_interval))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.user_cache_listener.cancel()
+    app.state.metrics_flush.cancel()
+    metrics.flush()
+    r = get_redis()
+    if r is not None:
+        init_redis(None)
+        await r.close()
 
 
 # @app.middleware('http')
@@ -94,6 +131,27 @@ async def main():
     return {"msg": "Hello!!!!"}
 
 
+def is_loopback(host: str) -> bool:
+    try:
+        return ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics(request: Request):
+    """
+    The read_metrics function returns the metrics of all workers in the Prometheus text format.
+    Unless metrics_local_only is switched off, it answers only requests from the loopback interface.
+
+    :param request: Request: Get the client address
+    :return: Metrics page
+    """
+    if settings.metrics_local_only and (request.client is None or not is_loopback(request.client.host)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # @app.get("/api/healthchecker")
 # def healthchecker(db: Session = Depends(get_db)):
 #     try:
@@ -0,0 +1,31 @@
+"""add trigram search index
+
+Revision ID: c3a8f1d07b54
+Revises: 9e4d2a6b3c18
+Create Date: 2026-10-16 13:05:47.291806
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8f1d07b54'
+down_revision = '9e4d2a6b3c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # pg_trgm gives the trigram operator class for ILIKE '%x%' and similarity(),
+    # btree_gin lets the same GIN index include user_id
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    # declared in src.database.models, the expression is src.database.models.contact_search_document
+    op.execute("CREATE INDEX ix_contacts_search_trgm ON contacts USING gin "
+               "(user_id, (firstname || ' ' || lastname || ' ' || email || ' ' || phone || ' ' "
+               "|| coalesce(additionally, '')) gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_search_trgm', table_name='contacts')
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseSettings
 
 
@@ -10,13 +12,59 @@ class Settings(BaseSettings):
     mail_from: str = 'example@meta.ua'
     mail_port: int = 465
     mail_server: str = 'smtp.meta.ua'
+    mail_ssl_tls: bool = True
+    mail_starttls: bool = False
+    mail_use_credentials: bool = True
+    mail_validate_certs: bool = True
+    mail_pool_size: int = 4
     redis_host: str = 'localhost'
     redis_port: int = 6379
+    redis_password: Optional[str] = None
     cloudinary_name: str = 'name'
     cloudinary_api_key: int = 154468525541985
     cloudinary_api_secret: str = 'secret'
     main_host: str = '127.0.0.1'
     main_port: int = 8000
+    birthday_window_days: int = 7
+    suggest_cache_users: int = 1000
+    suggest_cache_ttl: int = 300
+    import_chunk_size: int = 1000
+    import_max_reported_rows: int = 1000
+    bcrypt_rounds: int = 12
+    password_hash_workers: Optional[int] = None
+    password_hash_max_pending: Optional[int] = None
+    user_cache_ttl: int = 900
+    user_cache_local_size: int = 10000
+    user_cache_local_ttl: float = 5
+    user_cache_local_max_bytes: int = 8 * 2 ** 20
+    token_cache_size: int = 10000
+    db_echo: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_slow_query_ms: float = 200
+    db_slow_query_sample_rate: float = 1.0
+    db_slow_query_explain: bool = False
+    metrics_dir: Optional[str] = None
+    metrics_flush_interval: float = 5
+    metrics_local_only: bool = True
+    avatar_size: int = 250
+    avatar_max_bytes: int = 10 * 2 ** 20
+    avatar_max_pixels: int = 50_000_000
+    avatar_quality: int = 85
+    avatar_workers: Optional[int] = None
+    jobs_stream: str = 'jobs'
+    jobs_max_attempts: int = 5
+    jobs_backoff_base: float = 5
+    jobs_backoff_max: float = 600
+    jobs_claim_idle: float = 300
+    jobs_concurrency: int = 8
+    fast_json: bool = False
+    contact_cache_enabled: bool = True
+    contact_cache_ttl: int = 60
+    contact_cache_max_entry_bytes: int = 256 * 1024
 
     class Config:
         env_file = ".env"
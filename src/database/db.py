@@ -3,10 +3,14 @@ import pathlib
 
 from fastapi import HTTPException, status
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 
 from src.conf.config import settings
+from src.database.monitoring import InstrumentedQueuePool, SlowQueryLog, instrument
 
 
 # file_config = pathlib.Path(__file__).parent.parent.joinpath('conf/config.ini')
@@ -20,22 +24,78 @@ from src.conf.config import settings
 # domain = config.get('DB', 'DOMAIN')
 # port = config.get('DB', 'PORT')
 
-url = settings.sqlalchemy_database_url
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def get_async_url(sync_url: str) -> str:
+    """
+    The get_async_url function turns the configured (sync) database url into the url of its asyncio driver:
+    asyncpg for Postgres and aiosqlite for SQLite. Urls that already name an async driver are returned as is.
+
+    :param sync_url: str: Database url from the settings
+    :return: Database url for create_async_engine
+    """
+    db_url = make_url(sync_url)
+    backend = db_url.get_backend_name()
+    if backend not in ASYNC_DRIVERS or db_url.drivername in ASYNC_DRIVERS.values():
+        return sync_url
+    return db_url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def pool_options(db_url: str) -> dict:
+    """
+    The pool_options function returns the connection pool arguments of create_async_engine taken from the settings.
+    SQLite keeps the pool SQLAlchemy picks for it (there is no server connection to pool).
+
+    :param db_url: str: Database url
+    :return: Keyword arguments for create_async_engine
+    """
+    if make_url(db_url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': settings.db_pool_size,
+        'max_overflow': settings.db_max_overflow,
+        'pool_timeout': settings.db_pool_timeout,
+        'pool_recycle': settings.db_pool_recycle,
+        'pool_pre_ping': settings.db_pool_pre_ping,
+    }
 
 
-engine = create_engine(url, echo=True)
+def dialect_insert(db: AsyncSession):
+    """
+    The dialect_insert function returns the insert construct of the database dialect of the session,
+    which supports INSERT ... ON CONFLICT on Postgres and SQLite.
+
+    :param db: AsyncSession: Database session
+    :return: insert function of the dialect
+    """
+    return postgresql.insert if db.get_bind().dialect.name == 'postgresql' else sqlite.insert
+
+
+url = settings.sqlalchemy_database_url
+async_url = get_async_url(url)
+
+# Sync engine is used only by tooling (alembic, data seeding scripts), the application works with async_engine
+engine = create_engine(url, echo=settings.db_echo)
 DBSession = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+async_engine = create_async_engine(async_url, echo=settings.db_echo, **pool_options(async_url))
+AsyncDBSession = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
-# Dependency
-def get_db():
-    db = DBSession()
-    try:
-        yield db
-    except SQLAlchemyError as err:
-        db.rollback()
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
-    finally:
-        db.close()
+slow_query_log = SlowQueryLog(settings.db_slow_query_ms, settings.db_slow_query_sample_rate,
+                              settings.db_slow_query_explain)
+pool_monitor = instrument(async_engine.sync_engine, slow_query_log)
 
 
+# Dependency
+async def get_db():
+    async with AsyncDBSession() as db:
+        try:
+            yield db
+        except SQLAlchemyError as err:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
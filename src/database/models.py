@@ -1,7 +1,9 @@
 import enum
+from datetime import date
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, func, Date, Enum
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, SmallInteger, String, DateTime, func, Date, Enum, Index, \
+    literal_column
+from sqlalchemy.orm import relationship, declarative_base, validates
 
 Base = declarative_base()
 
@@ -11,6 +13,21 @@ class Role(enum.Enum):
     moderator: str = 'moderator'
     user: str = 'user'
 
+
+def birthday_key(birthday: date | None) -> int | None:
+    """
+    The birthday_key function returns month * 100 + day of the birthday (e.g. 1231 for December 31).
+    It orders birthdays within a year, ignores the year of birth and keeps February 29 between February 28
+    and March 1 in every year.
+
+    :param birthday: date | None: Birthday of the contact
+    :return: Key of the birthday or None
+    """
+    if birthday is None:
+        return None
+    return birthday.month * 100 + birthday.day
+
+
 class Contact(Base):
     __tablename__ = "contacts"
     id = Column(Integer, primary_key=True, index=True)
@@ -19,12 +36,46 @@ class Contact(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     phone = Column(String, nullable=False)
     birthday = Column(Date, nullable=True)
+    birthday_md = Column(SmallInteger, nullable=True)
     user_id = Column('user_id', Integer, ForeignKey('users.id', ondelete="CASCADE"))
     user = relationship("User", backref="contacts")
     additionally = Column(String)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    # keyset pagination of the user's contacts: WHERE user_id = :id AND id > :cursor ORDER BY id
+    # upcoming birthdays: WHERE user_id = :id AND birthday_md BETWEEN :start AND :end
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_birthday_md', 'user_id', 'birthday_md'),
+    )
+
+    @validates('birthday')
+    def validate_birthday(self, key, birthday):
+        self.birthday_md = birthday_key(birthday)
+        return birthday
+
+
+def contact_search_document():
+    """
+    The contact_search_document function returns the SQL expression with all searchable fields of a contact
+    (firstname, lastname, email, phone, additionally) joined by spaces.
+
+    On Postgres the same expression is indexed together with user_id by a GIN trigram index
+    (ix_contacts_search_trgm below), so changing it needs a migration recreating the index.
+
+    :return: SQL expression of the search document
+    """
+    space = literal_column("' '")
+    return (Contact.firstname + space + Contact.lastname + space + Contact.email + space + Contact.phone + space
+            + func.coalesce(Contact.additionally, literal_column("''")))
+
+
+# substring search of the user's contacts: WHERE user_id = :id AND document ILIKE '%q%'
+# (needs the pg_trgm and btree_gin extensions, so it is created only on Postgres)
+Index('ix_contacts_search_trgm', Contact.user_id, contact_search_document().label('search_document'),
+      postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+
 
 class User(Base):
     __tablename__ = "users"
@@ -34,6 +85,8 @@ class User(Base):
     password = Column(String(255), nullable=False)
     refresh_token = Column(String(255), nullable=True)
     avatar = Column(String(255), nullable=True)
+    # sha256 of the uploaded image (see src.services.avatars), identifies the stored avatar
+    avatar_hash = Column(String(64), nullable=True, index=True)
     roles = Column('role', Enum(Role), default=Role.user)
     confirmed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=func.now())
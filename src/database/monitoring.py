@@ -0,0 +1,195 @@
+import logging
+import random
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+slow_query_logger = logging.getLogger('src.database.slow_query')
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+
+class PoolMonitor:
+    """
+    Live statistics of a connection pool: connections checked out now and at peak, time spent waiting
+    for a connection (including pre-ping and connecting) and checkout timeouts.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.checkouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = 0
+
+    def on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        self.checked_out -= 1
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the counters together with the current state reported by the pool.
+
+        :return: Dictionary with the pool metrics
+        """
+        stats = {
+            'checkouts': self.checkouts,
+            'checked_out': self.checked_out,
+            'peak_checked_out': self.peak_checked_out,
+            'connects': self.connects,
+            'invalidations': self.invalidations,
+            'timeouts': self.timeouts,
+            'wait_avg_ms': self.wait_total / self.waits * 1000 if self.waits else 0.0,
+            'wait_max_ms': self.wait_max * 1000,
+        }
+        if self.pool is not None and hasattr(self.pool, 'size'):
+            stats.update(pool_size=self.pool.size(), overflow=self.pool.overflow(),
+                         checked_in=self.pool.checkedin())
+        return stats
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that reports how long every checkout took to its PoolMonitor.
+    """
+    monitor: Optional[PoolMonitor] = None
+
+    def connect(self):
+        if self.monitor is None:
+            return super().connect()
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.monitor.timeouts += 1
+            raise
+        finally:
+            self.monitor.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() replaces the pool, the statistics go on
+        pool = super().recreate()
+        pool.monitor = self.monitor
+        if self.monitor is not None:
+            self.monitor.pool = pool
+        return pool
+
+
+def parameters_shape(parameters, executemany: bool) -> str:
+    """
+    The parameters_shape function describes the bound parameters without their values (which may hold personal data),
+    e.g. "3 params (int, str, str)" or "executemany 1000 x 7 params".
+
+    :param parameters: Parameters passed to the DBAPI cursor
+    :param executemany: bool: The statement was executed for many parameter sets
+    :return: str: Description of the parameters
+    """
+    if executemany:
+        rows = list(parameters)
+        return f'executemany {len(rows)} x {len(rows[0]) if rows else 0} params'
+    values = list(parameters.values()) if isinstance(parameters, dict) else list(parameters or ())
+    return f'{len(values)} params ({", ".join(type(value).__name__ for value in values)})'
+
+
+class SlowQueryLog:
+    """
+    Logs statements that ran longer than threshold_ms to the "src.database.slow_query" logger: the statement,
+    the shape of its parameters, the duration and, optionally, the query plan of slow SELECT statements.
+    Only sample_rate of the slow statements are logged, so a database slowdown does not flood the log.
+    The last records are kept in ``recent``.
+    """
+
+    def __init__(self, threshold_ms: float, sample_rate: float = 1.0, explain: bool = False, keep: int = 100):
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.explain = explain
+        self.recent: deque[dict] = deque(maxlen=keep)
+        self.slow = 0
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_query_start', None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        if duration < self.threshold:
+            return
+        self.slow += 1
+        if random.random() >= self.sample_rate:
+            return
+        record = {
+            'statement': statement,
+            'parameters': parameters_shape(parameters, executemany),
+            'duration_ms': round(duration * 1000, 3),
+        }
+        if self.explain and not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            record['plan'] = self.query_plan(conn, statement, parameters)
+        self.recent.append(record)
+        slow_query_logger.warning('Slow query %.1f ms [%s]: %s%s', record['duration_ms'], record['parameters'],
+                                  statement, f"\nPlan:\n{record['plan']}" if record.get('plan') else '')
+
+    @staticmethod
+    def query_plan(conn, statement: str, parameters) -> Optional[str]:
+        prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+        if prefix is None:
+            return None
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+        except Exception as err:
+            return f'EXPLAIN failed: {err}'
+        finally:
+            cursor.close()
+
+
+def instrument(engine: Engine, slow_query_log: Optional[SlowQueryLog] = None) -> PoolMonitor:
+    """
+    The instrument function attaches a PoolMonitor (and the slow query log) to the engine.
+    For an AsyncEngine pass its sync_engine.
+
+    :param engine: Engine: Engine to watch
+    :param slow_query_log: SlowQueryLog: Slow query log, None to skip timing of statements
+    :return: PoolMonitor of the engine
+    """
+    monitor = PoolMonitor()
+    monitor.pool = engine.pool
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.monitor = monitor
+    event.listen(engine, 'connect', monitor.on_connect)
+    event.listen(engine, 'checkout', monitor.on_checkout)
+    event.listen(engine, 'checkin', monitor.on_checkin)
+    event.listen(engine, 'invalidate', monitor.on_invalidate)
+    if slow_query_log is not None:
+        event.listen(engine, 'before_cursor_execute', slow_query_log.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', slow_query_log.after_cursor_execute)
+    return monitor
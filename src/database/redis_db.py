@@ -0,0 +1,27 @@
+from typing import Optional
+
+from redis.asyncio import Redis
+
+# The async Redis client created in main.startup (the same pool serves fastapi-limiter and the caches).
+# It stays None when Redis is not configured, e.g. in tests, and the caches then work as pass-through.
+redis_client: Optional[Redis] = None
+
+
+def init_redis(client: Optional[Redis]) -> None:
+    """
+    The init_redis function registers the application wide async Redis client.
+
+    :param client: Redis: Client created at startup, or None to switch Redis usage off
+    :return: None
+    """
+    global redis_client
+    redis_client = client
+
+
+def get_redis() -> Optional[Redis]:
+    """
+    The get_redis function returns the application wide async Redis client.
+
+    :return: Redis client or None when it was not initialized
+    """
+    return redis_client
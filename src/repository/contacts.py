@@ -1,12 +1,41 @@
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import AsyncIterator
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, and_, select, case, func, update, delete, bindparam
+from sqlalchemy.exc import IntegrityError
 
-from src.database.models import Contact, User
+from src.database.db import dialect_insert
+from src.database.models import Contact, User, birthday_key, contact_search_document
 from src.schemas import ContactModel
+from src.services.contact_cache import contact_cache
 
+MAX_SEARCH_TERMS = 5
+EXPORT_COLUMNS = (Contact.id, Contact.firstname, Contact.lastname, Contact.email, Contact.phone, Contact.birthday,
+                  Contact.additionally)
 
-async def get_contacts(limit: int, offset: int, user: User, db: Session):
+
+def paginate(stmt, limit: int, offset: int, after_id: int | None):
+    """
+    The paginate function orders the contacts query by id and cuts one page out of it.
+
+    With after_id the page starts right after the contact with this id (keyset pagination), so the database seeks
+    on the (user_id, id) index instead of reading and throwing away offset rows. Offset is used only when
+    no after_id is given and is kept for compatibility.
+
+    :param stmt: Select: Query of contacts
+    :param limit: int: Page size
+    :param offset: int: Number of contacts to skip, ignored when after_id is set
+    :param after_id: int | None: Id of the last contact of the previous page
+    :return: Select with order, limit and either the keyset filter or offset
+    """
+    stmt = stmt.order_by(Contact.id).limit(limit)
+    if after_id is not None:
+        return stmt.filter(Contact.id > after_id)
+    return stmt.offset(offset)
+
+
+async def get_contacts(limit: int, offset: int, user: User, db: AsyncSession, after_id: int | None = None):
     """
     The get_contacts function returns a list of contacts created current user.
 
@@ -17,147 +46,414 @@ async def get_contacts(limit: int, offset: int, user: User, db: Session):
     :param user: Get the user from the database.
     :type user: User
     :param db: Database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param after_id: Id of the last contact of the previous page, if set offset is ignored.
+    :type after_id: int | None
     :return: All contacts for the user.
     :rtype: List[Contact]
     """
-    contacts = db.query(Contact).filter(Contact.user_id == user.id).limit(limit).offset(offset).all()
-    return contacts
+
+    async def load():
+        stmt = paginate(select(Contact).filter(Contact.user_id == user.id), limit, offset, after_id)
+        contacts = await db.execute(stmt)
+        return contacts.scalars().all()
+
+    shape = f'list:{limit}:{offset}' if after_id is None else f'after:{limit}:{after_id}'
+    return await contact_cache.get_or_load(user.id, shape, load)
+
+
+async def stream_contacts(user: User, db: AsyncSession, since_id: int | None = None,
+                          batch_size: int = 500) -> AsyncIterator[list]:
+    """
+    The stream_contacts function reads all contacts of the user in id order through a server-side cursor
+    and yields them in batches, so memory does not depend on the size of the address book.
+    Plain rows are returned instead of Contact objects to skip ORM bookkeeping.
+
+    :param user: User: Current user
+    :param db: AsyncSession: Pass the database session to the function
+    :param since_id: int | None: Return only contacts with id greater than this one (resume an export)
+    :param batch_size: int: Number of rows fetched from the cursor at once
+    :return: Async iterator of lists of rows with EXPORT_COLUMNS
+    """
+    stmt = select(*EXPORT_COLUMNS).filter(Contact.user_id == user.id).order_by(Contact.id) \
+        .execution_options(yield_per=batch_size)
+    if since_id is not None:
+        stmt = stmt.filter(Contact.id > since_id)
+    rows = await db.stream(stmt)
+    async for batch in rows.partitions():
+        yield batch
 
 
-async def get_contact_by_id(contact_id: int, user: User, db: Session):
+async def get_contact_by_id(contact_id: int, user: User, db: AsyncSession):
     """
     The get_contact_by_id function takes in a contact_id and user, and returns the contact with that id.
+    The result is cached, the contact is not attached to the session.
 
     If not contact with such id, return None
 
     :param contact_id: int: Specify the id of the contact we want to get
     :param user: User: Get the user's id from the database
-    :param db: Session: Pass the database session object to the function
+    :param db: AsyncSession: Pass the database session object to the function
     :return: The contact with the specified id
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    return contact
+
+    async def load():
+        stmt = select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id))
+        contact = await db.execute(stmt)
+        return contact.scalar_one_or_none()
+
+    return await contact_cache.get_or_load(user.id, f'id:{contact_id}', load)
 
 
-async def get_contact_by_email(email: str, user: User, db: Session):
+async def get_contact_by_email(email: str, user: User, db: AsyncSession):
     """
     The get_contact_by_email function takes in an email and returns the contact with that email.
     The search for contacts will be among the contacts of a specific user
 
     :param email: str: Filter the contact by email
     :param user: User: Get the user id from the database
-    :param db: Session
+    :param db: AsyncSession
     :return: A contact object created the user and with the email
     """
-    contact = db.query(Contact).filter(and_(Contact.email == email, Contact.user_id == user.id)).first()
-    return contact
 
+    async def load():
+        stmt = select(Contact).filter(and_(Contact.email == email, Contact.user_id == user.id))
+        contact = await db.execute(stmt)
+        return contact.scalar_one_or_none()
+
+    return await contact_cache.get_or_load(user.id, f'email:{email}', load)
 
-async def create_contact(body: ContactModel, user: User, db: Session):
+
+async def get_contact_names(user: User, db: AsyncSession):
+    """
+    The get_contact_names function returns id, firstname, lastname and email of all contacts of the user.
+    It is used to build the in-memory index of suggestions.
+
+    :param user: User: Current user
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of (id, firstname, lastname, email) rows
+    """
+    stmt = select(Contact.id, Contact.firstname, Contact.lastname, Contact.email).filter(Contact.user_id == user.id)
+    rows = await db.execute(stmt)
+    return rows.all()
+
+
+async def create_contact(body: ContactModel, user: User, db: AsyncSession):
     """
     The create_contact function creates a new contact in the database for the specific user
+    by one INSERT ... ON CONFLICT (email) DO NOTHING RETURNING statement.
 
     :param body: ContactModel: contact info
     :param user: User: Current user
-    :param db: Session
-    :return: The contact object
-    """
-    contact = Contact(**body.dict())
-    contact.user_id = user.id
-    db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    :param db: AsyncSession
+    :return: The contact object, or None when a contact with the email already exists
+    """
+    stmt = dialect_insert(db)(Contact).values(**body.dict(), user_id=user.id, birthday_md=birthday_key(body.birthday)) \
+        .on_conflict_do_nothing(index_elements=[Contact.email]).returning(Contact)
+    contact = (await db.execute(stmt)).scalar_one_or_none()
+    if contact is not None:
+        await db.commit()
+        await contact_cache.invalidate(user.id)
     return contact
 
 
-async def update_contact(body: ContactModel, contact_id: int, user: User, db: Session):
+async def bulk_create_contacts(bodies: list[ContactModel], user: User, db: AsyncSession) -> set[str]:
+    """
+    The bulk_create_contacts function inserts many contacts of the user with
+    INSERT ... ON CONFLICT (email) DO NOTHING RETURNING email and commits them.
+    Contacts with an email that already exists are skipped.
+
+    The rows are passed as executemany parameters: SQLAlchemy sends them as multi-row VALUES batches
+    ("insertmanyvalues") of one cached statement, which is several times faster than compiling a new
+    statement with all the values for every call.
+
+    :param bodies: list[ContactModel]: Contacts to create
+    :param user: User: Current user
+    :param db: AsyncSession
+    :return: Emails of the inserted contacts
+    """
+    if not bodies:
+        return set()
+    rows = [dict(body, user_id=user.id, birthday_md=birthday_key(body.birthday)) for body in bodies]
+    # Core insert into the table: the rows skip the per-row bookkeeping of the ORM bulk insert
+    table = Contact.__table__
+    stmt = dialect_insert(db)(table).on_conflict_do_nothing(index_elements=[table.c.email]).returning(table.c.email)
+    inserted = await db.execute(stmt, rows)
+    emails = set(inserted.scalars().all())
+    await db.commit()
+    if emails:
+        await contact_cache.invalidate(user.id)
+    return emails
+
+
+async def update_contact(body: ContactModel, contact_id: int, user: User, db: AsyncSession):
     """
-    The update_contact function updates a contact with the contact_id in the database.
+    The update_contact function updates a contact with the contact_id in the database
+    by one UPDATE ... RETURNING statement.
 
     :param body: ContactModel:  The updated data for the contact
     :param contact_id: int: the contact id
     :param user: User: Current user
-    :param db: Session: Pass a database session to the function
-    :return: The updated contact
-    """
-    contact = await get_contact_by_id(contact_id, user, db)
-    if contact:
-        contact.firstname = body.firstname
-        contact.lastname = body.lastname
-        contact.email = body.email
-        contact.phone = body.phone
-        contact.email = body.email
-        contact.birthday = body.birthday
-        contact.additionally = body.additionally
-        db.commit()
+    :param db: AsyncSession: Pass a database session to the function
+    :return: The updated contact or None when the user has no contact with this id
+    :raise IntegrityError: The new email belongs to another contact
+    """
+    stmt = update(Contact).where(Contact.id == contact_id, Contact.user_id == user.id) \
+        .values(**body.dict(), birthday_md=birthday_key(body.birthday)).returning(Contact) \
+        .execution_options(populate_existing=True)
+    try:
+        contact = (await db.execute(stmt)).scalar_one_or_none()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    if contact is not None:
+        await db.commit()
+        await contact_cache.invalidate(user.id)
     return contact
 
 
-async def remove_contact(contact_id: int, user: User, db: Session):
+async def remove_contact(contact_id: int, user: User, db: AsyncSession):
     """
-    The remove_contact function removes a contact from the database.
+    The remove_contact function removes a contact from the database by one DELETE ... RETURNING statement.
         Args:
             contact_id (int): The id of the contact to be removed.
             user (User): The user who is removing the contact. Only contacts belonging to this user can be removed.
-            db (Session): A connection to our database.
+            db (AsyncSession): A connection to our database.
 
     :param contact_id: int: Identify the contact to be removed
     :param user: User: Get the user's id
-    :param db: Session: Pass a database session to the function
+    :param db: AsyncSession: Pass a database session to the function
     :return: A contact object or None
     """
-    contact = await get_contact_by_id(contact_id, user, db)
-    if contact:
-        db.delete(contact)
-        db.commit()
+    stmt = delete(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).returning(Contact)
+    contact = (await db.execute(stmt)).scalar_one_or_none()
+    if contact is not None:
+        await db.commit()
+        await contact_cache.invalidate(user.id)
     return contact
 
 
-async def find_contacts_by_name(firstname: str | None, lastname: str | None, user: User, db: Session):
+async def get_contacts_by_ids(ids: list[int], user: User, db: AsyncSession):
+    """
+    The get_contacts_by_ids function returns the contacts of the user with the given ids in one query.
+    Ids of missing contacts or contacts of other users are left out.
+
+    :param ids: list[int]: Ids of the contacts
+    :param user: User: Current user
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of contacts in no particular order
+    """
+    stmt = select(Contact).filter(Contact.user_id == user.id, Contact.id.in_(ids))
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
+
+
+async def update_contacts(changes: dict[int, dict], user: User, db: AsyncSession) -> tuple[list, set[int]]:
+    """
+    The update_contacts function changes many contacts of the user in one transaction with a number of statements
+    that does not depend on the number of contacts: the ids of the user and the owners of the new emails are read
+    with one query each, the changes go as executemany UPDATE (one per set of changed fields) and the updated
+    contacts are read back with one more query. A contact whose new email belongs to another contact, or to a
+    contact updated earlier in the batch, is not changed. When another request takes one of the new emails after
+    they were read, the email changes of the batch are reported as conflicts and the other changes are applied.
+
+    :param changes: dict[int, dict]: New values of the fields by contact id
+    :param user: User: Current user
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The updated contacts and the ids of the contacts with a conflicting email;
+        ids in neither were not found
+    """
+    # read once: a rollback expires the attributes of a User row
+    user_id = user.id
+    table = Contact.__table__
+    owned = await db.execute(select(table.c.id).where(table.c.user_id == user_id, table.c.id.in_(changes)))
+    owned = set(owned.scalars().all())
+    emails = {values['email'] for contact_id, values in changes.items() if contact_id in owned and 'email' in values}
+    taken = {}
+    if emails:
+        rows = await db.execute(select(table.c.email, table.c.id).where(table.c.email.in_(emails)))
+        taken = dict(rows.all())
+    conflicts = set()
+    # executemany needs the same parameters in every row, the rows are grouped by the changed fields
+    groups = defaultdict(list)
+    for contact_id, values in changes.items():
+        if contact_id not in owned:
+            continue
+        if 'email' in values:
+            if taken.setdefault(values['email'], contact_id) != contact_id:
+                conflicts.add(contact_id)
+                continue
+        if not values:
+            continue
+        row = dict(values, contact_id=contact_id)
+        if 'birthday' in values:
+            row['birthday_md'] = birthday_key(values['birthday'])
+        groups[frozenset(row)].append(row)
+    stmt = update(table).where(table.c.id == bindparam('contact_id'), table.c.user_id == user_id)
+    try:
+        for rows in groups.values():
+            await db.execute(stmt, rows)
+    except IntegrityError:
+        await db.rollback()
+        conflicts |= {row['contact_id'] for fields, rows in groups.items() if 'email' in fields for row in rows}
+        groups = {fields: rows for fields, rows in groups.items() if 'email' not in fields}
+        for rows in groups.values():
+            await db.execute(stmt, rows)
+    updated = []
+    if owned - conflicts:
+        stmt = select(Contact).filter(Contact.user_id == user_id, Contact.id.in_(owned - conflicts)) \
+            .execution_options(populate_existing=True)
+        updated = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    if groups:
+        await contact_cache.invalidate(user_id)
+    return updated, conflicts
+
+
+async def remove_contacts(ids: list[int], user: User, db: AsyncSession) -> set[int]:
+    """
+    The remove_contacts function deletes the contacts of the user with the given ids by one
+    DELETE ... RETURNING id statement and commits.
+
+    :param ids: list[int]: Ids of the contacts
+    :param user: User: Current user
+    :param db: AsyncSession: Pass the database session to the function
+    :return: Ids of the removed contacts
+    """
+    table = Contact.__table__
+    stmt = delete(table).where(table.c.user_id == user.id, table.c.id.in_(ids)).returning(table.c.id)
+    removed = set((await db.execute(stmt)).scalars().all())
+    await db.commit()
+    if removed:
+        await contact_cache.invalidate(user.id)
+    return removed
+
+
+def like_pattern(term: str) -> str:
+    """
+    The like_pattern function makes the LIKE pattern "contains term", escaping LIKE wildcards typed by the user.
+
+    :param term: str: Text to look for
+    :return: Pattern for ilike(..., escape='\\')
+    """
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+async def find_contacts_by_name(firstname: str | None, lastname: str | None, user: User, db: AsyncSession):
     """
     The find_contacts_by_name function takes in a firstname or lastname, as well as the user who is making the request
-    and the database session.
+    and the database session. Only the given names are used for the search, without any of them nothing is found.
+
+    Every condition is also checked against the search document, so Postgres narrows the rows down
+    with the trigram index before comparing the names.
 
     :param firstname: str | None: Find the contact by the firstname if you know it
     :param lastname: str | None: Find the contact by lastname if you know it
     :param user: User: Current user
-    :param db: Session: Create a connection to the database
+    :param db: AsyncSession: Create a connection to the database
     :return: A list of contacts created by current user, that match the first name or last name.
     :rtype: List[Contact]
     """
-    contact = db.query(Contact).filter(
-        and_(or_(Contact.firstname.ilike(f"%{firstname}%"), Contact.lastname.ilike(f"%{lastname}%")),
-             Contact.user_id == user.id)).all()
-    # contact = db.query(Contact).filter(or_(Contact.firstname == firstname, Contact.lastname == lastname)).all()
-    return contact
+    document = contact_search_document()
+    conditions = []
+    for column, name in ((Contact.firstname, firstname), (Contact.lastname, lastname)):
+        if name:
+            pattern = like_pattern(name)
+            conditions.append(and_(document.ilike(pattern, escape='\\'), column.ilike(pattern, escape='\\')))
+    if not conditions:
+        return []
+    stmt = select(Contact).filter(and_(or_(*conditions), Contact.user_id == user.id)).order_by(Contact.id)
+    contact = await db.execute(stmt)
+    return contact.scalars().all()
+
+
+async def search_contacts(query: str, limit: int, offset: int, user: User, db: AsyncSession):
+    """
+    The search_contacts function finds contacts of the current user whose firstname, lastname, email, phone
+    or additional info contain every word of the query, best matches first.
+
+    On Postgres the words are matched with the GIN trigram index over the search document and the results are ranked
+    by word_similarity. Other databases (SQLite in tests) match with plain LIKE and rank exact name/email matches
+    first, then names starting with the first word, then the rest.
+
+    :param query: str: Words to look for
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Specify the number of records to skip before starting to return the records
+    :param user: User: Current user
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of found contacts
+    :rtype: List[Contact]
+    """
+    terms = query.split()[:MAX_SEARCH_TERMS]
+    if not terms:
+        return []
+    document = contact_search_document()
+    stmt = select(Contact).filter(Contact.user_id == user.id,
+                                  *(document.ilike(like_pattern(term), escape='\\') for term in terms))
+    if db.get_bind().dialect.name == 'postgresql':
+        stmt = stmt.order_by(func.word_similarity(' '.join(terms), document).desc(), Contact.id)
+    else:
+        first = terms[0].lower()
+        rank = case(
+            (or_(func.lower(Contact.firstname) == first, func.lower(Contact.lastname) == first,
+                 func.lower(Contact.email) == first), 0),
+            (or_(Contact.firstname.ilike(like_pattern(first)[1:], escape='\\'),
+                 Contact.lastname.ilike(like_pattern(first)[1:], escape='\\')), 1),
+            else_=2)
+        stmt = stmt.order_by(rank, Contact.id)
+    contacts = await db.execute(stmt.limit(limit).offset(offset))
+    return contacts.scalars().all()
+
+
+def birthday_sort_key(birthday_md: int, today: date) -> int:
+    """
+    The birthday_sort_key function orders birthdays by how soon they come after today:
+    birthdays still ahead this year keep their month/day key, the ones already passed move behind them.
+
+    :param birthday_md: int: Key of the birthday (see birthday_key)
+    :param today: date: Day the window starts from
+    :return: Sort key of the upcoming birthday
+    """
+    return birthday_md if birthday_md >= birthday_key(today) else birthday_md + 1300
 
 
-async def birthday_people(limit: int, offset: int, user: User, db: Session):
+async def birthday_people(limit: int, offset: int, user: User, db: AsyncSession,
+                          after: tuple[int, int] | None = None, days: int = 7, today: date | None = None):
     """
-    The birthday_people function returns a list of contacts whose birthday is within the next 7 days.
+    The birthday_people function returns a list of contacts whose birthday is within the next days (7 by default),
+    ordered by date of the upcoming birthday.
     The search for contacts will be among the contacts of a specific user
 
+    The window is one range query on the (user_id, birthday_md) index, split in two ranges when it crosses New Year.
+    Contacts born on February 29 are found in non-leap years whenever the window includes February 28 and March 1.
+
     :param limit: int: Limit the number of contacts that are returned
     :param offset: int: Specify the number of records to skip before starting to return the records
     :param user: User: Current user
-    :param db: Session: Pass the database session to the function
-    :return: A list of contacts whose birthday is within 7 days and who created the current user
-    """
-    current_date = datetime.now().date()
-    current_year = current_date.year
-    delta = 7
-    end_data = current_date + timedelta(days=delta)
-    contact = db.query(Contact).filter(Contact.user_id == user.id).limit(limit).offset(offset).all()
-    # print('gggg', contact)
-    list_birthday = []
-    for c in contact:
-        # print(c.birthday)
-        if c.birthday:
-            c_birthday_this_year = c.birthday.replace(year=current_year)
-            print(c_birthday_this_year)
-            if current_date <= c_birthday_this_year <= end_data:
-                list_birthday.append(c)
+    :param db: AsyncSession: Pass the database session to the function
+    :param after: tuple[int, int] | None: Sort key and id of the last contact of the previous page,
+        if set offset is ignored
+    :param days: int: Length of the window in days, today included
+    :param today: date | None: First day of the window, the current date by default
+    :return: A list of contacts whose birthday is within the window and who created the current user
+    """
+    today = today or date.today()
+    start = birthday_key(today)
+    end = birthday_key(today + timedelta(days=days))
+    if days >= 365:
+        window = Contact.birthday_md.isnot(None)
+    elif start <= end:
+        window = Contact.birthday_md.between(start, end)
+    else:
+        window = or_(Contact.birthday_md >= start, Contact.birthday_md <= end)
+    sort_key = case((Contact.birthday_md >= start, Contact.birthday_md), else_=Contact.birthday_md + 1300)
+
+    stmt = select(Contact).filter(and_(Contact.user_id == user.id, window)).order_by(sort_key, Contact.id).limit(limit)
+    if after is not None:
+        after_key, after_id = after
+        stmt = stmt.filter(or_(sort_key > after_key, and_(sort_key == after_key, Contact.id > after_id)))
     else:
-        print('hhhh')
-    return list_birthday
+        stmt = stmt.offset(offset)
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
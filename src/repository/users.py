@@ -1,77 +1,118 @@
+from typing import Optional
+
 from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
+from src.database.db import dialect_insert
 from src.schemas import UserModel
+from src.services.user_cache import user_cache
 
 
-async def get_user_by_email(email: str, db: Session):
+async def get_user_by_email(email: str, db: AsyncSession):
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user with that email. If no such user exists, it returns None.
 
     :param email: str: Specify the type of parameter that is expected
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The user that matches the email address
     """
-    return db.query(User).filter_by(email=email).first()
+    user = await db.execute(select(User).filter_by(email=email))
+    return user.scalar_one_or_none()
 
 
-async def create_user(body: UserModel, db: Session):
+async def create_user(body: UserModel, db: AsyncSession):
     """
-    The create_user function creates a new user in the database.
+    The create_user function creates a new user in the database
+    by one INSERT ... ON CONFLICT (email) DO NOTHING RETURNING statement.
 
     :param body: UserModel: Specify the type of data that will be passed to the function
-    :param db: Session: Create a database session
-    :return: The new user object
+    :param db: AsyncSession: Create a database session
+    :return: The new user object, or None when a user with the email already exists
     """
     g = Gravatar(body.email)
-    new_user = User(**body.dict(), avatar=g.get_image())
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    stmt = dialect_insert(db)(User).values(**body.dict(), avatar=g.get_image()) \
+        .on_conflict_do_nothing(index_elements=[User.email]).returning(User)
+    new_user = (await db.execute(stmt)).scalar_one_or_none()
+    if new_user is not None:
+        await db.commit()
     return new_user
 
 
-async def update_token(user: User, refresh_token, db: Session):
+async def update_token(user: User, refresh_token, db: AsyncSession):
     """
     The update_token function updates the refresh token for a user in the database.
 
     :param user: User: Identify the user that is being updated
     :param refresh_token: Update the user's refresh token in the database
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The user object after updating the refresh_token
     """
     user.refresh_token = refresh_token
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(user.email)
+
+
+async def update_password(user: User, hashed_password: str, db: AsyncSession) -> None:
+    """
+    The update_password function replaces the stored password hash of a user.
+
+    :param user: User: Identify the user that is being updated
+    :param hashed_password: str: New password hash
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    user.password = hashed_password
+    await db.commit()
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> bool:
     """
     The confirmed_email function takes in an email and
-    sets the confirmed field of the user with that email to True.
+    sets the confirmed field of the user with that email to True by one UPDATE ... RETURNING statement.
 
     :param email: str: Specify the email address of the user to be confirmed
-    :param db: Session: Pass the database session to the function
-    :return: None
+    :param db: AsyncSession: Pass the database session to the function
+    :return: True if the user was confirmed now, False if there is no such user or it was confirmed before
+    """
+    stmt = update(User).where(User.email == email, User.confirmed.isnot(True)).values(confirmed=True) \
+        .returning(User.id)
+    if (await db.execute(stmt)).scalar_one_or_none() is None:
+        return False
+    await db.commit()
+    await user_cache.invalidate(email)
+    return True
+
+
+async def get_avatar_by_hash(avatar_hash: str, db: AsyncSession) -> Optional[str]:
+    """
+    The get_avatar_by_hash function returns the URL of an avatar already stored for the image with the given hash.
+
+    :param avatar_hash: str: Content hash of the avatar image
+    :param db: AsyncSession: Pass the database session to the function
+    :return: URL of the avatar or None if no user has this image
     """
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
-    db.commit()
+    result = await db.execute(select(User.avatar).where(User.avatar_hash == avatar_hash).limit(1))
+    return result.scalar_one_or_none()
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession, avatar_hash: Optional[str] = None) -> User:
     """
     The update_avatar function updates the avatar of a user.
 
     :param email: User email to get user object
     :param url: str: url for new avatar
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param avatar_hash: str: Content hash of the avatar image
     :return: The updated user object
     """
-    user = await get_user_by_email(email, db)
-    user.avatar = url
-    db.commit()
+    stmt = update(User).where(User.email == email).values(avatar=url, avatar_hash=avatar_hash).returning(User) \
+        .execution_options(populate_existing=True)
+    user = (await db.execute(stmt)).scalar_one_or_none()
+    await db.commit()
+    await user_cache.invalidate(email)
     return user
 
 
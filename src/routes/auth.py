@@ -1,51 +1,51 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repo_users
 from src.services.auth import auth_service
-from src.services.email import send_email
+from src.services.jobs import job_queue
 
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     """
      Create new user. If user with this email exists, raise 409 error
 
     :param body: UserModel: Get the data from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the application
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with the user. Response with 201 status code.
     """
 
     # description='No more than 5 requests per minute',  dependencies=[Depends(RateLimiter(times=5, seconds=60))
 
-    exist_user = await repo_users.get_user_by_email(body.email, db)
-    if exist_user:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repo_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+    if new_user is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
+    await job_queue.enqueue('send_email', email=new_user.email, username=new_user.username,
+                            host=str(request.base_url))
     return new_user
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
 
     It takes the email and password of the user as input,
     checks if they are valid, and returns an access token.
+    A password hashed with an outdated bcrypt cost is rehashed with the configured one.
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: Access and refresh tokens
     """
     user = await repo_users.get_user_by_email(body.username, db)
@@ -53,24 +53,28 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash:
+        # stored hash was made with another bcrypt cost, replace it while the plain password is at hand
+        await repo_users.update_password(user, new_hash, db)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
+    access_token = await auth_service.create_access_token(data=auth_service.user_claims(user))
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
     await repo_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns a new access_token,
         refresh_token, and the type of token (bearer).
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the authorization header
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A dict with the access_token, refresh_token and token type
     """
     token = credentials.credentials
@@ -80,14 +84,14 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
         await repo_users.update_token(user, None, db)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
+    access_token = await auth_service.create_access_token(data=auth_service.user_claims(user))
     refresh_token = await auth_service.create_refresh_token(data={"sub": email})
     await repo_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
 
     """
     The confirmed_email function is used to confirm a user's email address.
@@ -98,35 +102,33 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     IF user is already confirmed, return message 'Your email has already been confirmed'
 
     :param token: str: Get the token from the url
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A message that the email is already confirmed or a message that the email has been confirmed
     """
     email = auth_service.get_email_from_token(token)
+    if await repo_users.confirmed_email(email, db):
+        return {"message": "Email confirmed"}
+    # nothing was changed: the user does not exist or is confirmed already
     user = await repo_users.get_user_by_email(email, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
-    if user.confirmed:
-        return {"message": "Your email is already confirmed"}
-    await repo_users.confirmed_email(email, db)
-    return {"message": "Email confirmed"}
+    return {"message": "Your email is already confirmed"}
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send a verification email to the user
      with a link that will allow them to confirm their account.
 
     :param body: RequestEmail: Validate the request body and
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks
     :param request: Request: Get the base url of the server
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A message that the user can check their email for confirmation
     """
     user = await repo_users.get_user_by_email(body.email, db)
     if user:
         if user.confirmed:
             return {"message": "Your email is already confirmed"}
-        background_tasks.add_task(send_email, user.email, user.username, str(request.base_url))
+        await job_queue.enqueue('send_email', email=user.email, username=user.username, host=str(request.base_url))
     return {"message": "Check your email for confirmation."}
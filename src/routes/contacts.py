@@ -1,59 +1,103 @@
+from datetime import date
 from typing import List
 
-from fastapi import Path, Query, Depends, HTTPException, status, APIRouter
+from fastapi import Path, Query, Depends, HTTPException, status, APIRouter, Request, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
 
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
-from src.database.models import User, Role
+from src.database.models import Role
 from src.repository import contacts as repo_contacts
-from src.services.auth import auth_service
+from src.services.auth import auth_service, Principal
+from src.services.conditional import conditional_get
+from src.services.fast_json import contacts_json
+from src.services.pagination import encode_cursor, decode_cursor, next_cursor
+from src.conf.config import settings
 from src.services.roles import RoleAccess
-from src.schemas import ContactModel, ContactResponse
+from src.services.suggest import suggest_index
+from src.services.contacts_io import ContactImporter, detect_format, export_contacts as export_file, MEDIA_TYPES, \
+    EXTENSIONS
+from src.schemas import ContactModel, ContactResponse, ContactSuggestion, ContactFormat, ImportReport, ContactIds, \
+    ContactPatches, BatchItemResult, BatchReport
 
 router = APIRouter(prefix="/contacts", tags=['contacts'])
 
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+CURSOR_DESCRIPTION = f'Value of {NEXT_CURSOR_HEADER} header of the previous page'
+
 allowed_operation_get = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_operation_post = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_operation_update = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_operation_remove = RoleAccess([Role.admin])
 
 
+def set_next_cursor(response: Response, cursor: str | None):
+    """
+    The set_next_cursor function puts the cursor of the next page into the response headers.
+    Nothing is set for the last page.
+
+    :param response: Response: Response of the list endpoint
+    :param cursor: str | None: Cursor of the next page
+    """
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
 @router.get("/", response_model=List[ContactResponse], description='No more than 10 requests per minute',
             dependencies=[Depends(allowed_operation_get), Depends(RateLimiter(times=10, seconds=60))],
             name="=====My Contacts:=====")
-async def get_contacts(limit: int = Query(10, le=100), offset: int = 0,
-                       current_user: User = Depends(auth_service.get_current_user),
-                       db: Session = Depends(get_db)):
+async def get_contacts(request: Request, response: Response, limit: int = Query(10, le=100), offset: int = 0,
+                       cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
+                       current_user: Principal = Depends(auth_service.get_principal),
+                       db: AsyncSession = Depends(get_db)):
     """
     The get_contacts function returns a list of contacts for the current user.
-    The limit and offset parameters are used to paginate the results.
+    The limit and cursor parameters are used to paginate the results, the cursor of the next page
+    is returned in the X-Next-Cursor header. Offset is kept for compatibility and is ignored with cursor.
+    Responds 304 Not Modified, without reading the contacts, when the ETag in If-None-Match is current.
 
+    :param request: Request: Get the conditional headers
+    :param response: Response: Set the header with the cursor of the next page and the validators
     :param limit: int: Limit the number of contacts returned
     :param offset: int: Specify the offset of the first contact to return
-    :param current_user: User: Get the current user from the database
-    :param db: Session: Pass the database session to the function
+    :param cursor: str | None: Cursor of the page to return
+    :param current_user: Principal: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the function
     :return: A list of contacts
     """
-    contacts = await repo_contacts.get_contacts(limit, offset, current_user, db)
-    return contacts
+    not_modified = await conditional_get(request, response, current_user.id)
+    if not_modified is not None:
+        return not_modified
+    after_id = decode_cursor(cursor, 1)[0] if cursor else None
+    contacts = await repo_contacts.get_contacts(limit, offset, current_user, db, after_id=after_id)
+    set_next_cursor(response, next_cursor(contacts, limit, 'id'))
+    return contacts_json.render(contacts, response)
 
 
 @router.get("/{contact_id}", response_model=ContactResponse, dependencies=[Depends(allowed_operation_get)])
-async def get_contact(contact_id: int = Path(ge=1), current_user: User = Depends(auth_service.get_current_user),
-                      db: Session = Depends(get_db)):
+async def get_contact(request: Request, response: Response, contact_id: int = Path(ge=1),
+                      current_user: Principal = Depends(auth_service.get_principal),
+                      db: AsyncSession = Depends(get_db)):
     """
     The get_contact function is a GET request that returns the contact with the given ID.
     The function takes in an optional parameter of contact_id, which is an integer greater than or equal to 1.
     It also takes in two dependencies: current_user and db.
+    Responds 304 Not Modified, without reading the contact, when the ETag in If-None-Match is current.
 
+    :param request: Request: Get the conditional headers
+    :param response: Response: Set the validators
     :param contact_id: int: Specify the path parameter for the contact_id
-    :param current_user: User: Get the current user from the database
-    :param db: Session: Pass the database session to the function
+    :param current_user: Principal: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contact object, which is a pydantic model
     """
+    not_modified = await conditional_get(request, response, current_user.id)
+    if not_modified is not None:
+        return not_modified
     contact = await repo_contacts.get_contact_by_id(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
@@ -62,15 +106,15 @@ async def get_contact(contact_id: int = Path(ge=1), current_user: User = Depends
 
 @router.get("/email/{contact_email}", response_model=ContactResponse, dependencies=[Depends(allowed_operation_get)])
 async def get_contact_e(contact_email: str = Path(..., description='Enter email'),
-                        current_user: User = Depends(auth_service.get_current_user),
-                        db: Session = Depends(get_db)):
+                        current_user: Principal = Depends(auth_service.get_principal),
+                        db: AsyncSession = Depends(get_db)):
     """
     The get_contact_e function returns a contact by email.
         The function takes in an email and returns the contact with that email.
 
     :param contact_email: str: Email of the contact
-    :param current_user: User: Current user
-    :param db: Session: Access the database
+    :param current_user: Principal: Current user
+    :param db: AsyncSession: Access the database
     :return: A contact object
     """
     contact = await repo_contacts.get_contact_by_email(contact_email, current_user, db)
@@ -81,103 +125,310 @@ async def get_contact_e(contact_email: str = Path(..., description='Enter email'
 
 @router.get("/find/", response_model=List[ContactResponse], dependencies=[Depends(allowed_operation_get)],
             name="==Find  Contacts by name ====")
-async def find_contacts_by_name(first_name: str | None = Query(None, description='First Name'),
+async def find_contacts_by_name(response: Response, first_name: str | None = Query(None, description='First Name'),
                                 last_name: str | None = None,
-                                current_user: User = Depends(auth_service.get_current_user),
-                                db: Session = Depends(get_db)):
+                                current_user: Principal = Depends(auth_service.get_principal),
+                                db: AsyncSession = Depends(get_db)):
     """
     The find_contact_by_name function is used to find contacts in the database.
         It can be filtered by firstname or lastname.
         The current_user parameter is a dependency that will be injected automatically when the function runs.
 
+    :param response: Response: Response of the fast JSON path
     :param first_name: str | None: Filter contacts by firstname
     :param last_name: str | None: Filter contacts by lastname
-    :param current_user: User: Get the current user from the database
-    :param db: Session: Pass the database session to the repository layer
+    :param current_user: Principal: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository layer
     :return: A list of contacts
     """
     contacts = await repo_contacts.find_contacts_by_name(first_name, last_name, current_user, db)
-    return contacts
+    return contacts_json.render(contacts, response)
+
+
+@router.get("/search/", response_model=List[ContactResponse], dependencies=[Depends(allowed_operation_get)],
+            name="==Search Contacts ====")
+async def search_contacts(response: Response,
+                          q: str = Query(min_length=1, max_length=100, description='Words to look for'),
+                          limit: int = Query(10, le=100), offset: int = 0,
+                          current_user: Principal = Depends(auth_service.get_principal),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The search_contacts function finds contacts of the current user by any part of
+        firstname, lastname, email, phone or additional info. Best matches are returned first.
+
+    :param response: Response: Response of the fast JSON path
+    :param q: str: Words to look for
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Specify the offset of the first contact to return
+    :param current_user: Principal: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: A list of contacts
+    """
+    contacts = await repo_contacts.search_contacts(q, limit, offset, current_user, db)
+    return contacts_json.render(contacts, response)
+
+
+@router.get("/suggest/", response_model=List[ContactSuggestion], dependencies=[Depends(allowed_operation_get)],
+            name="==Suggest Contacts ====")
+async def suggest_contacts(q: str = Query(min_length=1, max_length=100, description='Beginning of a name or email'),
+                           limit: int = Query(10, ge=1, le=50),
+                           current_user: Principal = Depends(auth_service.get_principal),
+                           db: AsyncSession = Depends(get_db)):
+    """
+    The suggest_contacts function returns contacts whose firstname, lastname, full name or email
+        starts with the typed text. It is answered from the in-memory index of the user's contacts,
+        the database is read only when the index is not loaded yet.
+
+    :param q: str: Beginning of a name or email
+    :param limit: int: Maximal number of suggestions
+    :param current_user: Principal: Get the current user from the database
+    :param db: AsyncSession: Load the index of the user
+    :return: A list of suggestions
+    """
+    index = await suggest_index.get(current_user.id, lambda: repo_contacts.get_contact_names(current_user, db))
+    return index.lookup(q, limit)
 
 
 @router.get("/birthday/", response_model=List[ContactResponse], dependencies=[Depends(allowed_operation_get)],
-            name="Contacts with birthday in the next 7 days")
-async def birthday_people(limit: int = Query(10, le=100), offset: int = 0,
-                          current_user: User = Depends(auth_service.get_current_user),
-                          db: Session = Depends(get_db)):
+            name="Contacts with birthday in the next days")
+async def birthday_people(response: Response, limit: int = Query(10, le=100), offset: int = 0,
+                          cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
+                          days: int = Query(settings.birthday_window_days, ge=0, le=366,
+                                            description='Length of the window in days'),
+                          current_user: Principal = Depends(auth_service.get_principal),
+                          db: AsyncSession = Depends(get_db)):
     """
-    The birthday_people function returns a list of contacts with birthdays in the next 7 days.
-        The function takes an optional user parameter, which is used to filter the results by owner.
-        If no user is provided, all contacts are returned.
+    The birthday_people function returns a list of contacts with birthdays in the next days (7 by default),
+        ordered by date of the upcoming birthday.
+        The cursor of the next page is returned in the X-Next-Cursor header.
 
-    :param current_user: User: Get the current user from the database
-    :param db: Session: Get the database session
-    :return: A list of contacts that have birthdays in the next 7 days
+    :param response: Response: Set the header with the cursor of the next page
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Specify the offset of the first contact to return
+    :param cursor: str | None: Cursor of the page to return
+    :param days: int: Length of the window in days
+    :param current_user: Principal: Get the current user from the database
+    :param db: AsyncSession: Get the database session
+    :return: A list of contacts that have birthdays in the next days
     """
-    contacts = await repo_contacts.birthday_people(limit, offset, current_user, db)
-    return contacts
+    today = date.today()
+    after = decode_cursor(cursor, 2) if cursor else None
+    contacts = await repo_contacts.birthday_people(limit, offset, current_user, db, after=after, days=days,
+                                                   today=today)
+    if contacts and len(contacts) == limit:
+        last = contacts[-1]
+        set_next_cursor(response, encode_cursor(repo_contacts.birthday_sort_key(last.birthday_md, today), last.id))
+    return contacts_json.render(contacts, response)
 
 
 @router.post("/", response_model=ContactResponse, dependencies=[Depends(allowed_operation_post)],
              status_code=status.HTTP_201_CREATED)
-async def create_contact(body: ContactModel, current_user: User = Depends(auth_service.get_current_user),
-                         db: Session = Depends(get_db)):
+async def create_contact(body: ContactModel, current_user: Principal = Depends(auth_service.get_principal),
+                         db: AsyncSession = Depends(get_db)):
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactsModel: Get the data from the request body
-    :param current_user: User: Get the user who is currently authorised
-    :param db: Session: Get the database session
+    :param current_user: Principal: Get the user who is currently authorised
+    :param db: AsyncSession: Get the database session
     :return: A ContactModel object, which is the same as the one in models
     """
-    contact = await repo_contacts.get_contact_by_email(body.email, current_user, db)
-    if contact:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email is exist')
-
     contact = await repo_contacts.create_contact(body, current_user, db)
+    if contact is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email is exist')
+    suggest_index.saved(current_user.id, contact)
     return contact
 
 
+@router.post("/import/", response_model=ImportReport, dependencies=[Depends(allowed_operation_post)])
+async def import_contacts(file: UploadFile = File(description='Address book in CSV, NDJSON (JSONL) or vCard format'),
+                          file_format: ContactFormat | None = Query(None, alias='format',
+                                                                    description='Detected from the file by default'),
+                          current_user: Principal = Depends(auth_service.get_principal),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The import_contacts function creates contacts from an uploaded address book.
+        The file is read and validated in chunks in a worker thread while the previous chunk
+        is saved with a batched multi-row INSERT. Rows with invalid data and emails that already exist
+        are skipped and listed in the report.
+
+    :param file: UploadFile: Address book file, CSV must have a header with ContactModel field names
+    :param file_format: ContactFormat | None: Format of the file
+    :param current_user: Principal: Get the user who is currently authorised
+    :param db: AsyncSession: Get the database session
+    :return: Report of the import
+    """
+    file_format = file_format or detect_format(file.filename, file.content_type)
+    if file_format is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Unknown file format")
+    importer = ContactImporter(file.file, file_format, settings.import_chunk_size, settings.import_max_reported_rows)
+    try:
+        report = await importer.run(lambda contacts: repo_contacts.bulk_create_contacts(contacts, current_user, db))
+    finally:
+        suggest_index.discard(current_user.id)
+    return report
+
+
+@router.get("/export/", response_class=StreamingResponse, dependencies=[Depends(allowed_operation_get)],
+            responses={200: {"content": {media_type: {} for media_type in MEDIA_TYPES.values()}}})
+async def export_contacts(request: Request, file_format: ContactFormat = Query(ContactFormat.ndjson, alias='format'),
+                          since_id: int | None = Query(None, ge=0, description='Export contacts after this id only'),
+                          current_user: Principal = Depends(auth_service.get_principal),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The export_contacts function streams the whole address book of the current user as NDJSON, CSV or vCard.
+        Contacts are read through a server-side cursor in id order, so memory does not grow with the number
+        of contacts. An interrupted export is resumed with since_id set to the last exported id.
+        The file is gzip-compressed when the client accepts gzip encoding.
+
+    :param request: Request: Get the accepted encodings
+    :param file_format: ContactFormat: Format of the file
+    :param since_id: int | None: Export contacts with greater ids only
+    :param current_user: Principal: Get the current user from the database
+    :param db: AsyncSession: Pass the database session to the repository
+    :return: Streaming response with the file
+    """
+    compress = 'gzip' in request.headers.get('accept-encoding', '').lower()
+    headers = {'Content-Disposition': f'attachment; filename="contacts.{EXTENSIONS[file_format]}"',
+               'Vary': 'Accept-Encoding'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    batches = repo_contacts.stream_contacts(current_user, db, since_id=since_id)
+    return StreamingResponse(export_file(batches, file_format, compress), media_type=MEDIA_TYPES[file_format],
+                             headers=headers)
+
+
 @router.put("/{contact_id}", response_model=ContactResponse, dependencies=[Depends(allowed_operation_update)])
 async def update_contact(body: ContactModel, contact_id: int = Path(ge=1),
-                         current_user: User = Depends(auth_service.get_current_user),
-                         db: Session = Depends(get_db)):
+                         current_user: Principal = Depends(auth_service.get_principal),
+                         db: AsyncSession = Depends(get_db)):
     """
     The update_contact function updates a contact in the database.
         The function takes three arguments:
             - body: A ContactsModel object containing the new data for the contact.
             - contact_id: An integer representing the ID of an existing Contact to be updated.
-            - current_user (optional): A User object representing a user who is logged in and making this request.  This argument is optional because it depends on auth_service, which may or may not return a value depending on whether authentication succeeds or fails.
+            - current_user (optional): A Principal object representing a user who is logged in and making this request.  This argument is optional because it depends on auth_service, which may or may not return a value depending on whether authentication succeeds or fails.
 
     :param body: ContactsModel: Pass the contact data to be updated
     :param contact_id: int: Specify the contact to be deleted
-    :param current_user: User: Get the user id of the current authorised user
-    :param db: Session: Pass the database session to the repository layer
+    :param current_user: Principal: Get the user id of the current authorised user
+    :param db: AsyncSession: Pass the database session to the repository layer
     :return: A contact object
     """
-    contact = await repo_contacts.update_contact(body, contact_id, current_user, db)
+    try:
+        contact = await repo_contacts.update_contact(body, contact_id, current_user, db)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email is exist')
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    suggest_index.saved(current_user.id, contact)
     return contact
 
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT,
                dependencies=[Depends(allowed_operation_remove)],
                description='Only for admin user')
-async def remove_contact(contact_id: int = Path(ge=1), current_user: User = Depends(auth_service.get_current_user),
-                         db: Session = Depends(get_db)):
+async def remove_contact(contact_id: int = Path(ge=1), current_user: Principal = Depends(auth_service.get_principal),
+                         db: AsyncSession = Depends(get_db)):
     """
     The remove_contact function removes a contact from the database.
         Args:
             contact_id (int): The id of the contact to be removed.
-            current_user (User): The user who is making this request.
-            db (Session): A session object
+            current_user (Principal): The user who is making this request.
+            db (AsyncSession): A session object
     :param contact_id: int: Specify the contact to be removed
-    :param current_user: User: Get the current user from the auth_service
-    :param db: Session: Pass the database session to the repository
+    :param current_user: Principal: Get the current user from the auth_service
+    :param db: AsyncSession: Pass the database session to the repository
     :return: A contact object
     """
     contact = await repo_contacts.remove_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    suggest_index.removed(current_user.id, contact.id)
     return contact
+
+
+@router.post("/batch/get", response_model=BatchReport, dependencies=[Depends(allowed_operation_get)],
+             name="Get many contacts")
+async def get_contacts_batch(body: ContactIds, current_user: Principal = Depends(auth_service.get_principal),
+                             db: AsyncSession = Depends(get_db)):
+    """
+    The get_contacts_batch function returns the contacts with the given ids read by one query.
+    Every id gets its own result in the order of the request: 200 with the contact or 404.
+
+    :param body: ContactIds: Ids of the contacts
+    :param current_user: Principal: Get the current user from the auth_service
+    :param db: AsyncSession: Pass the database session to the repository
+    :return: Result of every id
+    """
+    contacts = await repo_contacts.get_contacts_by_ids(body.ids, current_user, db)
+    contacts = {contact.id: contact for contact in contacts}
+    items = []
+    for contact_id in body.ids:
+        if contact_id in contacts:
+            items.append(BatchItemResult(id=contact_id, status=status.HTTP_200_OK, contact=contacts[contact_id]))
+        else:
+            items.append(BatchItemResult(id=contact_id, status=status.HTTP_404_NOT_FOUND, detail="Not Found"))
+    return BatchReport(items=items)
+
+
+@router.post("/batch/update", response_model=BatchReport, dependencies=[Depends(allowed_operation_update)],
+             name="Update many contacts")
+async def update_contacts_batch(body: ContactPatches, current_user: Principal = Depends(auth_service.get_principal),
+                                db: AsyncSession = Depends(get_db)):
+    """
+    The update_contacts_batch function changes the given fields of many contacts in one transaction.
+    Every item gets its own result in the order of the request: 200 with the updated contact, 404, or 409
+    when the new email belongs to another contact or the id was already given in the batch.
+
+    :param body: ContactPatches: Ids of the contacts with the fields to change
+    :param current_user: Principal: Get the current user from the auth_service
+    :param db: AsyncSession: Pass the database session to the repository
+    :return: Result of every item
+    """
+    changes = {}
+    for patch in body.items:
+        changes.setdefault(patch.id, patch.changes())
+    updated, conflicts = await repo_contacts.update_contacts(changes, current_user, db)
+    updated = {contact.id: contact for contact in updated}
+    for contact in updated.values():
+        suggest_index.saved(current_user.id, contact)
+    items, seen = [], set()
+    for patch in body.items:
+        if patch.id in seen:
+            items.append(BatchItemResult(id=patch.id, status=status.HTTP_409_CONFLICT, detail="Duplicate id"))
+        elif patch.id in updated:
+            items.append(BatchItemResult(id=patch.id, status=status.HTTP_200_OK, contact=updated[patch.id]))
+        elif patch.id in conflicts:
+            items.append(BatchItemResult(id=patch.id, status=status.HTTP_409_CONFLICT,
+                                         detail="Contact with such email already exists"))
+        else:
+            items.append(BatchItemResult(id=patch.id, status=status.HTTP_404_NOT_FOUND, detail="Not Found"))
+        seen.add(patch.id)
+    return BatchReport(items=items)
+
+
+@router.post("/batch/delete", response_model=BatchReport, dependencies=[Depends(allowed_operation_remove)],
+             name="Delete many contacts")
+async def remove_contacts_batch(body: ContactIds, current_user: Principal = Depends(auth_service.get_principal),
+                                db: AsyncSession = Depends(get_db)):
+    """
+    The remove_contacts_batch function deletes the contacts with the given ids by one statement.
+    Every id gets its own result in the order of the request: 204 when it was deleted, otherwise 404.
+
+    :param body: ContactIds: Ids of the contacts
+    :param current_user: Principal: Get the current user from the auth_service
+    :param db: AsyncSession: Pass the database session to the repository
+    :return: Result of every id
+    """
+    removed = await repo_contacts.remove_contacts(body.ids, current_user, db)
+    for contact_id in removed:
+        suggest_index.removed(current_user.id, contact_id)
+    items, seen = [], set()
+    for contact_id in body.ids:
+        if contact_id in removed and contact_id not in seen:
+            items.append(BatchItemResult(id=contact_id, status=status.HTTP_204_NO_CONTENT))
+        else:
+            items.append(BatchItemResult(id=contact_id, status=status.HTTP_404_NOT_FOUND, detail="Not Found"))
+        seen.add(contact_id)
+    return BatchReport(items=items)
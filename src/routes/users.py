@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 from src.database.db import get_db
@@ -9,6 +9,7 @@ from src.services.auth import auth_service
 from src.conf.config import settings
 from src.schemas import UserResponse
 from src.services.cloud_image import CloudImage
+from src.services.avatars import avatar_pipeline
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -26,21 +27,25 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 @router.patch('/avatar', response_model=UserResponse)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
 
     """
     The update_avatar_user function updates the avatar of a user.
-    It takes in an UploadFile object, which contains the file that will be uploaded to Cloudinary.
+    It takes in an UploadFile object with the image, which is cropped to the avatar size and uploaded to Cloudinary.
+    An image that is already stored (found by its content hash) is reused without uploading it again.
     :param file: Get the file from the request.
     :type file: UploadFile
     :param current_user: Get the current user from the database.
     :type current_user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The updated user
     """
-    public_id = CloudImage.generate_name_file_avatar(current_user.email)
-    r = CloudImage.upload(file.file, public_id)
-    src_url = CloudImage.get_url_for_avatar(public_id, r)
-    user = await repository_users.update_avatar(current_user.email, src_url, db)
+    avatar_hash = await avatar_pipeline.digest(file)
+    if avatar_hash == current_user.avatar_hash:
+        return current_user
+    src_url = await repository_users.get_avatar_by_hash(avatar_hash, db)
+    if src_url is None:
+        src_url = await avatar_pipeline.store(file, CloudImage.generate_name_file_avatar(avatar_hash))
+    user = await repository_users.update_avatar(current_user.email, src_url, db, avatar_hash)
     return user
@@ -1,6 +1,7 @@
+import enum
 from datetime import date, datetime
-from typing import Optional
-from pydantic import BaseModel, Field, EmailStr
+from typing import List, Optional
+from pydantic import BaseModel, Field, EmailStr, validator
 
 from src.database.models import Role
 
@@ -30,6 +31,75 @@ class ContactResponse(BaseModel):
 # Якщо треба валідувати дані не з БД, то цей параметр не встановлюється
 
 
+class ContactSuggestion(BaseModel):
+    id: int
+    firstname: str
+    lastname: str
+    email: str
+
+
+class ContactFormat(str, enum.Enum):
+    csv: str = 'csv'
+    ndjson: str = 'ndjson'
+    vcard: str = 'vcard'
+
+
+class ImportRowIssue(BaseModel):
+    row: int
+    email: Optional[str] = None
+    detail: str
+
+
+class ImportReport(BaseModel):
+    imported: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    duplicate_rows: List[ImportRowIssue] = []
+    errors: List[ImportRowIssue] = []
+
+
+BATCH_MAX_ITEMS = 500
+
+
+class ContactIds(BaseModel):
+    ids: List[int] = Field(min_items=1, max_items=BATCH_MAX_ITEMS)
+
+
+class ContactPatch(BaseModel):
+    id: int = Field(ge=1)
+    firstname: Optional[str] = Field(None, min_length=2, max_length=50)
+    lastname: Optional[str] = Field(None, min_length=2, max_length=50)
+    email: Optional[EmailStr] = None
+    phone: Optional[str] = Field(None, min_length=4, max_length=20)
+    birthday: Optional[date] = None
+    additionally: Optional[str] = None
+
+    @validator('firstname', 'lastname', 'email', 'phone', 'additionally', pre=True)
+    def not_null(cls, value):
+        # fields left out are not changed, only the birthday can be cleared with null
+        if value is None:
+            raise ValueError('may be omitted but not null')
+        return value
+
+    def changes(self) -> dict:
+        return self.dict(exclude_unset=True, exclude={'id'})
+
+
+class ContactPatches(BaseModel):
+    items: List[ContactPatch] = Field(min_items=1, max_items=BATCH_MAX_ITEMS)
+
+
+class BatchItemResult(BaseModel):
+    id: int
+    status: int
+    contact: Optional[ContactResponse] = None
+    detail: Optional[str] = None
+
+
+class BatchReport(BaseModel):
+    items: List[BatchItemResult] = []
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=4, max_length=20)
     email: EmailStr
@@ -1,33 +1,67 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-import pickle
 import json
+import zlib
 from typing import Optional
 
-import redis
-
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer  # Bearer token
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 
 from src.database.db import get_db
+from src.database.models import User, Role
 from src.repository import users as repo_users
 from src.conf.config import settings
+from src.services.passwords import password_hasher
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
+
+
+def user_version(user: User) -> int:
+    """
+    The user_version function stamps the fields an access token vouches for. A token whose "ver" claim differs
+    from the stamp of the current user row was issued before the role or the confirmation changed.
+
+    :param user: User: User row (or the cached user)
+    :return: int: CRC32 of id, role and confirmed flag
+    """
+    role = user.roles.value if user.roles else ""
+    return zlib.crc32(f"{user.id}:{role}:{bool(user.confirmed)}".encode())
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """
+    Authenticated caller as described by the signed claims of the access token, for routes that need
+    only the user id and role (see Auth.get_principal). The attribute names follow User, so a Principal can be passed to
+    the repository functions instead of a User row.
+    """
+    id: int
+    email: str
+    roles: Role
+    ver: int
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, email=user.email, roles=user.roles, ver=user_version(user))
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    hasher = password_hasher
+    token_cache = token_cache
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password, hashed_password):
+        return await self.hasher.verify(plain_password, hashed_password)
+
+    async def verify_and_update_password(self, plain_password, hashed_password):
+        return await self.hasher.verify_and_update(plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    async def get_password_hash(self, password: str):
+        return await self.hasher.hash(password)
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         to_encode = data.copy()
@@ -49,39 +83,104 @@ class Auth:
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-        credentials_exception = HTTPException(
+    def user_claims(self, user: User) -> dict:
+        """
+        The user_claims function returns the claims describing the user in an access token:
+        email ("sub"), id ("uid"), role ("role") and the version stamp of the user row ("ver").
+        A user without a role gets an empty "role" claim, get_principal then loads the user.
+
+        :param user: User: Authenticated user
+        :return: dict: Data for create_access_token
+        """
+        role = user.roles.value if user.roles else ""
+        return {"sub": user.email, "uid": user.id, "role": role, "ver": user_version(user)}
+
+    def credentials_exception(self):
+        return HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    def decode_access_token(self, token: str) -> dict:
+        """
+        The decode_access_token function verifies the signature and the scope of an access token.
+
+        :param token: str: Encoded JWT
+        :return: dict: Claims of the token
+        """
         try:
             # Decode JWT
             payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload.get("scope") == "access_token":
-                email = payload.get("sub")
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
         except JWTError as e:
-            raise credentials_exception
-
-        # user = await repo_users.get_user_by_email(email, db)
-        user = self.r.get(f"user:{email}")
+            raise self.credentials_exception()
+        if payload.get("scope") != "access_token" or payload.get("sub") is None:
+            raise self.credentials_exception()
+        return payload
+
+    async def verify_access_token(self, token: str, db: AsyncSession) -> tuple[dict, Optional[User]]:
+        """
+        The verify_access_token function returns the claims of a valid access token. A token seen for the first
+        time, or for the first time since its user changed, is decoded and its "ver" is checked against the user;
+        until the token expires or the user changes again it is then served from the token cache.
+
+        :param token: str: Encoded JWT
+        :param db: AsyncSession: Get a database session
+        :return: tuple: Claims of the token and the user, if it had to be loaded
+        """
+        payload = self.token_cache.get(token)
+        if payload is not None:
+            return payload, None
+        payload = self.decode_access_token(token)
+        # read before the check, so a change of the user during the check makes the entry stale
+        generation = self.token_cache.subject_generation(payload["sub"])
+        user = await self.load_user(payload, db)
+        self.token_cache.put(token, payload, generation)
+        return payload, user
+
+    async def load_user(self, payload: dict, db: AsyncSession) -> User:
+        email = payload["sub"]
+        user = await user_cache.get_or_load(email, lambda: repo_users.get_user_by_email(email, db))
         if user is None:
-            user = await repo_users.get_user_by_email(email, db)
-            if user is None:
-                raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
-        if user is None:
-            raise credentials_exception
+            raise self.credentials_exception()
+        # the role or the confirmation changed after the token was issued
+        if "ver" in payload and payload["ver"] != user_version(user):
+            raise self.credentials_exception()
         return user
 
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+        """
+        The get_current_user function is a dependency returning the full (cached) user of the access token.
+
+        :param token: str: Access token from the Authorization header
+        :param db: AsyncSession: Get a database session
+        :return: User
+        """
+        payload, user = await self.verify_access_token(token, db)
+        return user or await self.load_user(payload, db)
+
+    async def get_principal(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+        """
+        The get_principal function is a dependency returning the caller described by the token claims.
+        A cached token with the role Role.user grants no extra rights, so it is served from the claims alone
+        (verify_access_token checks its "ver" again after every change of the user); for any other role the "ver"
+        claim is checked against the current user row (through user_cache, usually without a query) on every
+        request. Tokens issued before the claims were added load the user as well.
+
+        :param token: str: Access token from the Authorization header
+        :param db: AsyncSession: Get a database session (used on a user cache miss)
+        :return: Principal
+        """
+        payload, user = await self.verify_access_token(token, db)
+        try:
+            principal = Principal(id=payload["uid"], email=payload["sub"], roles=Role(payload["role"]),
+                                  ver=payload["ver"])
+        except (KeyError, ValueError):
+            return Principal.from_user(user or await self.load_user(payload, db))
+        if principal.roles != Role.user and user is None:
+            await self.load_user(payload, db)
+        return principal
+
     async def check_refresh_token(self, refresh_token: str):
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
@@ -0,0 +1,128 @@
+"""
+Avatar pipeline: the uploaded image is checked against a size cap, decoded and cropped to the avatar size in a thread
+pool, re-encoded as a small JPEG and only then uploaded, in another thread, to the image host. The event loop never
+decodes, resizes or uploads, and a few kilobytes go over the wire instead of the original photo.
+
+Avatars are content addressed: the sha256 of the uploaded file (see digest) names the stored image, so an image
+that was uploaded before, by anyone, is neither resized nor uploaded again.
+"""
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.conf.config import settings
+from src.services.cloud_image import CloudImage
+
+
+class AvatarPipeline:
+    """
+    Resizes avatars in a bounded thread pool (Pillow releases the GIL while it decodes and resamples) and uploads
+    them with ``uploader``, an object with the interface of CloudImage.
+    """
+
+    def __init__(self, uploader=CloudImage, size: int = 250, max_bytes: int = 10 * 2 ** 20,
+                 max_pixels: int = 50_000_000, quality: int = 85, workers: Optional[int] = None):
+        self.uploader = uploader
+        self.size = size
+        self.max_bytes = max_bytes
+        # limit of the whole multipart request (see BodySizeLimitMiddleware): the file, its boundaries and headers
+        self.max_body_bytes = max_bytes + 16 * 1024
+        self.max_pixels = max_pixels
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix='avatar')
+
+    def check_size(self, upload: UploadFile) -> None:
+        """
+        The check_size function rejects uploads larger than max_bytes with 413. Starlette has already spooled
+        the upload to a temporary file (kept in memory up to 1 MB), so its size is known without reading it.
+        Much larger requests are stopped earlier, while they are received, by BodySizeLimitMiddleware.
+
+        :param upload: UploadFile: Uploaded image
+        :return: None
+        """
+        size = upload.size
+        if size is None:
+            upload.file.seek(0, os.SEEK_END)
+            size = upload.file.tell()
+        upload.file.seek(0)
+        if size > self.max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Avatar must not exceed {self.max_bytes} bytes")
+
+    def hash_file(self, file: BinaryIO) -> str:
+        # the avatar settings are part of the hash: after they change, the same upload makes a new avatar
+        digest = hashlib.sha256(f'{self.size}:{self.quality}:'.encode())
+        file.seek(0)
+        while chunk := file.read(2 ** 16):
+            digest.update(chunk)
+        file.seek(0)
+        return digest.hexdigest()
+
+    async def digest(self, upload: UploadFile) -> str:
+        """
+        The digest function checks the size of the upload and returns its content hash, computed in the pool.
+
+        :param upload: UploadFile: Uploaded image
+        :return: str: Hex sha256 of the image and the avatar settings
+        """
+        self.check_size(upload)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.hash_file, upload.file)
+
+    def resize(self, file: BinaryIO) -> bytes:
+        """
+        The resize function crops the image to a size x size square (like Cloudinary's crop='fill') and encodes
+        it as JPEG. JPEG images are decoded straight at a reduced scale, which is several times faster than
+        decoding the full image. It runs in the pool.
+
+        :param file: BinaryIO: Uploaded image
+        :return: bytes: JPEG of the avatar
+        """
+        try:
+            with Image.open(file) as image:
+                if image.width * image.height > self.max_pixels:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                        detail="Avatar has too many pixels")
+                image.draft('RGB', (self.size, self.size))
+                image = ImageOps.exif_transpose(image)
+                transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+                image = image.convert('RGBA' if transparent else 'RGB')
+                avatar = ImageOps.fit(image, (self.size, self.size), Image.Resampling.LANCZOS)
+                if transparent:
+                    # JPEG has no alpha channel, transparent pixels become white
+                    background = Image.new('RGB', avatar.size, 'white')
+                    background.paste(avatar, mask=avatar.getchannel('A'))
+                    avatar = background
+        except Image.DecompressionBombError:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail="Avatar has too many pixels")
+        except (UnidentifiedImageError, OSError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File is not a valid image")
+        output = io.BytesIO()
+        avatar.save(output, 'JPEG', quality=self.quality, optimize=True)
+        return output.getvalue()
+
+    async def store(self, upload: UploadFile, public_id: str) -> str:
+        """
+        The store function resizes the uploaded image and uploads the result. The public_id is derived from
+        the content hash, so an image already stored under it is kept rather than overwritten.
+
+        :param upload: UploadFile: Uploaded image
+        :param public_id: str: Id of the image at the image host
+        :return: str: URL of the avatar (the image already has the avatar size, no transformation is needed)
+        """
+        self.check_size(upload)
+        avatar = await asyncio.get_running_loop().run_in_executor(self.executor, self.resize, upload.file)
+        result = await run_in_threadpool(self.uploader.upload, io.BytesIO(avatar), public_id, overwrite=False)
+        return result['secure_url']
+
+
+avatar_pipeline = AvatarPipeline(size=settings.avatar_size, max_bytes=settings.avatar_max_bytes,
+                                 max_pixels=settings.avatar_max_pixels, quality=settings.avatar_quality,
+                                 workers=settings.avatar_workers)
@@ -0,0 +1,54 @@
+"""
+Request body size limits of upload routes.
+
+FastAPI parses a multipart body (spooling the files to disk) before the route or its dependencies run, so a check
+in the route sees an oversized upload only after all of it was received. This middleware rejects the request with
+413 before the route is called when Content-Length is over the limit, and while the body is read otherwise
+(chunked requests, a wrong Content-Length): the parsing stops at the first chunk past the limit.
+"""
+from typing import Dict
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+
+
+def too_large(limit: int) -> str:
+    return f"Request body must not exceed {limit} bytes"
+
+
+class BodySizeLimitMiddleware:
+    """
+    Pure ASGI middleware limiting the request body of the paths in limits (path -> bytes).
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope['path']) if scope['type'] == 'http' else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope['headers']:
+            if name == b'content-length' and value.isdigit() and int(value) > limit:
+                response = JSONResponse({'detail': too_large(limit)},
+                                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    # raised inside the body parser, FastAPI passes HTTPException through to the exception handler
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                        detail=too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
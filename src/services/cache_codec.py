@@ -0,0 +1,76 @@
+"""
+Versioned JSON encoding of the rows kept in the Redis caches (src.services.user_cache, src.services.contact_cache).
+
+A cached value is a JSON array starting with the version of its codec, followed by the items of the cache;
+a row is stored as the list of the values of the cached fields, in their order, which keeps the entries small.
+"""
+import json
+from typing import Callable, Dict, Optional, Sequence, Type
+
+
+class RecordCodec:
+    """
+    Encodes rows of model as lists of the values of fields and wraps them in a versioned JSON envelope.
+
+    Bump version when fields or the encoding changes: values written by another version are treated as a miss.
+    encoders and decoders convert the values of the named fields that are not None to and from JSON.
+    """
+
+    def __init__(self, model: Type, version: int, fields: Sequence[str],
+                 encoders: Optional[Dict[str, Callable]] = None, decoders: Optional[Dict[str, Callable]] = None):
+        self.model = model
+        self.version = version
+        self.fields = tuple(fields)
+        self.encoders = [(self.fields.index(name), encode) for name, encode in (encoders or {}).items()]
+        self.decoders = decoders or {}
+
+    def row(self, obj) -> list:
+        """
+        The row function returns the cached fields of obj as a list of JSON values.
+
+        :param obj: Row to cache
+        :return: list: Values of the fields
+        """
+        values = [getattr(obj, field) for field in self.fields]
+        for index, encode in self.encoders:
+            if values[index] is not None:
+                values[index] = encode(values[index])
+        return values
+
+    def build(self, values: list):
+        """
+        The build function rebuilds a detached row from the values returned by row.
+
+        :param values: list: Values of the fields
+        :return: Instance of model
+        :raise ValueError: The number of values does not match the fields
+        """
+        if len(values) != len(self.fields):
+            raise ValueError(f'Expected {len(self.fields)} values, got {len(values)}')
+        fields = dict(zip(self.fields, values))
+        for name, decode in self.decoders.items():
+            if fields[name] is not None:
+                fields[name] = decode(fields[name])
+        return self.model(**fields)
+
+    def dumps(self, *items) -> str:
+        """
+        The dumps function encodes the items after the version of the codec.
+
+        :param items: JSON values
+        :return: JSON string
+        """
+        return json.dumps([self.version, *items], separators=(',', ':'), ensure_ascii=False)
+
+    def loads(self, payload) -> list:
+        """
+        The loads function decodes a value written by dumps.
+
+        :param payload: str | bytes: Cached value
+        :return: list: The items passed to dumps
+        :raise ValueError: The value was written by another version
+        """
+        version, *items = json.loads(payload)
+        if version != self.version:
+            raise ValueError(f'Cache version {version}')
+        return items
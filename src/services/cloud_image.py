@@ -1,5 +1,3 @@
-import hashlib
-
 import cloudinary
 import cloudinary.uploader
 
@@ -15,21 +13,13 @@ class CloudImage:
     )
 
     @staticmethod
-    def generate_name_file_avatar(email: str):
-        avatar_name = hashlib.sha256(email.encode('utf-8')).hexdigest()[:12]
-        folder_avatar = 'QuotesApp/' + avatar_name
-        print(folder_avatar)
+    def generate_name_file_avatar(digest: str):
+        # avatars are content addressed: the same image always gets the same public_id
+        folder_avatar = 'QuotesApp/avatars/' + digest
         return folder_avatar
 
 
     @staticmethod
-    def upload(file, public_id: str):
-        r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True)
+    def upload(file, public_id: str, overwrite: bool = True):
+        r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=overwrite)
         return r
-
-
-    @staticmethod
-    def get_url_for_avatar(public_id, r):
-        src_url = cloudinary.CloudinaryImage(public_id) \
-            .build_url(width=250, height=250, crop='fill', version=r.get('version'))
-        return src_url
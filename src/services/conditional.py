@@ -0,0 +1,159 @@
+"""
+Conditional GET for the contacts of a user.
+
+Every user has a collection version in Redis, replaced after every change of their contacts (``bumped`` is called by
+the repository after the commit, through contact_cache.invalidate). The ETag of every contacts resource of the user
+is derived from it, so ``If-None-Match`` (or ``If-Modified-Since``) is answered with 304 from one Redis GET, without
+touching the database and without serializing anything. The version is read before the contacts, so a response never
+carries a version older than its data. Without Redis the validators are not sent and every request gets the full
+response.
+"""
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+from redis.exceptions import RedisError
+
+from src.database.redis_db import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class Version:
+    tag: str
+    modified_ms: int
+
+    @classmethod
+    def parse(cls, value: str) -> 'Version':
+        return cls(value, int(value.split('.', 1)[0]))
+
+    @classmethod
+    def new(cls) -> 'Version':
+        # the random part keeps versions unique even when the key was evicted and is created again
+        return cls.parse(f'{time.time_ns() // 1_000_000}.{uuid.uuid4().hex[:12]}')
+
+    def last_modified(self) -> Optional[int]:
+        """
+        The last_modified function returns the Last-Modified time in whole seconds: the second after the change,
+        so every later change is at or after it. It is None while that second has not begun, since another change
+        could still happen within it.
+
+        :return: Unix time or None
+        """
+        seconds = self.modified_ms // 1000 + 1
+        return seconds if time.time() >= seconds else None
+
+
+class CollectionVersions:
+    """
+    Versions of the contact collections of the users in Redis. A missing (expired or evicted) version is
+    replaced by a new one, which is just a cache miss for the clients.
+    """
+
+    def __init__(self, prefix: str = 'contacts:version', ttl: int = 30 * 24 * 3600):
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def key(self, user_id: int) -> str:
+        return f'{self.prefix}:{user_id}'
+
+    async def get(self, user_id: int) -> Optional[Version]:
+        """
+        The get function returns the current version of the user's contacts, creating it when there is none.
+
+        :param user_id: int: Owner of the contacts
+        :return: Version or None when Redis is not available
+        """
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.set(self.key(user_id), Version.new().tag, nx=True, ex=self.ttl)
+                pipe.get(self.key(user_id))
+                _, value = await pipe.execute()
+        except RedisError as err:
+            logger.warning('Contacts version of user %s is not available: %s', user_id, err)
+            return None
+        return Version.parse(value.decode() if isinstance(value, bytes) else value)
+
+    async def bumped(self, user_id: int) -> None:
+        """
+        The bumped function gives the user's contacts a new version; call it after the change is committed.
+        When Redis fails the error is logged, and clients may be answered 304 for the old data until the next
+        change or until the version expires.
+
+        :param user_id: int: Owner of the contacts
+        :return: None
+        """
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            await client.set(self.key(user_id), Version.new().tag, ex=self.ttl)
+        except RedisError as err:
+            logger.error('Contacts version of user %s was not bumped: %s', user_id, err)
+
+
+def etag_for(user_id: int, version: Version) -> str:
+    # weak: the same data may be sent with a different encoding
+    return f'W/"{user_id}-{version.tag}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    The etag_matches function compares the If-None-Match header with the ETag (weak comparison).
+
+    :param if_none_match: str: Value of the If-None-Match header
+    :param etag: str: Current ETag
+    :return: True if any of the listed tags (or *) matches
+    """
+    opaque = etag.removeprefix('W/')
+    return any(tag == '*' or tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
+
+
+def not_modified_since(if_modified_since: str, version: Version) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # a date in the future is invalid (RFC 9110, 13.1.3)
+    return since <= time.time() and version.modified_ms < since * 1000
+
+
+async def conditional_get(request: Request, response: Response, user_id: int) -> Optional[Response]:
+    """
+    The conditional_get function sets the validators of a contacts resource of the user on the response and
+    returns the 304 response when the client's copy is current. If-None-Match takes precedence over
+    If-Modified-Since, as RFC 9110 requires.
+
+    :param request: Request: Get the conditional headers
+    :param response: Response: Response of the route, gets ETag, Last-Modified and Cache-Control
+    :param user_id: int: Owner of the contacts
+    :return: 304 response, or None when the full response has to be sent
+    """
+    version = await contact_versions.get(user_id)
+    if version is None:
+        return None
+    headers = {'ETag': etag_for(user_id, version), 'Cache-Control': 'private, no-cache', 'Vary': 'Authorization'}
+    last_modified = version.last_modified()
+    if last_modified is not None:
+        headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        fresh = etag_matches(if_none_match, headers['ETag'])
+    else:
+        if_modified_since = request.headers.get('if-modified-since')
+        fresh = if_modified_since is not None and not_modified_since(if_modified_since, version)
+    if fresh:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+contact_versions = CollectionVersions()
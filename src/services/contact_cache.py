@@ -0,0 +1,142 @@
+"""
+Read-through cache of the contact queries of a user in Redis.
+
+An entry is keyed by the user, the collection version of the user (see src.services.conditional) and the shape of
+the query, e.g. ``list:20:0`` (limit and offset), ``after:20:137`` (limit and the last id of the previous page) or
+``email:olena@example.com``. The repository bumps the version after every committed write, which turns every cached
+query of the user into a miss at once; the old entries are not deleted, they expire after ``ttl``. Memory is bounded
+by the TTL, by ``max_entry_bytes`` (larger results are not cached) and by Redis itself: every entry has an expiry,
+so with ``maxmemory-policy volatile-lru`` they are evicted first.
+The cache is off with CONTACT_CACHE_ENABLED=false or when Redis is not configured.
+"""
+import logging
+from datetime import date
+from typing import Awaitable, Callable
+
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import Contact
+from src.database.redis_db import get_redis
+from src.services.cache_codec import RecordCodec
+from src.services.conditional import contact_versions
+
+logger = logging.getLogger(__name__)
+
+codec = RecordCodec(Contact, 1,
+                    ('id', 'firstname', 'lastname', 'email', 'phone', 'birthday', 'additionally', 'user_id'),
+                    encoders={'birthday': date.isoformat}, decoders={'birthday': date.fromisoformat})
+
+
+class ContactCache:
+    """
+    Caches the results of contact queries (a contact, None or a list of contacts) as detached Contact objects.
+    """
+
+    def __init__(self, ttl: int = 60, prefix: str = 'contacts:cache', max_entry_bytes: int = 256 * 1024,
+                 enabled: bool = True):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.max_entry_bytes = max_entry_bytes
+        self.enabled = enabled
+        self.counters = {'hits': 0, 'misses': 0, 'too_large': 0, 'errors': 0, 'invalidations': 0}
+
+    def key(self, user_id: int, tag: str, shape: str) -> str:
+        return f'{self.prefix}:{user_id}:{tag}:{shape}'
+
+    @staticmethod
+    def dumps(result) -> str:
+        """
+        The dumps function serializes the cached fields of the contacts.
+
+        :param result: Contact | None | list[Contact]: Result of the query
+        :return: JSON string
+        """
+        if isinstance(result, Contact):
+            value = codec.row(result)
+        else:
+            value = None if result is None else [codec.row(contact) for contact in result]
+        return codec.dumps(isinstance(result, Contact), value)
+
+    @staticmethod
+    def loads(payload):
+        """
+        The loads function rebuilds the detached contacts from the cached fields.
+
+        :param payload: str | bytes: Cached value
+        :return: Contact, None or a list of contacts
+        :raise ValueError: The value was written by another cache version
+        """
+        single, value = codec.loads(payload)
+        if value is None:
+            return None
+        return codec.build(value) if single else [codec.build(values) for values in value]
+
+    async def get_or_load(self, user_id: int, shape: str, loader: Callable[[], Awaitable]):
+        """
+        The get_or_load function returns the cached result of the query or runs loader and caches its result.
+        The version is read before loader runs, so a result is never cached under a version newer than its data.
+
+        :param user_id: int: Owner of the contacts
+        :param shape: str: Name and arguments of the query, unique per user
+        :param loader: Callable: Coroutine function running the query
+        :return: Result of the query
+        """
+        if not self.enabled:
+            return await loader()
+        version = await contact_versions.get(user_id)
+        client = get_redis()
+        if version is None or client is None:
+            return await loader()
+        key = self.key(user_id, version.tag, shape)
+        try:
+            payload = await client.get(key)
+            if payload is not None:
+                result = self.loads(payload)
+                self.counters['hits'] += 1
+                return result
+        except (RedisError, ValueError, TypeError) as err:
+            self.counters['errors'] += 1
+            logger.warning('Contact cache read failed: %s', err)
+        self.counters['misses'] += 1
+        result = await loader()
+        await self.set(key, result)
+        return result
+
+    async def set(self, key: str, result) -> None:
+        payload = self.dumps(result)
+        if len(payload) > self.max_entry_bytes:
+            self.counters['too_large'] += 1
+            return
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            await client.set(key, payload, ex=self.ttl)
+        except RedisError as err:
+            self.counters['errors'] += 1
+            logger.warning('Contact cache write failed: %s', err)
+
+    async def invalidate(self, user_id: int) -> None:
+        """
+        The invalidate function drops every cached query of the user by bumping the collection version;
+        it is called by the repository after every committed change of the user's contacts.
+
+        :param user_id: int: Owner of the contacts
+        :return: None
+        """
+        self.counters['invalidations'] += 1
+        await contact_versions.bumped(user_id)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the hit counters of this process.
+
+        :return: Dictionary with the cache metrics
+        """
+        lookups = self.counters['hits'] + self.counters['misses']
+        return {**self.counters, 'hit_ratio': self.counters['hits'] / lookups if lookups else 0.0}
+
+
+contact_cache = ContactCache(settings.contact_cache_ttl, max_entry_bytes=settings.contact_cache_max_entry_bytes,
+                             enabled=settings.contact_cache_enabled)
@@ -0,0 +1,325 @@
+import asyncio
+import codecs
+import csv
+import io
+import json
+import re
+import zlib
+from datetime import date
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, Iterator
+
+from fastapi.concurrency import run_in_threadpool
+
+from pydantic import ValidationError, EmailStr, validator
+
+from src.schemas import ContactModel, ContactFormat, ImportReport, ImportRowIssue
+
+CONTACT_FIELDS = ('firstname', 'lastname', 'email', 'phone', 'birthday', 'additionally')
+EXPORT_FIELDS = ('id',) + CONTACT_FIELDS
+MEDIA_TYPES = {
+    ContactFormat.csv: 'text/csv',
+    ContactFormat.ndjson: 'application/x-ndjson',
+    ContactFormat.vcard: 'text/vcard',
+}
+EXTENSIONS = {
+    ContactFormat.csv: 'csv',
+    ContactFormat.ndjson: 'ndjson',
+    ContactFormat.vcard: 'vcf',
+}
+EMAIL_LOCAL_PART = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+
+
+@lru_cache(maxsize=4096)
+def email_domain_is_valid(domain: str) -> bool:
+    try:
+        EmailStr.validate(f'postmaster@{domain}')
+    except ValueError:
+        return False
+    return True
+
+
+class ImportContactModel(ContactModel):
+    """
+    ContactModel for imported rows. Full email validation (IDNA checks of the domain) is the slowest part of
+    an import, so a plain ASCII address is checked against a cached result for its domain; all other addresses
+    go through EmailStr. The result is the same as EmailStr gives.
+    """
+    email: str
+
+    @validator('email')
+    def validate_email(cls, value: str) -> str:
+        local, at, domain = value.rpartition('@')
+        domain = domain.lower()
+        if at and len(value) <= 254 and len(local) <= 64 and EMAIL_LOCAL_PART.fullmatch(local) \
+                and email_domain_is_valid(domain):
+            return f'{local}@{domain}'
+        return EmailStr.validate(value)
+
+
+def detect_format(filename: str | None, content_type: str | None) -> ContactFormat | None:
+    """
+    The detect_format function guesses the format of an uploaded address book by its file name or content type.
+
+    :param filename: str | None: Name of the uploaded file
+    :param content_type: str | None: Content type of the upload
+    :return: ContactFormat or None if the format is unknown
+    """
+    name = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith('.csv') or content_type == 'text/csv':
+        return ContactFormat.csv
+    if name.endswith(('.jsonl', '.ndjson')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+        return ContactFormat.ndjson
+    if name.endswith(('.vcf', '.vcard')) or content_type in ('text/vcard', 'text/x-vcard'):
+        return ContactFormat.vcard
+    return None
+
+
+def read_csv(lines: Iterator[str]) -> Iterator[tuple[int, dict]]:
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, {key: value or None for key, value in row.items() if key in CONTACT_FIELDS}
+
+
+def read_ndjson(lines: Iterator[str]) -> Iterator[tuple[int, dict]]:
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_num, row if isinstance(row, dict) else {'__error__': 'Invalid JSON object'}
+
+
+VCARD_ESCAPE = re.compile(r'\\(.)')
+VCARD_SEPARATOR = re.compile(r'(?<!\\);')
+
+
+def vcard_unescape(value: str) -> str:
+    return VCARD_ESCAPE.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def vcard_unfold(lines: Iterator[str]) -> Iterator[tuple[int, str]]:
+    line_num, current = 0, None
+    for num, line in enumerate(lines, start=1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield line_num, current
+        line_num, current = num, line
+    if current is not None:
+        yield line_num, current
+
+
+def read_vcard(lines: Iterator[str]) -> Iterator[tuple[int, dict]]:
+    card, card_line = None, 0
+    for line_num, line in vcard_unfold(lines):
+        name, _, value = line.partition(':')
+        prop = name.split(';', 1)[0].split('.')[-1].upper()
+        if prop == 'BEGIN' and value.upper() == 'VCARD':
+            card, card_line = {}, line_num
+        elif card is None:
+            continue
+        elif prop == 'END':
+            yield card_line, card
+            card = None
+        elif prop == 'N':
+            parts = VCARD_SEPARATOR.split(value)
+            card['lastname'] = vcard_unescape(parts[0])
+            card['firstname'] = vcard_unescape(parts[1]) if len(parts) > 1 else None
+        elif prop == 'EMAIL':
+            card.setdefault('email', vcard_unescape(value))
+        elif prop == 'TEL':
+            card.setdefault('phone', vcard_unescape(value))
+        elif prop == 'BDAY':
+            value = value.strip()
+            if len(value) == 8 and value.isdigit():
+                value = f'{value[:4]}-{value[4:6]}-{value[6:]}'
+            card['birthday'] = value
+        elif prop == 'NOTE':
+            card['additionally'] = vcard_unescape(value)
+
+
+READERS = {
+    ContactFormat.csv: read_csv,
+    ContactFormat.ndjson: read_ndjson,
+    ContactFormat.vcard: read_vcard,
+}
+
+
+class ContactImporter:
+    """
+    Reads an uploaded address book row by row and validates it against ContactModel in chunks.
+
+    Only a couple of chunks are held in memory: the file is read lazily from the spooled upload and the report keeps
+    full counts, but at most max_reported rows of errors and duplicates. The emails seen so far are remembered
+    to report duplicates inside the file.
+    """
+
+    def __init__(self, file: BinaryIO, file_format: ContactFormat, chunk_size: int, max_reported: int):
+        lines = codecs.iterdecode(file, 'utf-8-sig')
+        self.rows = READERS[file_format](lines)
+        self.chunk_size = chunk_size
+        self.max_reported = max_reported
+        self.seen_emails: set[str] = set()
+        self.imported = 0
+        # next_chunk runs in a worker thread while saved runs in the event loop, so they never share a counter
+        self.failed, self.errors = 0, []
+        self.file_duplicates, self.file_duplicate_rows = 0, []
+        self.existing, self.existing_rows = 0, []
+
+    def add_issue(self, issues: list, row: int, email: str | None, detail: str):
+        if len(issues) < self.max_reported:
+            issues.append(ImportRowIssue(row=row, email=email, detail=detail))
+
+    def next_chunk(self) -> list[tuple[int, ContactModel]]:
+        """
+        The next_chunk function reads and validates the next chunk of rows. Invalid rows and emails repeated in
+        the file are counted and skipped.
+
+        :return: List of (row number, contact) of valid rows, empty when the file is over
+        """
+        chunk = []
+        try:
+            for row_num, row in self.rows:
+                email = row.get('email')
+                try:
+                    if '__error__' in row:
+                        raise ValueError(row['__error__'])
+                    if row.get('additionally') is None:
+                        row['additionally'] = ''
+                    contact = ImportContactModel(**row)
+                except (ValidationError, ValueError, TypeError) as err:
+                    self.failed += 1
+                    self.add_issue(self.errors, row_num, email if isinstance(email, str) else None,
+                                   validation_detail(err))
+                    continue
+                key = contact.email.lower()
+                if key in self.seen_emails:
+                    self.file_duplicates += 1
+                    self.add_issue(self.file_duplicate_rows, row_num, contact.email, 'Email is repeated in the file')
+                    continue
+                self.seen_emails.add(key)
+                chunk.append((row_num, contact))
+                if len(chunk) >= self.chunk_size:
+                    break
+        except (UnicodeDecodeError, csv.Error) as err:
+            self.failed += 1
+            self.add_issue(self.errors, 0, None, f'Unreadable file: {err}')
+            self.rows = iter(())
+        return chunk
+
+    def saved(self, chunk: list[tuple[int, ContactModel]], inserted: set[str]):
+        """
+        The saved function counts the result of inserting a chunk. Contacts missing from inserted already existed.
+
+        :param chunk: list: Chunk returned by next_chunk
+        :param inserted: set[str]: Emails of the inserted contacts
+        """
+        for row_num, contact in chunk:
+            if contact.email in inserted:
+                self.imported += 1
+            else:
+                self.existing += 1
+                self.add_issue(self.existing_rows, row_num, contact.email, 'Email is exist')
+
+    async def run(self, save: Callable[[list[ContactModel]], Awaitable[set[str]]]) -> ImportReport:
+        """
+        The run function imports the whole file: the next chunk is read and validated in a worker thread
+        while the current one is being saved.
+
+        :param save: Callable: Coroutine function that saves contacts and returns emails of the inserted ones
+        :return: Report of the import
+        """
+        pending = asyncio.ensure_future(run_in_threadpool(self.next_chunk))
+        try:
+            while chunk := await pending:
+                pending = asyncio.ensure_future(run_in_threadpool(self.next_chunk))
+                self.saved(chunk, await save([contact for _, contact in chunk]))
+        finally:
+            if not pending.done():
+                await asyncio.wait([pending])
+        return self.report()
+
+    def report(self) -> ImportReport:
+        duplicate_rows = sorted(self.file_duplicate_rows + self.existing_rows, key=lambda issue: issue.row)
+        return ImportReport(imported=self.imported, duplicates=self.file_duplicates + self.existing,
+                            failed=self.failed, duplicate_rows=duplicate_rows[:self.max_reported], errors=self.errors)
+
+
+def validation_detail(err: Exception) -> str:
+    if isinstance(err, ValidationError):
+        return '; '.join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors())
+    return str(err)
+
+
+def write_csv(rows: list, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows((*row[:5], row[5].isoformat() if row[5] else '', row[6] or '') for row in rows)
+    return buffer.getvalue()
+
+
+def write_ndjson(rows: list, header: bool) -> str:
+    return ''.join(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False, default=date.isoformat) + '\n'
+                   for row in rows)
+
+
+def vcard_escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;').replace('\n', '\\n')
+
+
+def write_vcard(rows: list, header: bool) -> str:
+    cards = []
+    for contact_id, firstname, lastname, email, phone, birthday, additionally in rows:
+        lines = ['BEGIN:VCARD', 'VERSION:3.0', f'UID:{contact_id}',
+                 f'N:{vcard_escape(lastname)};{vcard_escape(firstname)};;;',
+                 f'FN:{vcard_escape(firstname)} {vcard_escape(lastname)}',
+                 f'EMAIL:{vcard_escape(email)}', f'TEL:{vcard_escape(phone)}']
+        if birthday:
+            lines.append(f'BDAY:{birthday.isoformat()}')
+        if additionally:
+            lines.append(f'NOTE:{vcard_escape(additionally)}')
+        lines.append('END:VCARD\r\n')
+        cards.append('\r\n'.join(lines))
+    return ''.join(cards)
+
+
+WRITERS = {
+    ContactFormat.csv: write_csv,
+    ContactFormat.ndjson: write_ndjson,
+    ContactFormat.vcard: write_vcard,
+}
+
+
+async def export_contacts(batches: AsyncIterator[list], file_format: ContactFormat,
+                          compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    The export_contacts function turns batches of contact rows into chunks of the exported file.
+    With compress the chunks make one gzip stream, flushed after every batch so the client gets data at once.
+
+    :param batches: AsyncIterator[list]: Batches of rows with EXPORT_FIELDS
+    :param file_format: ContactFormat: Format of the file
+    :param compress: bool: Compress the file with gzip
+    :return: Async iterator of bytes
+    """
+    write = WRITERS[file_format]
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    header = True
+    async for batch in batches:
+        chunk = write(batch, header).encode('utf-8')
+        header = False
+        if compressor is not None:
+            chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield chunk
+    if header:
+        chunk = write([], header).encode('utf-8')
+        yield compressor.compress(chunk) + compressor.flush() if compressor is not None else chunk
+    elif compressor is not None:
+        yield compressor.flush()
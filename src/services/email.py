@@ -1,46 +1,220 @@
+"""
+Outbound email.
+
+MailSender keeps a pool of authenticated SMTP connections and reuses them between messages instead of opening a new
+SSL connection (and logging in) for every email. The templates are compiled once. At most ``pool_size`` messages
+are sent at the same time, one per connection; send_batch sends many messages through the same pool.
+"""
+import asyncio
+import logging
+import time
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
 from pathlib import Path
+from typing import Iterable, Optional
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
+from src.services.jobs import job_queue
 from src.conf.config import settings
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="ContactsApp",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+# errors after which the connection is dropped and the message is retried once on a fresh one
+CONNECTION_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError,
+                     asyncio.TimeoutError)
+
+
+class MailSender:
+    """
+    Sends emails through a pool of at most ``pool_size`` SMTP connections. Idle connections are reused for
+    ``max_idle`` seconds (servers close them on their own after a while) and for ``max_messages`` messages.
+    """
+
+    def __init__(self, hostname: str, port: int, sender: str, sender_name: str = 'ContactsApp',
+                 username: Optional[str] = None, password: Optional[str] = None, use_tls: bool = True,
+                 start_tls: bool = False, validate_certs: bool = True, pool_size: int = 4, timeout: float = 30,
+                 max_idle: float = 60, max_messages: int = 100, template_folder: Path = TEMPLATE_FOLDER):
+        self.hostname = hostname
+        self.port = port
+        self.sender = formataddr((sender_name, sender))
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.validate_certs = validate_certs
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self.templates = Environment(loader=FileSystemLoader(template_folder), autoescape=select_autoescape(),
+                                     auto_reload=False)
+        self.slots = asyncio.Semaphore(pool_size)
+        # idle connections: (client, last used, messages sent)
+        self.idle: list[tuple[aiosmtplib.SMTP, float, int]] = []
+        self.connects = 0
+        self.sent = 0
+        self.failed = 0
+
+    def render(self, template_name: str, **context) -> str:
+        """
+        The render function fills the template; every template is compiled on first use only.
+
+        :param template_name: str: File name in the template folder
+        :param context: Template variables
+        :return: str: Rendered text
+        """
+        return self.templates.get_template(template_name).render(**context)
+
+    def build_message(self, recipient: str, subject: str, html: str) -> EmailMessage:
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = recipient
+        message['Subject'] = subject
+        message['Message-ID'] = make_msgid()
+        message.set_content(html, subtype='html')
+        return message
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, use_tls=self.use_tls,
+                                 start_tls=self.start_tls, validate_certs=self.validate_certs, timeout=self.timeout)
+        await client.connect()
+        if self.username:
+            try:
+                await client.login(self.username, self.password)
+            except BaseException:
+                client.close()
+                raise
+        self.connects += 1
+        return client
+
+    async def acquire(self) -> tuple[aiosmtplib.SMTP, int]:
+        now = time.monotonic()
+        while self.idle:
+            client, last_used, messages = self.idle.pop()
+            if client.is_connected and now - last_used < self.max_idle:
+                return client, messages
+            await self.discard(client)
+        return await self.connect(), 0
+
+    async def release(self, client: aiosmtplib.SMTP, messages: int) -> None:
+        if messages >= self.max_messages:
+            await self.discard(client)
+        else:
+            self.idle.append((client, time.monotonic(), messages))
+
+    @staticmethod
+    async def discard(client: aiosmtplib.SMTP) -> None:
+        try:
+            if client.is_connected:
+                await client.quit()
+        except CONNECTION_ERRORS + (aiosmtplib.SMTPException, OSError):
+            client.close()
+
+    async def send(self, message: EmailMessage) -> None:
+        """
+        The send function sends one message through a pooled connection. When the connection turns out to be
+        closed by the server, the message is retried once on a new connection.
+
+        :param message: EmailMessage: Message to send
+        :return: None
+        """
+        async with self.slots:
+            for attempt in range(2):
+                try:
+                    client, messages = await self.acquire()
+                except BaseException:
+                    self.failed += 1
+                    raise
+                try:
+                    await client.send_message(message)
+                except CONNECTION_ERRORS:
+                    client.close()
+                    if attempt:
+                        self.failed += 1
+                        raise
+                    continue
+                except aiosmtplib.SMTPResponseException:
+                    # the server refused this message (e.g. the recipient), the connection is fine
+                    self.failed += 1
+                    await self.release(client, messages)
+                    raise
+                except BaseException:
+                    self.failed += 1
+                    client.close()
+                    raise
+                self.sent += 1
+                await self.release(client, messages + 1)
+                return
+
+    async def send_batch(self, messages: Iterable[EmailMessage]) -> list[Optional[Exception]]:
+        """
+        The send_batch function sends the messages concurrently, up to pool_size at a time.
+
+        :param messages: Iterable[EmailMessage]: Messages to send
+        :return: None for every sent message, the exception for every failed one
+        """
+        results = await asyncio.gather(*(self.send(message) for message in messages), return_exceptions=True)
+        return [result if isinstance(result, Exception) else None for result in results]
+
+    async def close(self) -> None:
+        """
+        The close function closes the idle connections.
+
+        :return: None
+        """
+        idle, self.idle = self.idle, []
+        await asyncio.gather(*(self.discard(client) for client, _, _ in idle))
+
+    def stats(self) -> dict:
+        return {
+            'pool_size': self.pool_size,
+            'idle_connections': len(self.idle),
+            'connects': self.connects,
+            'sent': self.sent,
+            'failed': self.failed,
+        }
+
+
+mail_sender = MailSender(settings.mail_server, settings.mail_port, settings.mail_from,
+                         username=settings.mail_username if settings.mail_use_credentials else None,
+                         password=settings.mail_password, use_tls=settings.mail_ssl_tls,
+                         start_tls=settings.mail_starttls, validate_certs=settings.mail_validate_certs,
+                         pool_size=settings.mail_pool_size)
+
+
+def confirmation_message(email: EmailStr, username: str, host: str,
+                         sender: Optional[MailSender] = None) -> EmailMessage:
+    """
+    The confirmation_message function builds the email with the link to confirm the email address.
+
+    :param email: EmailStr: Specify the email address of the recipient
+    :param username: str: Pass the username to the template
+    :param host: str: Pass the host of the application to the email template
+    :param sender: MailSender: Sender whose templates are used, mail_sender by default
+    :return: EmailMessage
+    """
+    sender = sender or mail_sender
+    token_verification = auth_service.create_email_token({"sub": email})
+    html = sender.render("email_template.html", host=host, username=username, token=token_verification)
+    return sender.build_message(email, "Confirm your email", html)
 
 
 async def send_email(email: EmailStr, username: str, host: str):
     """
     The send_email function sends an email to the user with a link to confirm their email address.
+    It runs in the job worker (job "send_email"); errors propagate, so the job queue retries the email.
 
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the template
     :param host: str: Pass the host of the application to the email template
     :return: A coroutine
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    await mail_sender.send(confirmation_message(email, username, host))
+
+
+job_queue.register('send_email', send_email)
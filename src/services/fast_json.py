@@ -0,0 +1,61 @@
+"""
+Fast JSON path of the contact list endpoints.
+
+The routes declare ``response_model=List[ContactResponse]``, so FastAPI validates every ORM row through the model,
+converts the result with jsonable_encoder and encodes it with the stdlib json; for a page of 100 contacts that takes
+longer than the query. The rows come from our own database and were validated when they were written, so with
+``FAST_JSON=true`` the routes return a ready Response instead: the attributes named by the model are read with one
+attrgetter per row and the list is encoded by orjson. The response_model stays on the routes, so the OpenAPI
+schema is the same; the body is byte for byte the body of the default path.
+"""
+from operator import attrgetter
+from typing import Iterable, Type, Union
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+from src.conf.config import settings
+from src.schemas import ContactResponse
+
+
+class FastJSON:
+    """
+    Encodes ORM rows as a JSON list of objects with the fields (under their aliases, in their order) of model.
+    """
+
+    def __init__(self, model: Type[BaseModel], enabled: bool = True):
+        fields = list(model.__fields__.values())
+        self.keys = tuple(field.alias for field in fields)
+        # attrgetter of a single name returns the value rather than a tuple
+        getter = attrgetter(*(field.name for field in fields))
+        self.getter = getter if len(fields) > 1 else lambda row: (getter(row),)
+        self.enabled = enabled
+
+    def encode(self, rows: Iterable) -> bytes:
+        """
+        The encode function serializes the rows without validating them.
+
+        :param rows: Iterable: ORM objects (or any objects) with the attributes of the model
+        :return: bytes: JSON array
+        """
+        keys, getter = self.keys, self.getter
+        return orjson.dumps([dict(zip(keys, getter(row))) for row in rows])
+
+    def render(self, rows: list, response: Response) -> Union[list, Response]:
+        """
+        The render function is the return value of a list route: the rows themselves for the default path or,
+        when the fast path is enabled, the encoded response with the headers the route set on response.
+
+        :param rows: list: Rows returned by the repository
+        :param response: Response: Response injected into the route
+        :return: The rows or a Response
+        """
+        if not self.enabled:
+            return rows
+        fast = Response(self.encode(rows), media_type='application/json')
+        fast.raw_headers.extend(response.raw_headers)
+        return fast
+
+
+contacts_json = FastJSON(ContactResponse, enabled=settings.fast_json)
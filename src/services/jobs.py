@@ -0,0 +1,256 @@
+"""
+Durable background jobs on a Redis Stream.
+
+The web workers only enqueue: JobQueue.enqueue adds ``{name, args, attempts}`` to the stream. The job worker
+(``python worker.py``) reads the stream through a consumer group, runs the registered handler and acknowledges the
+entry. A failed job goes to a sorted set of delayed jobs with exponential backoff and is moved back to the stream
+when it is due; after ``max_attempts`` it is moved to the dead-letter stream ``<stream>:dead`` together with the
+error. Entries delivered to a worker that died are claimed by another one after ``claim_idle`` seconds, so a job is
+run at least once; handlers must tolerate being run twice.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from src.conf.config import settings
+from src.database.redis_db import get_redis
+
+logger = logging.getLogger(__name__)
+
+# moves the due delayed jobs (members "<id>\t<attempts>\t<name>\t<args>") back to the stream atomically
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    local _, attempts, name, args = string.match(job, '^([^\\t]*)\\t([^\\t]*)\\t([^\\t]*)\\t(.*)$')
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('XADD', KEYS[2], '*', 'name', name, 'args', args, 'attempts', attempts)
+end
+return #due
+"""
+
+
+class JobQueue:
+    """
+    Producer and consumer of the job stream. Handlers are coroutine functions registered under the job name;
+    they get the keyword arguments given to enqueue and signal a failure by raising.
+    """
+
+    def __init__(self, stream: str = 'jobs', group: str = 'workers', max_attempts: int = 5,
+                 backoff_base: float = 5, backoff_max: float = 600, claim_idle: float = 300,
+                 dead_max_len: int = 10000):
+        self.stream = stream
+        self.group = group
+        self.delayed = f'{stream}:delayed'
+        self.dead = f'{stream}:dead'
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.claim_idle = claim_idle
+        self.dead_max_len = dead_max_len
+        self.handlers: dict[str, Callable[..., Awaitable]] = {}
+        self.counters = dict.fromkeys(('enqueued', 'enqueue_failed', 'succeeded', 'retried', 'dead_lettered',
+                                       'claimed'), 0)
+        self.depth = dict.fromkeys(('queued', 'pending', 'delayed', 'dead'), 0)
+        self.depth_updated = 0.0
+
+    def register(self, name: str, handler: Callable[..., Awaitable]) -> None:
+        """
+        The register function makes the worker run handler for the jobs called name.
+
+        :param name: str: Job name
+        :param handler: Callable: Coroutine function taking the job arguments as keywords
+        :return: None
+        """
+        self.handlers[name] = handler
+
+    async def enqueue(self, name: str, **kwargs) -> Optional[str]:
+        """
+        The enqueue function adds a job to the stream. When Redis is not configured or fails, the job is logged
+        and dropped; the caller does not fail because of it.
+
+        :param name: str: Job name
+        :param kwargs: JSON serializable arguments of the handler
+        :return: Id of the stream entry, or None when the job was not enqueued
+        """
+        client = get_redis()
+        if client is None:
+            self.counters['enqueue_failed'] += 1
+            logger.error('Job %s was not enqueued: Redis is not configured', name)
+            return None
+        try:
+            job_id = await client.xadd(self.stream, {'name': name, 'args': json.dumps(kwargs), 'attempts': 0})
+        except RedisError as err:
+            self.counters['enqueue_failed'] += 1
+            logger.error('Job %s was not enqueued: %s', name, err)
+            return None
+        self.counters['enqueued'] += 1
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        # jitter spreads the retries of jobs that failed together, e.g. while the SMTP server was down
+        return random.uniform(delay / 2, delay)
+
+    async def ensure_group(self, client: Redis) -> None:
+        try:
+            await client.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as err:
+            if 'BUSYGROUP' not in str(err):
+                raise
+
+    async def promote(self, client: Redis, limit: int = 100) -> int:
+        """
+        The promote function moves the delayed jobs whose time has come back to the stream.
+
+        :param client: Redis: Redis client
+        :param limit: int: Maximum number of jobs to move
+        :return: int: Number of jobs moved
+        """
+        return await client.eval(PROMOTE_SCRIPT, 2, self.delayed, self.stream, time.time(), limit)
+
+    async def process(self, client: Redis, entry_id: str, fields: dict) -> bool:
+        """
+        The process function runs one job and acknowledges it; a failed job is rescheduled or dead-lettered
+        in the same transaction as the acknowledgement.
+
+        :param client: Redis: Redis client
+        :param entry_id: str: Id of the stream entry
+        :param fields: dict: Fields of the stream entry
+        :return: bool: True if the job succeeded
+        """
+        name = fields.get('name', '')
+        attempts = int(fields.get('attempts', 0)) + 1
+        handler = self.handlers.get(name)
+        error = None
+        try:
+            if handler is None:
+                raise LookupError(f'No handler registered for job {name!r}')
+            await handler(**json.loads(fields.get('args', '{}')))
+        except Exception as err:
+            error = err
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            if error is None:
+                self.counters['succeeded'] += 1
+            elif attempts < self.max_attempts and handler is not None:
+                self.counters['retried'] += 1
+                delay = self.backoff(attempts)
+                logger.warning('Job %s %s failed (attempt %d), retrying in %.0fs: %r', name, entry_id, attempts,
+                               delay, error)
+                pipe.zadd(self.delayed, {f"{entry_id}\t{attempts}\t{name}\t{fields.get('args', '{}')}":
+                                         time.time() + delay})
+            else:
+                self.counters['dead_lettered'] += 1
+                logger.error('Job %s %s failed (attempt %d), moved to %s: %r', name, entry_id, attempts,
+                             self.dead, error)
+                pipe.xadd(self.dead, {**fields, 'attempts': attempts, 'error': repr(error), 'id': entry_id,
+                                      'failed_at': time.time()}, maxlen=self.dead_max_len, approximate=True)
+            await pipe.execute()
+        return error is None
+
+    async def work_once(self, client: Redis, consumer: str, count: int, block: Optional[float] = None) -> int:
+        """
+        The work_once function reads up to count new jobs (waiting up to block seconds for them) and runs
+        them concurrently.
+
+        :param client: Redis: Redis client
+        :param consumer: str: Name of this worker in the consumer group
+        :param count: int: Maximum number of jobs to run
+        :param block: float: Seconds to wait for new jobs, None to return at once
+        :return: int: Number of jobs run
+        """
+        response = await client.xreadgroup(self.group, consumer, {self.stream: '>'}, count=count,
+                                           block=int(block * 1000) if block else None)
+        entries = [entry for _, stream_entries in response or [] for entry in stream_entries]
+        await asyncio.gather(*(self.process(client, entry_id, fields) for entry_id, fields in entries))
+        return len(entries)
+
+    async def claim(self, client: Redis, consumer: str, count: int) -> int:
+        """
+        The claim function takes over and runs the jobs another worker received but has not acknowledged
+        for claim_idle seconds (the worker died or hung).
+
+        :param client: Redis: Redis client
+        :param consumer: str: Name of this worker in the consumer group
+        :param count: int: Maximum number of jobs to claim
+        :return: int: Number of jobs run
+        """
+        _, entries, *_ = await client.xautoclaim(self.stream, self.group, consumer, int(self.claim_idle * 1000),
+                                                 start_id='0-0', count=count)
+        # entries deleted from the stream after delivery come back as None
+        entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+        self.counters['claimed'] += len(entries)
+        await asyncio.gather(*(self.process(client, entry_id, fields) for entry_id, fields in entries))
+        return len(entries)
+
+    async def refresh_depth(self, client: Redis) -> dict:
+        """
+        The refresh_depth function reads the lengths of the queue: jobs waiting in the stream (acknowledged
+        entries are deleted, so it is the stream length), delivered but not acknowledged, delayed and dead.
+
+        :param client: Redis: Redis client
+        :return: dict: Queue depth
+        """
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.xlen(self.stream)
+            pipe.xpending(self.stream, self.group)
+            pipe.zcard(self.delayed)
+            pipe.xlen(self.dead)
+            queued, pending, delayed, dead = await pipe.execute()
+        self.depth = {'queued': queued, 'pending': pending['pending'], 'delayed': delayed, 'dead': dead}
+        self.depth_updated = time.monotonic()
+        return self.depth
+
+    async def run(self, consumer: str, stop: asyncio.Event, concurrency: int = 8, block: float = 1,
+                  retry_delay: float = 1) -> None:
+        """
+        The run function is the main loop of the job worker; it returns after stop is set.
+
+        :param consumer: str: Name of this worker in the consumer group, unique per process
+        :param stop: asyncio.Event: Set to finish the loop
+        :param concurrency: int: Maximum number of jobs run at the same time
+        :param block: float: Seconds to wait for new jobs in one read
+        :param retry_delay: float: Seconds to wait after a Redis error
+        :return: None
+        """
+        client = get_redis()
+        last_claim = 0.0
+        group_ready = False
+        while not stop.is_set():
+            try:
+                if not group_ready:
+                    await self.ensure_group(client)
+                    group_ready = True
+                await self.promote(client)
+                if time.monotonic() - last_claim >= self.claim_idle / 2:
+                    last_claim = time.monotonic()
+                    await self.claim(client, consumer, concurrency)
+                await self.work_once(client, consumer, concurrency, block)
+                if time.monotonic() - self.depth_updated >= 1:
+                    await self.refresh_depth(client)
+            except RedisError as err:
+                logger.warning('Job worker failed to talk to Redis: %s', err)
+                await asyncio.sleep(retry_delay)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the job counters of this process and, in the job worker, the last known
+        queue depth.
+
+        :return: Dictionary with the queue metrics
+        """
+        if not self.depth_updated:
+            return dict(self.counters)
+        return {**self.counters, **{f'depth_{key}': value for key, value in self.depth.items()}}
+
+
+job_queue = JobQueue(settings.jobs_stream, max_attempts=settings.jobs_max_attempts,
+                     backoff_base=settings.jobs_backoff_base, backoff_max=settings.jobs_backoff_max,
+                     claim_idle=settings.jobs_claim_idle)
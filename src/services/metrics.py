@@ -0,0 +1,275 @@
+"""
+Request metrics in the Prometheus text format.
+
+MetricsMiddleware observes, per route template and status, the latency of every request, and per route the number
+of database statements and Redis round trips it made (counted through a context variable by the engine listener
+installed by instrument_engine and by RedisRoundTripCounter). Each uvicorn worker keeps its own registry; when
+Settings.metrics_dir is set the workers periodically dump it to ``<metrics_dir>/<pid>.json`` and the /metrics
+endpoint merges all the dumps, so the numbers are the same whichever worker serves the scrape.
+"""
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Optional
+
+from redis.asyncio.connection import Connection
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class RequestCounters:
+    __slots__ = ('db', 'redis')
+
+    def __init__(self):
+        self.db = 0
+        self.redis = 0
+
+
+request_counters: ContextVar[Optional[RequestCounters]] = ContextVar('request_counters', default=None)
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets; each series (a tuple of label values) holds the count of every bucket
+    (the last one is +Inf), the sum and the number of observations.
+    """
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...], buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+class MetricsRegistry:
+    """
+    Metrics of one worker process and the rendering of the merged metrics of all workers.
+    """
+
+    def __init__(self, metrics_dir: Optional[str] = None):
+        self.metrics_dir = Path(metrics_dir) if metrics_dir else None
+        self.latency = Histogram('http_request_duration_seconds', 'Time until the last byte of the response.',
+                                 ('method', 'route', 'status'), LATENCY_BUCKETS)
+        self.db_queries = Histogram('http_request_db_queries', 'Database statements executed per request.',
+                                    ('method', 'route'), COUNT_BUCKETS)
+        self.redis_round_trips = Histogram('http_request_redis_round_trips', 'Redis round trips per request.',
+                                           ('method', 'route'), COUNT_BUCKETS)
+        self.histograms = (self.latency, self.db_queries, self.redis_round_trips)
+        self.in_flight = 0
+        self.collectors: dict[str, Callable[[], dict]] = {}
+
+    def register_collector(self, name: str, collect: Callable[[], dict]) -> None:
+        """
+        The register_collector function adds a source of gauges read at every scrape, e.g. the stats of a cache.
+        Numeric values of the returned dict are exported as ``<name>_<key>{worker="<pid>"}``.
+
+        :param name: str: Prefix of the gauge names
+        :param collect: Callable: Function returning the current values
+        :return: None
+        """
+        self.collectors[name] = collect
+
+    def snapshot(self) -> dict:
+        gauges = {'http_requests_in_flight': self.in_flight}
+        for name, collect in self.collectors.items():
+            for key, value in collect().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f'{name}_{key}'] = value
+        return {
+            'pid': os.getpid(),
+            'histograms': {histogram.name: [[list(labels), values] for labels, values in histogram.series.items()]
+                           for histogram in self.histograms},
+            'gauges': gauges,
+        }
+
+    def flush(self) -> None:
+        """
+        The flush function writes the snapshot of this worker to metrics_dir (atomically, via a temporary file).
+
+        :return: None
+        """
+        if self.metrics_dir is None:
+            return
+        self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        path = self.metrics_dir / f'{os.getpid()}.json'
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path)
+
+    def snapshots(self) -> list[dict]:
+        if self.metrics_dir is None:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for path in self.metrics_dir.glob('*.json'):
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        """
+        The render function merges the snapshots of all workers into the Prometheus text format.
+        Histograms of exited workers are kept (they are counters), gauges only of the running ones.
+
+        :return: str: Metrics page
+        """
+        lines = []
+        snapshots = self.snapshots()
+        for histogram in self.histograms:
+            merged: dict[tuple, list] = {}
+            for snapshot in snapshots:
+                for labels, values in snapshot['histograms'].get(histogram.name, []):
+                    series = merged.setdefault(tuple(labels), [0] * len(values))
+                    for i, value in enumerate(values):
+                        series[i] += value
+            lines.append(f'# HELP {histogram.name} {histogram.help_text}')
+            lines.append(f'# TYPE {histogram.name} histogram')
+            for labels, values in sorted(merged.items()):
+                label_text = ','.join(f'{name}="{escape(value)}"' for name, value in zip(histogram.labels, labels))
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, '+Inf'), values):
+                    cumulative += count
+                    lines.append(f'{histogram.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{histogram.name}_sum{{{label_text}}} {values[-2]}')
+                lines.append(f'{histogram.name}_count{{{label_text}}} {values[-1]}')
+        gauges: dict[str, list[tuple[int, float]]] = {}
+        for snapshot in snapshots:
+            if snapshot['pid'] != os.getpid() and not process_alive(snapshot['pid']):
+                continue
+            for name, value in snapshot['gauges'].items():
+                gauges.setdefault(name, []).append((snapshot['pid'], value))
+        for name, values in sorted(gauges.items()):
+            lines.append(f'# TYPE {name} gauge')
+            if name == 'http_requests_in_flight':
+                lines.append(f'{name} {sum(value for _, value in values)}')
+                continue
+            for pid, value in sorted(values):
+                lines.append(f'{name}{{worker="{pid}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    async def flush_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware overhead) feeding the registry. Requests are labelled with
+    the path template of the matched route, never with the raw path, to keep the number of series bounded.
+    """
+
+    def __init__(self, app, registry: Optional[MetricsRegistry] = None):
+        self.app = app
+        self.registry = registry or metrics
+        self.routes: Optional[dict] = None
+
+    def route_of(self, scope) -> str:
+        if self.routes is None:
+            # the router stores the endpoint of the matched route in the scope, map it back to its template
+            self.routes = {}
+            for route in scope['app'].routes:
+                endpoint = getattr(route, 'endpoint', None) or getattr(route, 'app', None)
+                self.routes.setdefault(endpoint, route.path)
+        return self.routes.get(scope.get('endpoint'), UNMATCHED_ROUTE)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        registry = self.registry
+        counters = RequestCounters()
+        token = request_counters.set(counters)
+        start = time.perf_counter()
+        status = 500
+        observed = False
+
+        async def send_wrapper(message):
+            nonlocal status, observed
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and not message.get('more_body', False):
+                observed = True
+                registry.latency.observe((scope['method'], self.route_of(scope), status),
+                                         time.perf_counter() - start)
+            await send(message)
+
+        registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.in_flight -= 1
+            request_counters.reset(token)
+            route = self.route_of(scope)
+            if not observed:
+                registry.latency.observe((scope['method'], route, status), time.perf_counter() - start)
+            registry.db_queries.observe((scope['method'], route), counters.db)
+            registry.redis_round_trips.observe((scope['method'], route), counters.redis)
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    counters = request_counters.get()
+    if counters is not None:
+        counters.db += 1
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    The instrument_engine function counts the statements of the engine in the metrics of the current request.
+    For an AsyncEngine pass its sync_engine.
+
+    :param engine: Engine: Engine to count
+    :return: None
+    """
+    if not event.contains(engine, 'before_cursor_execute', count_statement):
+        event.listen(engine, 'before_cursor_execute', count_statement)
+
+
+class RedisRoundTripCounter(Connection):
+    """
+    Redis connection counting every command (or whole pipeline) sent in the metrics of the current request.
+    """
+
+    async def send_packed_command(self, command, check_health: bool = True) -> None:
+        counters = request_counters.get()
+        if counters is not None:
+            counters.redis += 1
+        await super().send_packed_command(command, check_health)
+
+
+metrics = MetricsRegistry(settings.metrics_dir)
@@ -0,0 +1,50 @@
+import base64
+import json
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*keys) -> str:
+    """
+    The encode_cursor function packs the sort key of the last row of a page into an opaque url-safe token.
+    The client sends the token back to get the next page (keyset pagination).
+
+    :param keys: Values of the sort key of the last row, e.g. contact id
+    :return: Opaque cursor token
+    """
+    raw = json.dumps(keys, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> tuple:
+    """
+    The decode_cursor function unpacks a token made by encode_cursor.
+    If the token is damaged or has a wrong number of keys, raise 400 error.
+
+    :param cursor: str: Cursor token from the request
+    :param size: int: Expected number of values in the sort key
+    :return: Tuple with values of the sort key
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        keys = json.loads(raw)
+    except ValueError:
+        keys = None
+    if not isinstance(keys, list) or len(keys) != size or not all(isinstance(key, int) for key in keys):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return tuple(keys)
+
+
+def next_cursor(items: list, limit: int, *key_attrs: str) -> str | None:
+    """
+    The next_cursor function returns the cursor of the page following items, or None if items is the last page.
+
+    :param items: list: Rows of the current page
+    :param limit: int: Page size that was requested
+    :param key_attrs: str: Names of the attributes that make the sort key
+    :return: Cursor token or None
+    """
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(*(getattr(last, attr) for attr in key_attrs))
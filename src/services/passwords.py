@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.conf.config import settings
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a bounded thread pool, so a burst of logins does not block the event loop.
+    bcrypt releases the GIL while it works, so the pool scales with the number of cores.
+
+    The cost is pinned to ``rounds``: hashes made with any other cost are reported by verify_and_update
+    together with a new hash, which lets login upgrade (or downgrade) stored passwords transparently.
+    """
+
+    def __init__(self, rounds: int, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending if max_pending is not None else self.workers * 16
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds,
+                                    bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        # the counters are changed from the event loop only
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    async def run(self, func, *args):
+        """
+        The run function executes one bcrypt call in the pool. When ``max_pending`` calls are already waiting
+        or running, the request is rejected with 503 instead of growing the queue (and the response time) unbounded.
+
+        :param func: Callable: CryptContext method
+        :param args: Arguments of the call
+        :return: The result of the call
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many authentication requests, try again later",
+                                headers={"Retry-After": "1"})
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.busy_seconds += time.perf_counter() - start
+
+    async def hash(self, password: str) -> str:
+        """
+        The hash function hashes the password with the configured cost.
+
+        :param password: str: Plain password
+        :return: bcrypt hash
+        """
+        return await self.run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        The verify function checks the password against the stored hash.
+
+        :param password: str: Plain password
+        :param hashed_password: str: Stored bcrypt hash
+        :return: True if the password matches
+        """
+        return await self.run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """
+        The verify_and_update function checks the password and, when the stored hash was made with
+        a different cost, returns the new hash that should replace it.
+
+        :param password: str: Plain password
+        :param hashed_password: str: Stored bcrypt hash
+        :return: Tuple (password matches, new hash or None)
+        """
+        return await self.run(self.context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the state of the pool: calls waiting or running, queue depth
+        (calls that wait for a free worker), the peak of pending calls and the totals.
+
+        :return: Dictionary with the pool metrics
+        """
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "queue_depth": max(0, self.pending - self.workers),
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+
+password_hasher = PasswordHasher(settings.bcrypt_rounds, settings.password_hash_workers,
+                                 settings.password_hash_max_pending)
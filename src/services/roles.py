@@ -2,8 +2,8 @@ from typing import List
 
 from fastapi import Depends, HTTPException, status, Request
 
-from src.database.models import User, Role
-from src.services.auth import auth_service
+from src.database.models import Role
+from src.services.auth import auth_service, Principal
 
 
 class RoleAccess:
@@ -12,9 +12,7 @@ class RoleAccess:
         self.allowed_roles = allowed_roles
 
 
-    async def __call__(self, request: Request, current_user: User = Depends(auth_service.get_current_user)):
-        print(request.method, request.url)
-        print(f'User role {current_user.roles}')
-        print(f'Allowed roles: {self.allowed_roles}')
+    async def __call__(self, request: Request, current_user: Principal = Depends(auth_service.get_principal)):
+        # the role comes from the signed claims, get_principal has checked it against the user unless it is Role.user
         if current_user.roles not in self.allowed_roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation forbidden")
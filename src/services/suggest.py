@@ -0,0 +1,173 @@
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable
+
+from src.conf.config import settings
+
+SUGGEST_FIELDS = ('id', 'firstname', 'lastname', 'email')
+
+
+def normalize(text: str) -> str:
+    """
+    The normalize function brings text to the form used by the prefix index: case folded and without accents.
+
+    :param text: str: Name, email or typed prefix
+    :return: Normalized text
+    """
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+class PrefixIndex:
+    """
+    Sorted array of (normalized key, contact id) pairs of one user, searched with bisect.
+    Every contact is reachable by its firstname, lastname, "firstname lastname" and email.
+    """
+
+    def __init__(self, contacts: Iterable[tuple]):
+        self.contacts: dict[int, tuple] = {}
+        self.keys: list[tuple[str, int]] = []
+        for contact in contacts:
+            contact = tuple(contact)
+            self.contacts[contact[0]] = contact
+            self.keys.extend(self.contact_keys(contact))
+        self.keys.sort()
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def contact_keys(contact: tuple) -> set[tuple[str, int]]:
+        contact_id, firstname, lastname, email = contact
+        first, last = normalize(firstname), normalize(lastname)
+        return {(first, contact_id), (last, contact_id), (f'{first} {last}', contact_id),
+                (normalize(email), contact_id)}
+
+    def add(self, contact: tuple):
+        """
+        The add function puts a new or changed contact into the index.
+
+        :param contact: tuple: Values of SUGGEST_FIELDS
+        """
+        contact = tuple(contact)
+        self.remove(contact[0])
+        self.contacts[contact[0]] = contact
+        for key in self.contact_keys(contact):
+            insort(self.keys, key)
+
+    def remove(self, contact_id: int):
+        """
+        The remove function takes the contact out of the index, if it is there.
+
+        :param contact_id: int: Id of the contact
+        """
+        contact = self.contacts.pop(contact_id, None)
+        if contact is None:
+            return
+        for key in self.contact_keys(contact):
+            i = bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+
+    def lookup(self, prefix: str, limit: int) -> list[dict]:
+        """
+        The lookup function returns contacts with a name or email starting with prefix, ordered by the matched key.
+
+        :param prefix: str: Text typed by the user
+        :param limit: int: Maximal number of suggestions
+        :return: List of dictionaries with SUGGEST_FIELDS
+        """
+        prefix = normalize(prefix).strip()
+        if not prefix:
+            return []
+        found, seen = [], set()
+        i = bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(found) < limit and self.keys[i][0].startswith(prefix):
+            contact_id = self.keys[i][1]
+            if contact_id not in seen:
+                seen.add(contact_id)
+                found.append(dict(zip(SUGGEST_FIELDS, self.contacts[contact_id])))
+            i += 1
+        return found
+
+
+class SuggestIndex:
+    """
+    Prefix indexes of the recently active users, held in this process with LRU eviction.
+
+    An index is loaded from the database on the first suggestion request of the user and is kept in sync by the
+    contact write routes of this process. Writes made by other workers are picked up when the index gets older
+    than ttl seconds.
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.indexes: OrderedDict[int, PrefixIndex] = OrderedDict()
+        # users whose index is being loaded -> a contact of the user was written meanwhile
+        self.loading: dict[int, bool] = {}
+
+    async def get(self, user_id: int, loader: Callable[[], Awaitable[Iterable[tuple]]]) -> PrefixIndex:
+        """
+        The get function returns the prefix index of the user, loading it with loader when it is missing or expired.
+
+        :param user_id: int: Id of the user
+        :param loader: Callable: Coroutine function returning (id, firstname, lastname, email) of all user's contacts
+        :return: PrefixIndex of the user
+        """
+        index = self.indexes.get(user_id)
+        if index is not None and time.monotonic() - index.loaded_at < self.ttl:
+            self.indexes.move_to_end(user_id)
+            return index
+        self.loading.setdefault(user_id, False)
+        try:
+            index = PrefixIndex(await loader())
+        finally:
+            written = self.loading.pop(user_id, True)
+        # a write made while loading may be missing from the loaded rows, such index serves only this request
+        if not written:
+            self.indexes[user_id] = index
+            self.indexes.move_to_end(user_id)
+            while len(self.indexes) > self.max_users:
+                self.indexes.popitem(last=False)
+        return index
+
+    def mark_written(self, user_id: int):
+        if user_id in self.loading:
+            self.loading[user_id] = True
+
+    def saved(self, user_id: int, contact):
+        """
+        The saved function updates the index of the user after a contact was created or updated.
+
+        :param user_id: int: Id of the owner
+        :param contact: Contact: Saved contact
+        """
+        self.mark_written(user_id)
+        index = self.indexes.get(user_id)
+        if index is not None:
+            index.add(tuple(getattr(contact, field) for field in SUGGEST_FIELDS))
+
+    def removed(self, user_id: int, contact_id: int):
+        """
+        The removed function updates the index of the user after a contact was removed.
+
+        :param user_id: int: Id of the owner
+        :param contact_id: int: Id of the removed contact
+        """
+        self.mark_written(user_id)
+        index = self.indexes.get(user_id)
+        if index is not None:
+            index.remove(contact_id)
+
+    def discard(self, user_id: int):
+        """
+        The discard function drops the index of the user, it is loaded again on the next request.
+
+        :param user_id: int: Id of the user
+        """
+        self.mark_written(user_id)
+        self.indexes.pop(user_id, None)
+
+
+suggest_index = SuggestIndex(settings.suggest_cache_users, settings.suggest_cache_ttl)
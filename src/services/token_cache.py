@@ -0,0 +1,100 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from src.conf.config import settings
+
+
+class TokenCache:
+    """
+    Bounded LRU of access tokens whose signature and "ver" claim were already checked against the user, keyed by
+    the SHA-256 digest of the token (the token itself is never stored). Each entry keeps the decoded claims until
+    the token expires or the user changes.
+
+    Every subject has a generation, bumped by invalidate whenever the user row changes (user_cache calls it in
+    every worker). An entry keeps the generation read before the user was checked, so a check that raced with
+    a change is never served; after the change the token is verified, and its "ver" compared, again. clear
+    bumps the global generation, which makes every entry invalid at once (e.g. after invalidations were lost).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[bytes, tuple[float, tuple[int, int], dict]] = OrderedDict()
+        self.generation = 0
+        # one small int per user changed during the lifetime of the process
+        self.subjects: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """
+        The get function returns the claims of a verified token that has not expired and whose user has not changed.
+
+        :param token: str: Encoded JWT
+        :return: Decoded claims or None on a miss
+        """
+        key = self.key(token)
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, generation, claims = entry
+            if expires_at > time.time() and generation == (self.generation, self.subject_generation(claims["sub"])):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return claims
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def subject_generation(self, subject: str) -> int:
+        return self.subjects.get(subject, 0)
+
+    def put(self, token: str, claims: dict, generation: Optional[int] = None) -> None:
+        """
+        The put function remembers the claims of a token that passed verification.
+
+        :param token: str: Encoded JWT
+        :param claims: dict: Decoded claims, "exp" and "sub" are required
+        :param generation: int: Generation of the subject read before the token was checked (default: the current)
+        :return: None
+        """
+        if not self.max_entries or "exp" not in claims:
+            return
+        if generation is None:
+            generation = self.subject_generation(claims["sub"])
+        self.entries[self.key(token)] = (claims["exp"], (self.generation, generation), claims)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, subject: str) -> None:
+        """
+        The invalidate function drops the cached tokens of one subject after a change of the user.
+
+        :param subject: str: Value of the "sub" claim
+        :return: None
+        """
+        self.subjects[subject] = self.subject_generation(subject) + 1
+        for key in [key for key, (_, _, claims) in self.entries.items() if claims["sub"] == subject]:
+            del self.entries[key]
+
+    def clear(self) -> None:
+        """
+        The clear function drops every cached token of this process.
+
+        :return: None
+        """
+        self.generation += 1
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0, "generation": self.generation,
+                "subjects": len(self.subjects)}
+
+
+token_cache = TokenCache(settings.token_cache_size)
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Awaitable, Callable, Optional
+
+from redis.exceptions import RedisError
+
+from src.database.models import User, Role
+from src.conf.config import settings
+from src.database.redis_db import get_redis
+from src.services.cache_codec import RecordCodec
+from src.services.token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+codec = RecordCodec(User, 2, ('id', 'username', 'email', 'avatar', 'avatar_hash', 'roles', 'confirmed'),
+                    encoders={'roles': attrgetter('value')}, decoders={'roles': Role})
+INVALIDATION_CHANNEL = 'user-cache:invalidate'
+
+
+class LocalCache:
+    """
+    In-process LRU of cached user payloads with a TTL and a memory budget.
+    It holds the serialized payloads (not User instances), so entries are never shared between requests.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_bytes: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    @staticmethod
+    def entry_size(email: str, payload: str) -> int:
+        return sys.getsizeof(email) + sys.getsizeof(payload)
+
+    def get(self, email: str) -> Optional[str]:
+        entry = self.entries.get(email)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            self.pop(email)
+            return None
+        self.entries.move_to_end(email)
+        return payload
+
+    def put(self, email: str, payload: str) -> None:
+        size = self.entry_size(email, payload)
+        if size > self.max_bytes or not self.max_entries:
+            return
+        self.pop(email)
+        self.entries[email] = (time.monotonic() + self.ttl, payload)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.pop(oldest)
+            self.evictions += 1
+
+    def pop(self, email: str) -> None:
+        entry = self.entries.pop(email, None)
+        if entry is not None:
+            self.size -= self.entry_size(email, entry[1])
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+
+class UserCache:
+    """
+    Two level cache of the users resolved by Auth.get_current_user: a short lived in-process LRU (L1)
+    in front of Redis (L2).
+
+    Only the fields the routes read are stored, as a versioned JSON array, never the ORM instance itself.
+    Every Redis error is treated as a cache miss, so authentication keeps working (from the database)
+    while Redis is unavailable.
+
+    A changed user is deleted from Redis and announced on INVALIDATION_CHANNEL, so every worker listening
+    (see listen) drops its L1 entry. Messages lost while the subscription is down are covered by the L1 TTL,
+    and the whole L1 is cleared when the subscription is re-established.
+    """
+
+    def __init__(self, ttl: int = 900, prefix: str = 'user', local_size: int = 10000, local_ttl: float = 5,
+                 local_max_bytes: int = 8 * 2 ** 20):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local = LocalCache(local_size, local_ttl, local_max_bytes)
+        # incremented on every invalidation, a load that saw it change does not fill L1
+        self.generation = 0
+        self.counters = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def key(self, email: str) -> str:
+        return f'{self.prefix}:{email}'
+
+    @staticmethod
+    def dumps(user: User) -> str:
+        """
+        The dumps function serializes the cached fields of the user.
+
+        :param user: User: User loaded from the database
+        :return: JSON string
+        """
+        return codec.dumps(*codec.row(user))
+
+    @staticmethod
+    def loads(payload) -> Optional[User]:
+        """
+        The loads function rebuilds a detached User from the cached fields.
+
+        :param payload: str | bytes: Cached value
+        :return: User or None when the value was written by another cache version
+        """
+        try:
+            return codec.build(codec.loads(payload))
+        except ValueError:
+            return None
+
+    async def get_or_load(self, email: str, loader: Callable[[], Awaitable[Optional[User]]]) -> Optional[User]:
+        """
+        The get_or_load function returns the user from L1, then from Redis, then from loader,
+        filling the levels it missed.
+
+        :param email: str: Email of the user
+        :param loader: Callable: Coroutine function loading the user from the database
+        :return: User or None when loader did not find it
+        """
+        payload = self.local.get(email)
+        if payload is not None:
+            self.counters['l1_hits'] += 1
+            return self.loads(payload)
+        generation = self.generation
+        user = await self.get(email)
+        if user is not None:
+            self.counters['l2_hits'] += 1
+        else:
+            self.counters['misses'] += 1
+            user = await loader()
+            if user is None:
+                return None
+            await self.set(user)
+        # an invalidation seen while loading may not be reflected in the loaded value
+        if generation == self.generation:
+            self.local.put(email, self.dumps(user))
+        return user
+
+    async def get(self, email: str) -> Optional[User]:
+        """
+        The get function returns the user cached in Redis.
+
+        :param email: str: Email of the user
+        :return: User or None on a miss
+        """
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            payload = await client.get(self.key(email))
+        except RedisError as err:
+            logger.warning('User cache read failed: %s', err)
+            return None
+        if payload is None:
+            return None
+        try:
+            return self.loads(payload)
+        except (ValueError, TypeError):
+            return None
+
+    async def set(self, user: User) -> None:
+        """
+        The set function caches the user in Redis; value and expiry are written by one SET ... EX command.
+
+        :param user: User: User loaded from the database
+        :return: None
+        """
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            await client.set(self.key(user.email), self.dumps(user), ex=self.ttl)
+        except RedisError as err:
+            logger.warning('User cache write failed: %s', err)
+
+    def drop_local(self, email: str) -> None:
+        self.generation += 1
+        self.counters['invalidations'] += 1
+        self.local.pop(email)
+        # the tokens of the user are checked against the changed row again
+        token_cache.invalidate(email)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function drops the cached user everywhere, it is called after every change of the user row.
+        The Redis delete and the announcement to the other workers go in one pipeline round trip.
+
+        :param email: str: Email of the user
+        :return: None
+        """
+        self.drop_local(email)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.delete(self.key(email))
+                pipe.publish(INVALIDATION_CHANNEL, email)
+                await pipe.execute()
+        except RedisError as err:
+            logger.warning('User cache invalidation failed: %s', err)
+
+    async def listen(self, retry_delay: float = 1) -> None:
+        """
+        The listen function drops L1 entries announced on INVALIDATION_CHANNEL by any worker.
+        It runs as a background task for the lifetime of the application and resubscribes after Redis errors.
+
+        :param retry_delay: float: Seconds to wait before resubscribing
+        :return: None
+        """
+        while True:
+            client = get_redis()
+            if client is None:
+                return
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # messages published while we were not subscribed are lost
+                    self.local.clear()
+                    self.generation += 1
+                    token_cache.clear()
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            email = message['data']
+                            self.drop_local(email.decode() if isinstance(email, bytes) else email)
+            except RedisError as err:
+                logger.warning('User cache invalidation channel failed: %s', err)
+                await asyncio.sleep(retry_delay)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the hit counters and the size of L1.
+
+        :return: Dictionary with the cache metrics
+        """
+        lookups = self.counters['l1_hits'] + self.counters['l2_hits'] + self.counters['misses']
+        return {
+            **self.counters,
+            'l1_hit_ratio': self.counters['l1_hits'] / lookups if lookups else 0.0,
+            'hit_ratio': (lookups - self.counters['misses']) / lookups if lookups else 0.0,
+            'l1_entries': len(self.local.entries),
+            'l1_bytes': self.local.size,
+            'l1_evictions': self.local.evictions,
+        }
+
+
+user_cache = UserCache(settings.user_cache_ttl, local_size=settings.user_cache_local_size,
+                       local_ttl=settings.user_cache_local_ttl, local_max_bytes=settings.user_cache_local_max_bytes)
@@ -0,0 +1,72 @@
+from datetime import date
+import unittest
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import birthday_people, birthday_sort_key
+
+
+class TestBirthdayPeople(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(bind=self.engine, expire_on_commit=False)()
+        self.user = User(id=1, email='owner@test.com', password='secret')
+        other = User(id=2, email='other@test.com', password='secret')
+        birthdays = {
+            'dec30': date(1990, 12, 30),
+            'jan02': date(1985, 1, 2),
+            'jan20': date(1985, 1, 20),
+            'feb29': date(2000, 2, 29),
+            'mar01': date(1999, 3, 1),
+        }
+        self.session.add_all([self.user, other])
+        self.session.add_all([Contact(firstname=name, lastname='Test', email=f'{name}@test.com', phone='1111',
+                                      birthday=birthday, additionally='', user_id=1)
+                              for name, birthday in birthdays.items()])
+        self.session.add(Contact(firstname='nobday', lastname='Test', email='nobday@test.com', phone='1111',
+                                 additionally='', user_id=1))
+        self.session.add(Contact(firstname='foreign', lastname='Test', email='foreign@test.com', phone='1111',
+                                 birthday=date(1990, 12, 31), additionally='', user_id=2))
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def names(self, **kwargs):
+        params = dict(limit=10, offset=0, user=self.user, db=self.session)
+        params.update(kwargs)
+        return [c.firstname for c in await birthday_people(**params)]
+
+    async def test_window_crosses_new_year(self):
+        result = await self.names(today=date(2023, 12, 28), days=7)
+        self.assertEqual(result, ['dec30', 'jan02'])
+
+    async def test_feb29_in_non_leap_year(self):
+        result = await self.names(today=date(2023, 2, 25), days=7)
+        self.assertEqual(result, ['feb29', 'mar01'])
+
+    async def test_window_length(self):
+        self.assertEqual(await self.names(today=date(2023, 1, 2), days=0), ['jan02'])
+        self.assertEqual(await self.names(today=date(2023, 1, 2), days=30), ['jan02', 'jan20'])
+
+    async def test_whole_year_from_today(self):
+        result = await self.names(today=date(2023, 3, 1), days=366)
+        self.assertEqual(result, ['mar01', 'dec30', 'jan02', 'jan20', 'feb29'])
+
+    async def test_keyset_pages(self):
+        today = date(2023, 12, 28)
+        first = await birthday_people(2, 0, self.user, self.session, days=70, today=today)
+        self.assertEqual([c.firstname for c in first], ['dec30', 'jan02'])
+        after = (birthday_sort_key(first[-1].birthday_md, today), first[-1].id)
+        result = await self.names(limit=2, after=after, days=70, today=today)
+        self.assertEqual(result, ['jan20', 'feb29'])
+
+
+if __name__ == '__main__':
+    unittest.main()
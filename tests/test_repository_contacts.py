@@ -1,19 +1,23 @@
 from datetime import datetime, date
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contact, User
 from src.schemas import ContactModel
 from src.repository.contacts import create_contact, find_contacts_by_name, get_contacts, get_contact_by_email, \
     get_contact_by_id, remove_contact, \
-    update_contact
+    update_contact, update_contacts
 
 
 class TestContactsRepo(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
         self.contact = Contact(id=1)
         self.body = ContactModel(
@@ -27,64 +31,126 @@ class TestContactsRepo(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_contact(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query(Contact).filter().limit().offset().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await get_contacts(user=self.user, limit=10, offset=0, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contact_after_id(self):
+        contacts = [Contact(id=11), Contact(id=12)]
+        self.result.scalars().all.return_value = contacts
+        result = await get_contacts(user=self.user, limit=10, offset=30, db=self.session, after_id=10)
+        self.assertEqual(result, contacts)
+        stmt = str(self.session.execute.call_args.args[0])
+        self.assertIn("contacts.id >", stmt)
+        self.assertNotIn("OFFSET", stmt)
+
+    def executed_sql(self) -> str:
+        stmt = self.session.execute.call_args.args[0]
+        return str(stmt.compile(dialect=sqlite.dialect()))
+
     async def test_create_contact(self):
+        contact = Contact(**self.body.dict(), id=1, user_id=self.user.id)
+        self.result.scalar_one_or_none.return_value = contact
         result = await create_contact(self.body, self.user, self.session)
-        print(result)
-        self.assertEqual(result.firstname, self.body.firstname)
-        self.assertEqual(result.lastname, self.body.lastname)
-        self.assertEqual(result.email, self.body.email)
-        self.assertEqual(result.phone, self.body.phone)
-        self.assertEqual(result.birthday, self.body.birthday)
-        self.assertTrue(hasattr(result, 'user_id'))
-        self.assertTrue(hasattr(result, 'id'))
-        self.assertEqual(result.user_id, 1)
-        self.assertEqual(result.additionally, self.body.additionally)
+        self.assertEqual(result, contact)
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
+        sql = self.executed_sql()
+        self.assertIn('INSERT INTO contacts', sql)
+        self.assertIn('ON CONFLICT (email) DO NOTHING RETURNING', sql)
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual((params['user_id'], params['birthday_md']), (1, 720))
+
+    async def test_create_contact_existing_email(self):
+        self.result.scalar_one_or_none.return_value = None
+        self.assertIsNone(await create_contact(self.body, self.user, self.session))
+        self.session.commit.assert_not_awaited()
 
     async def test_update_contact(self):
-        self.session.query().filter().first.return_value = self.contact
+        self.result.scalar_one_or_none.return_value = self.contact
         result = await update_contact(contact_id=self.contact.id, body=self.body, user=self.user, db=self.session)
-        self.assertEqual(result.id, self.contact.id)
-        self.assertEqual(result.firstname, self.body.firstname)
+        self.assertEqual(result, self.contact)
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
+        sql = self.executed_sql()
+        self.assertTrue(sql.startswith('UPDATE contacts SET'))
+        self.assertIn('RETURNING', sql)
+
+    async def test_update_contact_existing_email(self):
+        self.session.execute.side_effect = IntegrityError('UPDATE', {}, Exception('UNIQUE constraint failed'))
+        with self.assertRaises(IntegrityError):
+            await update_contact(contact_id=self.contact.id, body=self.body, user=self.user, db=self.session)
+        self.session.rollback.assert_awaited_once()
 
     async def test_update_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await update_contact(contact_id=self.contact.id, body=self.body, user=self.user, db=self.session)
         self.assertIsNone(result)
 
+    async def test_update_contacts_filters_on_owner(self):
+        self.result.scalars().all.side_effect = [[1], [self.contact]]
+        self.result.all.return_value = []
+        updated, conflicts = await update_contacts({1: {'phone': '380501112233'}}, self.user, self.session)
+        self.assertEqual((updated, conflicts), ([self.contact], set()))
+        stmt = self.session.execute.call_args_list[1].args[0]
+        self.assertIn('contacts.user_id = ?', str(stmt.compile(dialect=sqlite.dialect())))
+
+    async def test_update_contacts_email_taken_meanwhile(self):
+        other = Contact(id=2)
+        owned, taken, updated = MagicMock(), MagicMock(), MagicMock()
+        owned.scalars().all.return_value = [1, 2]
+        taken.all.return_value = []
+        updated.scalars().all.return_value = [other]
+        self.session.execute.side_effect = [owned, taken, IntegrityError('UPDATE', {}, Exception('UNIQUE')),
+                                            self.result, updated]
+        result = await update_contacts({1: {'email': 'taken@example.com'}, 2: {'phone': '380501112233'}},
+                                       self.user, self.session)
+        self.assertEqual(result, ([other], {1}))
+        self.session.rollback.assert_awaited_once()
+        # the change without an email is applied again after the rollback
+        self.assertEqual(self.session.execute.call_args_list[3].args[1], [{'phone': '380501112233', 'contact_id': 2}])
+        self.session.commit.assert_awaited_once()
+
     async def test_find_contact_by_email(self):
         contact = Contact(**self.body.dict())
-        self.session.query().filter().first.return_value = contact
+        self.result.scalar_one_or_none.return_value = contact
         result = await get_contact_by_email(email=self.body.email, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_find_contact_by_email_not_found(self):
         contact = Contact(**self.body.dict())
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await get_contact_by_email(email=self.body.email, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_find_contact_by_id(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalar_one_or_none.return_value = contact
         result = await get_contact_by_id(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_find_contact_by_name(self):
         contacts = [Contact(**self.body.dict()), Contact()]
-        self.session.query().filter().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await find_contacts_by_name(firstname=None, lastname=self.body.lastname, user=self.user,
                                              db=self.session)
         self.assertEqual(result, contacts)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertNotIn('None', str(stmt.compile(compile_kwargs={"literal_binds": True})))
+        self.assertNotIn('contacts.firstname LIKE', str(stmt))
+
+    async def test_find_contact_by_name_without_names(self):
+        result = await find_contacts_by_name(firstname=None, lastname=None, user=self.user, db=self.session)
+        self.assertEqual(result, [])
+        self.session.execute.assert_not_called()
 
     async def test_remove_contact(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalar_one_or_none.return_value = contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
+        self.session.execute.assert_awaited_once()
+        self.assertTrue(self.executed_sql().startswith('DELETE FROM contacts'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,67 @@
+import unittest
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import search_contacts, find_contacts_by_name
+
+
+class TestSearchContacts(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(bind=self.engine, expire_on_commit=False)()
+        self.user = User(id=1, email='owner@test.com', password='secret')
+        self.session.add_all([self.user, User(id=2, email='other@test.com', password='secret')])
+        rows = [
+            ('Annabel', 'Smith', 'annabel@test.com', '380501112233', 'met in Kyiv', 1),
+            ('Anna', 'Brown', 'brown@test.com', '380507778899', '', 1),
+            ('Joanna', 'Anderson', 'jo@test.com', '380509990000', 'likes 100% cotton', 1),
+            ('Oleh', 'Kyivsky', 'oleh@test.com', '380671234567', None, 1),
+            ('Anna', 'Foreign', 'foreign@test.com', '380000000000', '', 2),
+        ]
+        self.session.add_all([Contact(firstname=f, lastname=l, email=e, phone=p, additionally=a, user_id=u)
+                              for f, l, e, p, a, u in rows])
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def search(self, query, limit=10, offset=0):
+        return [c.email for c in await search_contacts(query, limit, offset, self.user, self.session)]
+
+    async def test_ranked_by_name_match(self):
+        result = await self.search('anna')
+        self.assertEqual(result, ['brown@test.com', 'annabel@test.com', 'jo@test.com'])
+
+    async def test_every_word_must_match(self):
+        self.assertEqual(await self.search('anna kyiv'), ['annabel@test.com'])
+
+    async def test_search_phone_and_additionally(self):
+        self.assertEqual(await self.search('067123'), ['oleh@test.com'])
+        self.assertEqual(await self.search('KYIV'), ['oleh@test.com', 'annabel@test.com'])
+
+    async def test_wildcards_are_literal(self):
+        self.assertEqual(await self.search('100%'), ['jo@test.com'])
+        self.assertEqual(await self.search('%'), ['jo@test.com'])
+        self.assertEqual(await self.search('_'), [])
+
+    async def test_pagination(self):
+        self.assertEqual(await self.search('anna', limit=2, offset=1), ['annabel@test.com', 'jo@test.com'])
+
+    async def test_blank_query(self):
+        self.assertEqual(await self.search('   '), [])
+
+    async def test_find_by_one_name(self):
+        result = await find_contacts_by_name('anna', None, self.user, self.session)
+        self.assertEqual([c.email for c in result], ['annabel@test.com', 'brown@test.com', 'jo@test.com'])
+        result = await find_contacts_by_name(None, 'smi', self.user, self.session)
+        self.assertEqual([c.email for c in result], ['annabel@test.com'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,9 @@
 import datetime
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel, TokenModel
@@ -10,59 +11,99 @@ from src.repository.users import (
     get_user_by_email,
     create_user,
     update_token,
+    update_password,
     confirmed_email,
     update_avatar,
+    get_avatar_by_hash,
 )
 
 
 class TestUsersRepo(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User()
 
     async def test_get_user_by_email(self):
         user = User()
-        self.session.query().filter_by().first.return_value = user
+        self.result.scalar_one_or_none.return_value = user
         result = await get_user_by_email(email='test@gmail.com', db=self.session)
         self.assertEqual(result, user)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter_by().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await get_user_by_email(email=self.user.email, db=self.session)
         self.assertIsNone(result)
 
+    def executed_sql(self) -> str:
+        stmt = self.session.execute.call_args.args[0]
+        return str(stmt.compile(dialect=sqlite.dialect()))
+
     async def test_create_user(self):
         body = UserModel(username='Koko', email='kkok@test.com', password='qwerty23')
+        self.result.scalar_one_or_none.return_value = self.user
         result = await create_user(body=body, db=self.session)
-        self.assertEqual(result.username, body.username)
-        self.assertEqual(result.email, body.email)
-        self.assertTrue(hasattr(result, "id"))
-        self.assertTrue(hasattr(result, "roles"))
+        self.assertEqual(result, self.user)
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
+        self.assertIn('ON CONFLICT (email) DO NOTHING RETURNING', self.executed_sql())
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual((params['username'], params['email']), ('Koko', 'kkok@test.com'))
+        self.assertIn('gravatar', params['avatar'])
+
+    async def test_create_user_existing_email(self):
+        body = UserModel(username='Koko', email='kkok@test.com', password='qwerty23')
+        self.result.scalar_one_or_none.return_value = None
+        self.assertIsNone(await create_user(body=body, db=self.session))
+        self.session.commit.assert_not_awaited()
 
     async def test_update_token(self):
-        self.session.query().filter().first.return_value = self.user
+        self.result.scalar_one_or_none.return_value = self.user
         self.session.commit.return_value = None
         token = 'refresh_token'
         await update_token(user=self.user, refresh_token=token, db=self.session)
         self.assertTrue(self.user.refresh_token)
         self.assertEqual(self.user.refresh_token, token)
 
+    async def test_update_password(self):
+        await update_password(user=self.user, hashed_password='$2b$12$hash', db=self.session)
+        self.assertEqual(self.user.password, '$2b$12$hash')
+        self.session.commit.assert_awaited_once()
+
     async def test_confirmed_user(self):
-        self.session.query().filter_by().first.return_value = self.user
-        self.session.commit.return_value = None
-        email = 'kkok@test.com'
-        await confirmed_email(email=email, db=self.session)
-        self.assertTrue(self.user.confirmed)
+        self.result.scalar_one_or_none.return_value = 1
+        self.assertTrue(await confirmed_email(email='kkok@test.com', db=self.session))
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
+        sql = self.executed_sql()
+        self.assertTrue(sql.startswith('UPDATE users SET confirmed'))
+        self.assertIn('users.confirmed IS NOT 1', sql)
+
+    async def test_confirmed_user_unchanged(self):
+        self.result.scalar_one_or_none.return_value = None
+        self.assertFalse(await confirmed_email(email='kkok@test.com', db=self.session))
+        self.session.commit.assert_not_awaited()
 
     async def test_update_avatar(self):
-        user = User(email="kkok@test.com", avatar="www.tort.com")
-        self.session.query().filter_by().first.return_value = self.user
-        url = 'www.vip.com'
-        result = await update_avatar(email=self.user.email, url=url, db=self.session)
-        self.assertEqual(result.avatar, url)
-        self.assertEqual(result.avatar, self.user.avatar)
-        self.assertTrue(user.avatar, "www.vip.com")
+        self.result.scalar_one_or_none.return_value = self.user
+        result = await update_avatar(email='kkok@test.com', url='www.vip.com', db=self.session)
+        self.assertEqual(result, self.user)
+        self.session.execute.assert_awaited_once()
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual((params['avatar'], params['avatar_hash']), ('www.vip.com', None))
+
+    async def test_update_avatar_with_hash(self):
+        self.result.scalar_one_or_none.return_value = self.user
+        await update_avatar(email='kkok@test.com', url='www.vip.com', db=self.session, avatar_hash='ab' * 32)
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual(params['avatar_hash'], 'ab' * 32)
+
+    async def test_get_avatar_by_hash(self):
+        self.result.scalar_one_or_none.return_value = 'www.vip.com'
+        result = await get_avatar_by_hash(avatar_hash='ab' * 32, db=self.session)
+        self.assertEqual(result, 'www.vip.com')
 
 
 if __name__ == '__main__':
@@ -1,11 +1,16 @@
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock
+
+from jose import jwt
+from sqlalchemy import update
 
 from src.database.models import User
+from src.services.auth import auth_service, user_version
+from src.services.passwords import PasswordHasher
 
 
 def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    mock_enqueue = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.job_queue.enqueue", mock_enqueue)
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -13,6 +18,8 @@ def test_create_user(client, user, monkeypatch):
     assert response.status_code == 201, response.text
     data = response.json()
     assert data["email"] == user.get("email")
+    mock_enqueue.assert_awaited_once_with("send_email", email=user["email"], username=user["username"],
+                                          host="http://testserver/")
     # assert "id" in data["user"]
 
 
@@ -49,6 +56,39 @@ def test_login_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
+def test_login_rehashes_password_with_other_cost(client, session, user):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.password = PasswordHasher(rounds=4).context.hash(user.get('password'))
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    session.expire_all()
+    current_user = session.query(User).filter(User.email == user.get('email')).first()
+    assert current_user.password.startswith(f"$2b${auth_service.hasher.rounds:02d}$")
+
+
+def test_access_token_carries_role_claims(client, session, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    token = response.json()["access_token"]
+    claims = jwt.decode(token, auth_service.SECRET_KEY, algorithms=[auth_service.ALGORITHM])
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    assert claims["uid"] == current_user.id
+    assert claims["role"] == current_user.roles.value
+    assert claims["ver"] == user_version(current_user)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/search/", params={"q": "nobody"}, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.delete("/api/contacts/1", headers=headers)
+    assert response.status_code == 403, response.text
+
+
 def test_login_wrong_password(client, user):
     response = client.post(
         "/api/auth/login",
@@ -69,3 +109,36 @@ def test_login_wrong_email(client, user):
     assert data["detail"] == "Invalid email"
 
 
+
+
+def test_confirmed_email(client, session):
+    session.add(User(username="confirm", email="confirm@example.com", password="secret"))
+    session.commit()
+    token = auth_service.create_email_token({"sub": "confirm@example.com"})
+    response = client.get(f"/api/auth/confirmed_email/{token}")
+    assert response.status_code == 200, response.text
+    assert response.json()["message"] == "Email confirmed"
+    response = client.get(f"/api/auth/confirmed_email/{token}")
+    assert response.json()["message"] == "Your email is already confirmed"
+
+    token = auth_service.create_email_token({"sub": "nobody@example.com"})
+    response = client.get(f"/api/auth/confirmed_email/{token}")
+    assert response.status_code == 400, response.text
+
+
+def test_login_user_without_role(client, session):
+    password = "no-role-password"
+    session.add(User(username="norole", email="norole@example.com", confirmed=True,
+                     password=PasswordHasher(rounds=4).context.hash(password)))
+    session.commit()
+    # rows created before the role column was added have no role
+    session.execute(update(User).where(User.email == "norole@example.com").values(roles=None))
+    session.commit()
+    response = client.post("/api/auth/login", data={"username": "norole@example.com", "password": password})
+    assert response.status_code == 200, response.text
+    tokens = response.json()
+    claims = jwt.decode(tokens["access_token"], auth_service.SECRET_KEY, algorithms=[auth_service.ALGORITHM])
+    assert claims["role"] == ""
+
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 200, response.text
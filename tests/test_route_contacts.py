@@ -0,0 +1,178 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from fakeredis import aioredis, FakeServer
+
+from main import app
+from src.database.models import User, Role
+from src.services.auth import auth_service, Principal
+from src.services.fast_json import contacts_json
+
+
+@pytest.fixture(scope="module")
+def current_user(client, session):
+    owner = User(username="owner", email="owner@example.com", password="secret", confirmed=True, roles=Role.user)
+    session.add(owner)
+    session.commit()
+    session.refresh(owner)
+    app.dependency_overrides[auth_service.get_principal] = lambda: Principal.from_user(owner)
+    yield owner
+    app.dependency_overrides.pop(auth_service.get_principal)
+
+
+def test_import_contacts(client, current_user):
+    data = (b"firstname,lastname,email,phone,birthday,additionally\n"
+            b"Olena,Petrenko,olena@example.com,380501112233,1990-02-28,friend\n"
+            b"O,Short,short@example.com,380501112233,,\n"
+            b"Taras,Shevchenko,taras@example.com,380671234567,,\n")
+    response = client.post("/api/contacts/import/", files={"file": ("book.csv", data, "text/csv")})
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["imported"], report["duplicates"], report["failed"]) == (2, 0, 1)
+    assert report["errors"][0]["row"] == 3
+
+    response = client.post("/api/contacts/import/", files={"file": ("book.csv", data, "text/csv")})
+    report = response.json()
+    assert (report["imported"], report["duplicates"], report["failed"]) == (0, 2, 1)
+    assert [row["email"] for row in report["duplicate_rows"]] == ["olena@example.com", "taras@example.com"]
+
+    response = client.get("/api/contacts/email/olena@example.com")
+    assert response.status_code == 200, response.text
+    assert response.json()["birthday"] == "1990-02-28"
+
+
+def test_import_unknown_format(client, current_user):
+    response = client.post("/api/contacts/import/", files={"file": ("book.txt", b"data", "text/plain")})
+    assert response.status_code == 422, response.text
+
+
+def test_export_ndjson(client, current_user):
+    response = client.get("/api/contacts/export/", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "content-encoding" not in response.headers
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["email"] for row in rows] == ["olena@example.com", "taras@example.com"]
+    assert rows[0]["birthday"] == "1990-02-28"
+
+    response = client.get("/api/contacts/export/", params={"since_id": rows[0]["id"]},
+                          headers={"Accept-Encoding": "identity"})
+    assert [json.loads(line)["email"] for line in response.text.splitlines()] == ["taras@example.com"]
+
+
+def test_export_gzip_csv(client, current_user):
+    response = client.get("/api/contacts/export/", params={"format": "csv"}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-disposition"] == 'attachment; filename="contacts.csv"'
+    lines = response.text.splitlines()
+    assert lines[0] == "id,firstname,lastname,email,phone,birthday,additionally"
+    assert len(lines) == 3
+
+
+def test_export_empty_vcard(client, current_user):
+    response = client.get("/api/contacts/export/", params={"format": "vcard", "since_id": 10 ** 6})
+    assert response.status_code == 200, response.text
+    assert response.content == b""
+
+
+def test_conditional_get(client, current_user):
+    server = FakeServer()
+    # TestClient runs every request in a new event loop, the client must be created in it
+    with patch("src.services.conditional.get_redis",
+               side_effect=lambda: aioredis.FakeRedis(server=server, decode_responses=True)):
+        contact_id = client.get("/api/contacts/email/olena@example.com").json()["id"]
+        response = client.get(f"/api/contacts/{contact_id}")
+        assert response.status_code == 200, response.text
+        etag = response.headers["etag"]
+
+        response = client.get(f"/api/contacts/{contact_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        body = {"firstname": "Olena", "lastname": "Petrenko", "email": "olena@example.com",
+                "phone": "380501112233", "birthday": "1990-02-28", "additionally": "changed"}
+        response = client.put(f"/api/contacts/{contact_id}", json=body)
+        assert response.status_code == 200, response.text
+        response = client.get(f"/api/contacts/{contact_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["additionally"] == "changed"
+        assert response.headers["etag"] != etag
+
+
+def test_fast_json(client, current_user):
+    params = {"q": "example"}
+    expected = client.get("/api/contacts/search/", params=params)
+    assert expected.status_code == 200, expected.text
+    with patch.object(contacts_json, "enabled", True):
+        response = client.get("/api/contacts/search/", params=params)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == expected.content
+    assert len(response.json()) == 2
+
+
+def test_batch_get(client, current_user):
+    olena = client.get("/api/contacts/email/olena@example.com").json()
+    response = client.post("/api/contacts/batch/get", json={"ids": [olena["id"], 999999, olena["id"]]})
+    assert response.status_code == 200, response.text
+    items = response.json()["items"]
+    assert [(item["id"], item["status"]) for item in items] == [(olena["id"], 200), (999999, 404), (olena["id"], 200)]
+    assert items[0]["contact"]["email"] == "olena@example.com"
+    assert client.post("/api/contacts/batch/get", json={"ids": []}).status_code == 422
+
+
+def test_batch_update(client, current_user):
+    olena = client.get("/api/contacts/email/olena@example.com").json()
+    taras = client.get("/api/contacts/email/taras@example.com").json()
+    response = client.post("/api/contacts/batch/update", json={"items": [
+        {"id": olena["id"], "phone": "380509998877", "birthday": None},
+        {"id": taras["id"], "email": "olena@example.com"},
+        {"id": 999999, "additionally": "x"},
+        {"id": olena["id"], "additionally": "twice"},
+    ]})
+    assert response.status_code == 200, response.text
+    items = response.json()["items"]
+    assert [item["status"] for item in items] == [200, 409, 404, 409]
+    assert items[0]["contact"]["phone"] == "380509998877"
+    assert items[0]["contact"]["birthday"] is None
+    assert items[0]["contact"]["additionally"] == olena["additionally"]
+    assert client.get(f"/api/contacts/{taras['id']}").json()["email"] == "taras@example.com"
+
+    response = client.post("/api/contacts/batch/update", json={"items": [{"id": olena["id"], "firstname": None}]})
+    assert response.status_code == 422
+
+
+def test_batch_delete(client, current_user):
+    ids = [client.post("/api/contacts/", json={
+        "firstname": f"Batch{n}", "lastname": "Delete", "email": f"batch{n}@example.com", "phone": "380501112233",
+        "birthday": None, "additionally": ""}).json()["id"] for n in range(3)]
+    assert client.post("/api/contacts/batch/delete", json={"ids": ids}).status_code == 403
+
+    current_user.roles = Role.admin
+    app.dependency_overrides[auth_service.get_principal] = lambda: Principal.from_user(current_user)
+    try:
+        response = client.post("/api/contacts/batch/delete", json={"ids": ids + [ids[0]]})
+    finally:
+        current_user.roles = Role.user
+        app.dependency_overrides[auth_service.get_principal] = lambda: Principal.from_user(current_user)
+    assert response.status_code == 200, response.text
+    assert [item["status"] for item in response.json()["items"]] == [204, 204, 204, 404]
+    assert client.get(f"/api/contacts/{ids[0]}").status_code == 404
+
+
+def test_email_conflicts(client, current_user):
+    body = {"firstname": "Conflict", "lastname": "Test", "email": "olena@example.com", "phone": "380501112233",
+            "birthday": None, "additionally": ""}
+    response = client.post("/api/contacts/", json=body)
+    assert response.status_code == 409, response.text
+
+    response = client.post("/api/contacts/", json={**body, "email": "conflict@example.com"})
+    assert response.status_code == 201, response.text
+    contact_id = response.json()["id"]
+    response = client.put(f"/api/contacts/{contact_id}", json=body)
+    assert response.status_code == 409, response.text
+    assert client.get(f"/api/contacts/{contact_id}").json()["email"] == "conflict@example.com"
+    response = client.put("/api/contacts/999999", json={**body, "email": "missing@example.com"})
+    assert response.status_code == 404, response.text
@@ -0,0 +1,85 @@
+import io
+from unittest.mock import MagicMock
+
+import pytest
+from PIL import Image
+
+from main import app
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.avatars import avatar_pipeline
+
+
+@pytest.fixture(scope="module")
+def current_user(client, session):
+    owner = User(username="avatar", email="avatar@example.com", password="secret", confirmed=True)
+    session.add(owner)
+    session.commit()
+    session.refresh(owner)
+    app.dependency_overrides[auth_service.get_current_user] = lambda: owner
+    yield owner
+    app.dependency_overrides.pop(auth_service.get_current_user)
+
+
+@pytest.fixture()
+def uploader(monkeypatch):
+    uploader = MagicMock()
+    uploader.upload.return_value = {"version": 1, "secure_url": "https://res.cloudinary.com/avatar.jpg"}
+    monkeypatch.setattr(avatar_pipeline, "uploader", uploader)
+    return uploader
+
+
+def photo(color: str) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (2000, 1500), color).save(output, "JPEG")
+    return output.getvalue()
+
+
+def test_update_avatar(client, session, current_user, uploader):
+    response = client.patch("/api/users/avatar", files={"file": ("photo.jpg", photo("green"), "image/jpeg")})
+    assert response.status_code == 200, response.text
+    assert response.json()["avatar"] == "https://res.cloudinary.com/avatar.jpg"
+    session.refresh(current_user)
+    uploaded, public_id = uploader.upload.call_args.args
+    assert public_id == f"QuotesApp/avatars/{current_user.avatar_hash}"
+    assert Image.open(uploaded).size == (250, 250)
+
+
+def test_same_avatar_is_not_uploaded_again(client, session, current_user, uploader):
+    # an image no other test uploads, so the first upload here is stored
+    response = client.patch("/api/users/avatar", files={"file": ("photo.jpg", photo("navy"), "image/jpeg")})
+    assert response.status_code == 200, response.text
+    uploader.upload.assert_called_once()
+    uploader.upload.reset_mock()
+    session.refresh(current_user)
+
+    response = client.patch("/api/users/avatar", files={"file": ("photo.jpg", photo("navy"), "image/jpeg")})
+    assert response.status_code == 200, response.text
+    assert response.json()["avatar"] == "https://res.cloudinary.com/avatar.jpg"
+    uploader.upload.assert_not_called()
+
+    # another user uploading the same image gets the stored avatar
+    other = User(username="other", email="other@example.com", password="secret", confirmed=True)
+    session.add(other)
+    session.commit()
+    app.dependency_overrides[auth_service.get_current_user] = lambda: other
+    try:
+        response = client.patch("/api/users/avatar", files={"file": ("copy.jpg", photo("navy"), "image/jpeg")})
+    finally:
+        app.dependency_overrides[auth_service.get_current_user] = lambda: current_user
+    assert response.status_code == 200, response.text
+    assert response.json()["avatar"] == "https://res.cloudinary.com/avatar.jpg"
+    uploader.upload.assert_not_called()
+
+
+def test_update_avatar_not_an_image(client, current_user, uploader):
+    response = client.patch("/api/users/avatar", files={"file": ("photo.jpg", b"text", "image/jpeg")})
+    assert response.status_code == 400, response.text
+    uploader.upload.assert_not_called()
+
+
+def test_oversized_avatar_is_rejected_before_it_is_received(client, current_user, uploader):
+    data = b"\xff" * (avatar_pipeline.max_body_bytes + 1)
+    response = client.patch("/api/users/avatar", files={"file": ("huge.jpg", data, "image/jpeg")})
+    assert response.status_code == 413, response.text
+    uploader.upload.assert_not_called()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+
+from fastapi import HTTPException
+
+from src.database.models import User, Role
+from src.services import auth as auth_module
+from src.services.auth import auth_service, Principal, user_version
+from src.services.roles import RoleAccess
+
+
+class TestPrincipal(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        auth_service.token_cache.clear()
+        self.user = User(id=3, email='deadpool@example.com', roles=Role.moderator, confirmed=True)
+        self.loader = patch.object(auth_module.user_cache, 'get_or_load', AsyncMock(return_value=self.user))
+        self.get_or_load = self.loader.start()
+
+    def tearDown(self):
+        self.loader.stop()
+
+    async def test_principal_from_claims_without_user_load(self):
+        self.user.roles = Role.user
+        token = await auth_service.create_access_token(data=auth_service.user_claims(self.user))
+        for _ in range(3):
+            principal = await auth_service.get_principal(token, None)
+        self.assertEqual(principal, Principal(3, 'deadpool@example.com', Role.user, user_version(self.user)))
+        # only the first use of the token checks it against the user
+        self.get_or_load.assert_awaited_once()
+
+    async def test_cached_token_is_rejected_after_user_change(self):
+        self.user.roles = Role.user
+        token = await auth_service.create_access_token(data=auth_service.user_claims(self.user))
+        await auth_service.get_principal(token, None)
+        self.user.confirmed = False
+        await auth_module.user_cache.invalidate(self.user.email)
+        with self.assertRaises(HTTPException) as error:
+            await auth_service.get_principal(token, None)
+        self.assertEqual(error.exception.status_code, 401)
+
+    async def test_principal_with_extra_rights_checks_user(self):
+        token = await auth_service.create_access_token(data=auth_service.user_claims(self.user))
+        principal = await auth_service.get_principal(token, None)
+        self.assertEqual(principal, Principal(3, 'deadpool@example.com', Role.moderator, user_version(self.user)))
+        self.get_or_load.assert_awaited_once()
+
+    async def test_demoted_principal_is_rejected(self):
+        token = await auth_service.create_access_token(data=auth_service.user_claims(self.user))
+        self.user.roles = Role.user
+        with self.assertRaises(HTTPException) as error:
+            await auth_service.get_principal(token, None)
+        self.assertEqual(error.exception.status_code, 401)
+
+    async def test_principal_of_token_without_claims_loads_user(self):
+        token = await auth_service.create_access_token(data={'sub': self.user.email})
+        principal = await auth_service.get_principal(token, None)
+        self.assertEqual((principal.id, principal.roles), (3, Role.moderator))
+        self.get_or_load.assert_awaited_once()
+
+    async def test_stale_version_is_rejected(self):
+        token = await auth_service.create_access_token(data=auth_service.user_claims(self.user))
+        self.user.roles = Role.user
+        with self.assertRaises(HTTPException) as error:
+            await auth_service.get_current_user(token, None)
+        self.assertEqual(error.exception.status_code, 401)
+
+    async def test_role_access(self):
+        principal = Principal.from_user(self.user)
+        await RoleAccess([Role.moderator])(None, principal)
+        with self.assertRaises(HTTPException) as error:
+            await RoleAccess([Role.admin])(None, principal)
+        self.assertEqual(error.exception.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import unittest
+from unittest.mock import MagicMock
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from src.services.avatars import AvatarPipeline
+
+
+def image_bytes(size=(1200, 800), mode='RGB', image_format='JPEG', color='red') -> bytes:
+    output = io.BytesIO()
+    Image.new(mode, size, color).save(output, image_format)
+    return output.getvalue()
+
+
+def upload_file(data: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(data), size=len(data), filename='avatar.jpg')
+
+
+class TestAvatarPipeline(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.uploader = MagicMock()
+        self.uploader.upload.return_value = {'version': 42, 'secure_url': 'https://cdn/avatar.jpg'}
+        self.pipeline = AvatarPipeline(self.uploader, size=250, max_bytes=2 ** 20, max_pixels=10_000_000,
+                                       workers=1)
+
+    def tearDown(self):
+        self.pipeline.executor.shutdown()
+
+    def test_resize_crops_to_square_jpeg(self):
+        avatar = Image.open(io.BytesIO(self.pipeline.resize(io.BytesIO(image_bytes()))))
+        self.assertEqual((avatar.format, avatar.size, avatar.mode), ('JPEG', (250, 250), 'RGB'))
+
+    def test_resize_applies_exif_orientation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        # the left half is red, the right half blue; after the rotation the top is red
+        image = Image.new('RGB', (1000, 500), 'red')
+        image.paste(Image.new('RGB', (500, 500), 'blue'), (500, 0))
+        output = io.BytesIO()
+        image.save(output, 'JPEG', exif=exif)
+        avatar = Image.open(io.BytesIO(self.pipeline.resize(io.BytesIO(output.getvalue()))))
+        self.assertEqual(avatar.size, (250, 250))
+        red, green, blue = avatar.getpixel((125, 10))
+        self.assertGreater(red, blue)
+
+    def test_transparent_png_gets_white_background(self):
+        data = image_bytes(size=(300, 300), mode='RGBA', image_format='PNG', color=(0, 0, 0, 0))
+        avatar = Image.open(io.BytesIO(self.pipeline.resize(io.BytesIO(data))))
+        self.assertGreater(min(avatar.getpixel((125, 125))), 245)
+
+    def test_invalid_image(self):
+        with self.assertRaises(HTTPException) as error:
+            self.pipeline.resize(io.BytesIO(b'not an image'))
+        self.assertEqual(error.exception.status_code, 400)
+
+    def test_too_many_pixels(self):
+        self.pipeline.max_pixels = 1000
+        with self.assertRaises(HTTPException) as error:
+            self.pipeline.resize(io.BytesIO(image_bytes()))
+        self.assertEqual(error.exception.status_code, 413)
+
+    async def test_store_uploads_the_small_image(self):
+        data = image_bytes(size=(3000, 2000))
+        url = await self.pipeline.store(upload_file(data), 'avatars/abc')
+        self.assertEqual(url, 'https://cdn/avatar.jpg')
+        uploaded, public_id = self.uploader.upload.call_args.args
+        self.assertEqual(public_id, 'avatars/abc')
+        self.assertEqual(self.uploader.upload.call_args.kwargs, {'overwrite': False})
+        self.assertEqual(Image.open(uploaded).size, (250, 250))
+
+    async def test_digest_depends_on_content_and_settings(self):
+        data = image_bytes()
+        digest = await self.pipeline.digest(upload_file(data))
+        self.assertEqual(len(digest), 64)
+        self.assertEqual(await self.pipeline.digest(upload_file(data)), digest)
+        self.assertNotEqual(await self.pipeline.digest(upload_file(data + b'\0')), digest)
+        self.pipeline.size = 128
+        self.assertNotEqual(await self.pipeline.digest(upload_file(data)), digest)
+
+    async def test_store_rejects_large_upload(self):
+        self.pipeline.max_bytes = 100
+        with self.assertRaises(HTTPException) as error:
+            await self.pipeline.store(upload_file(image_bytes()), 'avatars/abc')
+        self.assertEqual(error.exception.status_code, 413)
+        self.uploader.upload.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from src.services.body_limit import BodySizeLimitMiddleware
+
+BOUNDARY = b"limit-boundary"
+
+
+def make_app(calls: list) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, limits={"/upload": 1000})
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File()):
+        calls.append(file.filename)
+        return {"size": len(await file.read())}
+
+    @app.post("/other")
+    async def other(file: UploadFile = File()):
+        return {"size": len(await file.read())}
+
+    return app
+
+
+def multipart(size: int) -> bytes:
+    return (b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n'
+            b"Content-Type: application/octet-stream\r\n\r\n" + b"x" * size + b"\r\n--" + BOUNDARY + b"--\r\n")
+
+
+def test_body_under_limit():
+    calls = []
+    response = TestClient(make_app(calls)).post("/upload", files={"file": ("a.bin", b"x" * 500)})
+    assert response.status_code == 200, response.text
+    assert response.json() == {"size": 500}
+    assert calls == ["a.bin"]
+
+
+def test_content_length_over_limit_is_rejected_before_reading():
+    calls = []
+    response = TestClient(make_app(calls)).post("/upload", files={"file": ("a.bin", b"x" * 2000)})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body must not exceed 1000 bytes"}
+    assert calls == []
+
+
+def test_other_paths_are_not_limited():
+    response = TestClient(make_app([])).post("/other", files={"file": ("a.bin", b"x" * 2000)})
+    assert response.status_code == 200
+
+
+def test_streamed_body_is_stopped_at_the_limit():
+    calls = []
+    app = make_app(calls)
+    body = multipart(10_000)
+    chunks = [body[start:start + 256] for start in range(0, len(body), 256)]
+    received = []
+    sent = []
+
+    async def receive():
+        chunk = chunks[len(received)]
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": len(received) < len(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/upload", "raw_path": b"/upload", "root_path": "",
+             "scheme": "http", "query_string": b"", "server": ("testserver", 80), "client": ("127.0.0.1", 1),
+             "http_version": "1.1",
+             # no Content-Length: the body is sent with Transfer-Encoding: chunked
+             "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)]}
+    asyncio.run(app(scope, receive, send))
+
+    assert sent[0]["status"] == 413
+    assert calls == []
+    assert len(received) == 4
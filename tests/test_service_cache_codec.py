@@ -0,0 +1,36 @@
+import unittest
+from datetime import date
+
+from src.database.models import Contact
+from src.services.cache_codec import RecordCodec
+
+
+class TestRecordCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = RecordCodec(Contact, 3, ('id', 'firstname', 'birthday'),
+                                 encoders={'birthday': date.isoformat}, decoders={'birthday': date.fromisoformat})
+
+    def test_round_trip(self):
+        contact = Contact(id=1, firstname='Олена', birthday=date(1990, 5, 17))
+        payload = self.codec.dumps(self.codec.row(contact))
+        self.assertEqual(payload, '[3,[1,"Олена","1990-05-17"]]')
+        [values] = self.codec.loads(payload)
+        restored = self.codec.build(values)
+        self.assertEqual((restored.id, restored.firstname, restored.birthday), (1, 'Олена', date(1990, 5, 17)))
+
+    def test_none_is_not_encoded(self):
+        self.assertEqual(self.codec.row(Contact(id=2, firstname='Ivan')), [2, 'Ivan', None])
+        self.assertIsNone(self.codec.build([2, 'Ivan', None]).birthday)
+
+    def test_other_version_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.codec.loads('[2,[1,"Ivan",null]]')
+
+    def test_other_fields_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.codec.build([1, 'Ivan'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from email.utils import formatdate
+from unittest.mock import patch
+
+from fakeredis import aioredis, FakeServer
+from fastapi import Response
+from starlette.requests import Request
+
+from src.database.redis_db import init_redis
+from src.services.conditional import Version, conditional_get, contact_versions, etag_matches, not_modified_since
+
+
+def make_request(**headers) -> Request:
+    raw = [(name.replace('_', '-').encode(), value.encode()) for name, value in headers.items()]
+    return Request({'type': 'http', 'method': 'GET', 'path': '/api/contacts/', 'headers': raw})
+
+
+class TestConditional(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = aioredis.FakeRedis(server=FakeServer(), decode_responses=True)
+        init_redis(self.redis)
+
+    def tearDown(self):
+        init_redis(None)
+
+    def test_etag_matches(self):
+        etag = 'W/"1-100.abc"'
+        self.assertTrue(etag_matches('W/"1-100.abc"', etag))
+        self.assertTrue(etag_matches('"1-100.abc"', etag))
+        self.assertTrue(etag_matches('"other", W/"1-100.abc"', etag))
+        self.assertTrue(etag_matches('*', etag))
+        self.assertFalse(etag_matches('W/"1-101.abc"', etag))
+
+    def test_not_modified_since(self):
+        version = Version.parse('1700000000500.abc')
+        with patch('src.services.conditional.time.time', return_value=1700000100):
+            self.assertTrue(not_modified_since('Tue, 14 Nov 2023 22:13:21 GMT', version))
+            # the change happened within this second
+            self.assertFalse(not_modified_since('Tue, 14 Nov 2023 22:13:20 GMT', version))
+            self.assertFalse(not_modified_since('yesterday', version))
+            # dates in the future are ignored
+            self.assertFalse(not_modified_since('Tue, 14 Nov 2023 23:00:00 GMT', version))
+
+    def test_last_modified_after_its_second(self):
+        version = Version.parse('1700000000500.abc')
+        with patch('src.services.conditional.time.time', return_value=1700000000.9):
+            self.assertIsNone(version.last_modified())
+        with patch('src.services.conditional.time.time', return_value=1700000001.0):
+            self.assertEqual(version.last_modified(), 1700000001)
+
+    async def test_version_is_stable_until_bumped(self):
+        first = await contact_versions.get(1)
+        self.assertEqual(await contact_versions.get(1), first)
+        self.assertNotEqual(await contact_versions.get(2), first)
+        await contact_versions.bumped(1)
+        self.assertNotEqual(await contact_versions.get(1), first)
+
+    async def test_not_modified(self):
+        response = Response()
+        self.assertIsNone(await conditional_get(make_request(), response, 1))
+        etag = response.headers['etag']
+        self.assertEqual(response.headers['cache-control'], 'private, no-cache')
+
+        not_modified = await conditional_get(make_request(if_none_match=etag), Response(), 1)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers['etag'], etag)
+        # the tag of another user does not match
+        self.assertIsNone(await conditional_get(make_request(if_none_match=etag), Response(), 2))
+
+        await contact_versions.bumped(1)
+        response = Response()
+        self.assertIsNone(await conditional_get(make_request(if_none_match=etag), response, 1))
+        self.assertNotEqual(response.headers['etag'], etag)
+
+    async def test_if_modified_since(self):
+        version = await contact_versions.get(1)
+        later = version.modified_ms / 1000 + 10
+        since = formatdate(later, usegmt=True)
+        with patch('src.services.conditional.time.time', return_value=later):
+            response = Response()
+            self.assertIsNone(await conditional_get(make_request(), response, 1))
+            self.assertIn('last-modified', response.headers)
+            not_modified = await conditional_get(make_request(if_modified_since=since), Response(), 1)
+            self.assertEqual(not_modified.status_code, 304)
+            # If-None-Match takes precedence
+            self.assertIsNone(await conditional_get(make_request(if_none_match='"stale"', if_modified_since=since),
+                                                    Response(), 1))
+
+    async def test_without_redis(self):
+        init_redis(None)
+        response = Response()
+        self.assertIsNone(await conditional_get(make_request(if_none_match='*'), response, 1))
+        self.assertNotIn('etag', response.headers)
+        await contact_versions.bumped(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
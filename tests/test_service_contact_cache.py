@@ -0,0 +1,113 @@
+import unittest
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock
+
+from fakeredis import aioredis, FakeServer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import Contact, User
+from src.database.redis_db import init_redis
+from src.repository.contacts import get_contact_by_id, get_contacts, remove_contact
+from src.services.contact_cache import ContactCache, contact_cache
+
+
+class TestContactCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = aioredis.FakeRedis(server=FakeServer(), decode_responses=True)
+        init_redis(self.redis)
+        self.cache = ContactCache(ttl=60)
+        self.contacts = [
+            Contact(id=1, firstname='Олена', lastname='Петренко', email='olena@example.com', phone='380501112233',
+                    birthday=date(1990, 2, 28), additionally='friend', user_id=7),
+            Contact(id=2, firstname='Taras', lastname='Shevchenko', email='taras@example.com', phone='380671234567',
+                    birthday=None, additionally='', user_id=7),
+        ]
+
+    def tearDown(self):
+        init_redis(None)
+
+    async def test_read_through(self):
+        loader = AsyncMock(return_value=self.contacts)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        cached = await self.cache.get_or_load(7, 'list:10:0', loader)
+        loader.assert_awaited_once()
+        self.assertEqual([(c.id, c.firstname, c.email, c.birthday, c.birthday_md, c.user_id) for c in cached],
+                         [(1, 'Олена', 'olena@example.com', date(1990, 2, 28), 228, 7),
+                          (2, 'Taras', 'taras@example.com', None, None, 7)])
+        self.assertEqual(self.cache.stats()['hit_ratio'], 0.5)
+        self.assertEqual(await self.redis.ttl(next(iter(await self.redis.keys('contacts:cache:*')))), 60)
+
+    async def test_single_contact_and_none(self):
+        loader = AsyncMock(return_value=self.contacts[0])
+        await self.cache.get_or_load(7, 'id:1', loader)
+        contact = await self.cache.get_or_load(7, 'id:1', loader)
+        self.assertIsInstance(contact, Contact)
+        self.assertEqual(contact.email, 'olena@example.com')
+
+        loader = AsyncMock(return_value=None)
+        self.assertIsNone(await self.cache.get_or_load(7, 'id:3', loader))
+        self.assertIsNone(await self.cache.get_or_load(7, 'id:3', loader))
+        loader.assert_awaited_once()
+
+    async def test_invalidate(self):
+        loader = AsyncMock(return_value=self.contacts)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        # other users keep their entries
+        await self.cache.invalidate(8)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        self.assertEqual(loader.await_count, 1)
+        await self.cache.invalidate(7)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        self.assertEqual(loader.await_count, 2)
+
+    async def test_large_result_is_not_cached(self):
+        self.cache.max_entry_bytes = 100
+        loader = AsyncMock(return_value=self.contacts)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        self.assertEqual(loader.await_count, 2)
+        self.assertEqual(self.cache.stats()['too_large'], 2)
+
+    async def test_entry_of_other_version_is_a_miss(self):
+        loader = AsyncMock(return_value=self.contacts)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        key, = await self.redis.keys('contacts:cache:*')
+        await self.redis.set(key, '[0,false,[]]')
+        self.assertEqual(len(await self.cache.get_or_load(7, 'list:10:0', loader)), 2)
+        self.assertEqual(loader.await_count, 2)
+
+    async def test_disabled_or_without_redis(self):
+        loader = AsyncMock(return_value=self.contacts)
+        self.cache.enabled = False
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        self.cache.enabled = True
+        init_redis(None)
+        await self.cache.get_or_load(7, 'list:10:0', loader)
+        self.assertEqual(loader.await_count, 3)
+        self.assertEqual(self.cache.stats()['misses'], 0)
+
+    async def test_repository_invalidates_on_write(self):
+        session = AsyncMock(spec=AsyncSession)
+        result = MagicMock()
+        session.execute.return_value = result
+        result.scalars().all.return_value = self.contacts
+        result.scalar_one_or_none.return_value = self.contacts[1]
+        user = User(id=7)
+
+        await get_contacts(10, 0, user, session)
+        await get_contact_by_id(2, user, session)
+        self.assertEqual(len(await get_contacts(10, 0, user, session)), 2)
+        self.assertEqual((await get_contact_by_id(2, user, session)).email, 'taras@example.com')
+        self.assertEqual(session.execute.await_count, 2)
+
+        await remove_contact(2, user, session)
+        self.assertEqual(session.execute.await_count, 3)
+        await get_contacts(10, 0, user, session)
+        self.assertEqual(session.execute.await_count, 4)
+        self.assertGreaterEqual(contact_cache.stats()['invalidations'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import asyncio
+import gzip
+import io
+import unittest
+from datetime import date
+
+from src.schemas import ContactFormat
+from src.services.contacts_io import ContactImporter, detect_format, export_contacts
+
+CSV = b"""firstname,lastname,email,phone,birthday,additionally
+Olena,Petrenko,olena@test.com,380501112233,1990-02-28,friend
+O,Short,short@test.com,380501112233,,
+Taras,Shevchenko,taras@test.com,380671234567,,
+Taras,Again,taras@test.com,380671234567,,
+"""
+
+NDJSON = b"""{"firstname": "Olena", "lastname": "Petrenko", "email": "olena@test.com", "phone": "380501112233"}
+
+not json
+{"firstname": "Oleh", "lastname": "Ivanenko", "email": "wrong", "phone": "380501112233"}
+"""
+
+VCARD = b"""BEGIN:VCARD
+VERSION:3.0
+N:Petrenko;Olena;;;
+FN:Olena Petrenko
+EMAIL;TYPE=work:olena@test.com
+TEL;TYPE=cell:+380501112233
+BDAY:19900228
+NOTE:met at the conference\\, Kyiv\\nsecond
+  line
+END:VCARD
+BEGIN:VCARD
+N:Shevchenko;Taras
+EMAIL:taras@test.com
+TEL:+380671234567
+END:VCARD
+"""
+
+
+def read_all(data: bytes, file_format: ContactFormat, chunk_size: int = 10):
+    importer = ContactImporter(io.BytesIO(data), file_format, chunk_size, max_reported=10)
+    chunks = []
+    while chunk := importer.next_chunk():
+        chunks.append(chunk)
+    return importer, chunks
+
+
+class TestContactImporter(unittest.TestCase):
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format('book.CSV', None), ContactFormat.csv)
+        self.assertEqual(detect_format('book.jsonl', None), ContactFormat.ndjson)
+        self.assertEqual(detect_format('book', 'text/vcard'), ContactFormat.vcard)
+        self.assertIsNone(detect_format('book.txt', 'text/plain'))
+
+    def test_csv(self):
+        importer, chunks = read_all(CSV, ContactFormat.csv)
+        contacts = [contact for chunk in chunks for _, contact in chunk]
+        self.assertEqual([c.email for c in contacts], ['olena@test.com', 'taras@test.com'])
+        self.assertEqual(str(contacts[0].birthday), '1990-02-28')
+        self.assertEqual(contacts[1].additionally, '')
+        self.assertEqual(importer.report().failed, 1)
+        self.assertEqual(importer.report().errors[0].row, 3)
+        self.assertIn('firstname', importer.report().errors[0].detail)
+        self.assertEqual(importer.report().duplicates, 1)
+        self.assertEqual(importer.report().duplicate_rows[0].row, 5)
+
+    def test_chunks(self):
+        _, chunks = read_all(CSV, ContactFormat.csv, chunk_size=1)
+        self.assertEqual([[row for row, _ in chunk] for chunk in chunks], [[2], [4]])
+
+    def test_ndjson(self):
+        importer, chunks = read_all(NDJSON, ContactFormat.ndjson)
+        self.assertEqual([(row, c.email) for row, c in chunks[0]], [(1, 'olena@test.com')])
+        self.assertEqual([(e.row, e.email) for e in importer.report().errors], [(3, None), (4, 'wrong')])
+
+    def test_vcard(self):
+        importer, chunks = read_all(VCARD, ContactFormat.vcard)
+        first, second = [contact for _, contact in chunks[0]]
+        self.assertEqual((first.firstname, first.lastname, first.phone), ('Olena', 'Petrenko', '+380501112233'))
+        self.assertEqual(str(first.birthday), '1990-02-28')
+        self.assertEqual(first.additionally, 'met at the conference, Kyiv\nsecond line')
+        self.assertEqual((second.email, second.additionally), ('taras@test.com', ''))
+        self.assertEqual(importer.report().failed, 0)
+
+    def test_saved(self):
+        importer, chunks = read_all(CSV, ContactFormat.csv)
+        importer.saved(chunks[0], {'olena@test.com'})
+        self.assertEqual(importer.report().imported, 1)
+        self.assertEqual(importer.report().duplicates, 2)
+        self.assertEqual(importer.report().duplicate_rows[-1].email, 'taras@test.com')
+
+    def test_run(self):
+        importer = ContactImporter(io.BytesIO(CSV), ContactFormat.csv, chunk_size=1, max_reported=10)
+        saved = []
+
+        async def save(contacts):
+            saved.extend(contacts)
+            return {'taras@test.com'}
+
+        report = asyncio.run(importer.run(save))
+        self.assertEqual([c.email for c in saved], ['olena@test.com', 'taras@test.com'])
+        self.assertEqual((report.imported, report.duplicates, report.failed), (1, 2, 1))
+        self.assertEqual([(i.row, i.email) for i in report.duplicate_rows],
+                         [(2, 'olena@test.com'), (5, 'taras@test.com')])
+
+    def test_email_validation(self):
+        data = (b"firstname,lastname,email,phone\n"
+                b"Olena,Petrenko,Olena.P@Test.COM,380501112233\n"
+                b"Taras,Shevchenko,taras..s@test.com,380671234567\n"
+                b"Oleh,Ivanenko,oleh@test,380671234567\n")
+        importer, chunks = read_all(data, ContactFormat.csv)
+        self.assertEqual([c.email for _, c in chunks[0]], ['Olena.P@test.com'])
+        self.assertEqual([e.row for e in importer.report().errors], [3, 4])
+
+    def test_export_round_trip(self):
+        rows = [(1, 'Olena', 'Pet;renko', 'olena@test.com', '380501112233', date(1990, 2, 28), 'a, b\nc'),
+                (2, 'Taras', 'Shevchenko', 'taras@test.com', '380671234567', None, None)]
+
+        async def batches():
+            yield rows[:1]
+            yield rows[1:]
+
+        async def export(file_format, compress=False):
+            return b''.join([chunk async for chunk in export_contacts(batches(), file_format, compress)])
+
+        for file_format in ContactFormat:
+            data = asyncio.run(export(file_format))
+            importer, chunks = read_all(data, file_format)
+            contacts = [contact for _, contact in chunks[0]]
+            self.assertEqual([(c.firstname, c.lastname, c.email, c.phone, c.birthday, c.additionally)
+                              for c in contacts], [row[1:6] + (row[6] or '',) for row in rows], file_format)
+        self.assertEqual(gzip.decompress(asyncio.run(export(ContactFormat.csv, compress=True))),
+                         asyncio.run(export(ContactFormat.csv)))
+
+    def test_unreadable_file(self):
+        importer, chunks = read_all(b'\xff\xfe\x00bad', ContactFormat.csv)
+        self.assertEqual(chunks, [])
+        self.assertEqual(importer.report().failed, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
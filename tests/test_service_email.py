@@ -0,0 +1,102 @@
+import socket
+import unittest
+from email import message_from_bytes
+
+from aiosmtplib import SMTPAuthenticationError
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from src.services.email import MailSender, confirmation_message
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+        self.logins = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(message_from_bytes(envelope.content))
+        return '250 OK'
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins += 1
+        valid = auth_data.login == b'sender' and auth_data.password == b'secret'
+        return AuthResult(success=valid, handled=False)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestMailSender(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.inbox = Inbox()
+        self.controller = Controller(self.inbox, hostname='127.0.0.1', port=free_port(),
+                                     authenticator=self.inbox.authenticate, auth_require_tls=False)
+        self.controller.start()
+        self.sender = MailSender('127.0.0.1', self.controller.port, 'app@example.com',
+                                 username='sender', password='secret', use_tls=False, pool_size=2)
+
+    async def asyncTearDown(self):
+        await self.sender.close()
+
+    def tearDown(self):
+        self.controller.stop()
+
+    def message(self, n: int):
+        return self.sender.build_message(f'user{n}@example.com', 'Hello', '<p>hello</p>')
+
+    async def test_confirmation_message(self):
+        message = confirmation_message('user@example.com', 'Bob', 'http://testserver/', self.sender)
+        await self.sender.send(message)
+        received = self.inbox.messages[0]
+        self.assertEqual(received['To'], 'user@example.com')
+        self.assertEqual(received['Subject'], 'Confirm your email')
+        self.assertIn('ContactsApp', received['From'])
+        html = received.get_payload(decode=True).decode()
+        self.assertIn('Hi Bob', html)
+        self.assertIn('http://testserver/api/auth/confirmed_email/', html)
+
+    async def test_reuses_connections(self):
+        for n in range(5):
+            await self.sender.send(self.message(n))
+        self.assertEqual(len(self.inbox.messages), 5)
+        self.assertEqual(self.sender.connects, 1)
+        self.assertEqual(self.inbox.logins, 1)
+
+    async def test_batch_is_limited_by_pool_size(self):
+        results = await self.sender.send_batch(self.message(n) for n in range(20))
+        self.assertEqual(results, [None] * 20)
+        self.assertEqual(sorted(message['To'] for message in self.inbox.messages),
+                         sorted(f'user{n}@example.com' for n in range(20)))
+        self.assertLessEqual(self.sender.connects, 2)
+        self.assertEqual(self.sender.stats()['sent'], 20)
+
+    async def test_reconnects_when_server_closed_connection(self):
+        await self.sender.send(self.message(0))
+        client, _, _ = self.sender.idle[0]
+        client.close()
+        await self.sender.send(self.message(1))
+        self.assertEqual(len(self.inbox.messages), 2)
+        self.assertEqual(self.sender.connects, 2)
+
+    async def test_recycles_connection_after_max_messages(self):
+        self.sender.max_messages = 2
+        for n in range(4):
+            await self.sender.send(self.message(n))
+        self.assertEqual(self.sender.connects, 2)
+        self.assertEqual(self.sender.idle, [])
+
+    async def test_wrong_credentials(self):
+        self.sender.password = 'wrong'
+        results = await self.sender.send_batch([self.message(0)])
+        self.assertIsInstance(results[0], SMTPAuthenticationError)
+        self.assertEqual(self.sender.idle, [])
+        self.assertEqual(self.inbox.messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
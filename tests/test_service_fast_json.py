@@ -0,0 +1,53 @@
+import unittest
+from datetime import date
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from main import app
+from src.database.models import Contact
+from src.schemas import ContactResponse, ContactSuggestion
+from src.services.fast_json import FastJSON
+
+
+class TestFastJSON(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            Contact(id=1, firstname='Олена', lastname='Петренко', email='olena@example.com', phone='380501112233',
+                    birthday=date(1990, 2, 28), additionally='"friend"\n', user_id=1),
+            Contact(id=2, firstname='Taras', lastname='Shevchenko', email='taras@example.com', phone='380671234567',
+                    birthday=None, additionally='', user_id=1),
+        ]
+        self.encoder = FastJSON(ContactResponse)
+
+    def test_same_body_as_response_model(self):
+        expected = JSONResponse(jsonable_encoder([ContactResponse.from_orm(row) for row in self.rows])).body
+        self.assertEqual(self.encoder.encode(self.rows), expected)
+        self.assertEqual(self.encoder.encode([]), b'[]')
+
+    def test_render_keeps_route_headers(self):
+        response = Response()
+        response.headers['X-Next-Cursor'] = 'abc'
+        fast = self.encoder.render(self.rows, response)
+        self.assertEqual(fast.headers['content-type'], 'application/json')
+        self.assertEqual(fast.headers['x-next-cursor'], 'abc')
+        self.assertEqual(int(fast.headers['content-length']), len(fast.body))
+
+    def test_disabled_returns_rows(self):
+        self.assertIs(FastJSON(ContactResponse, enabled=False).render(self.rows, Response()), self.rows)
+
+    def test_other_model(self):
+        self.assertEqual(FastJSON(ContactSuggestion).encode(self.rows[1:]),
+                         b'[{"id":2,"firstname":"Taras","lastname":"Shevchenko","email":"taras@example.com"}]')
+
+    def test_openapi_schema_unchanged(self):
+        for path in ('/api/contacts/', '/api/contacts/find/', '/api/contacts/search/', '/api/contacts/birthday/'):
+            schema = app.openapi()['paths'][path]['get']['responses']['200']['content']['application/json']['schema']
+            self.assertEqual(schema['type'], 'array')
+            self.assertEqual(schema['items'], {'$ref': '#/components/schemas/ContactResponse'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fakeredis import aioredis, FakeServer
+
+from src.database.redis_db import init_redis
+from src.services.jobs import JobQueue
+
+
+class TestJobQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis = aioredis.FakeRedis(server=FakeServer(), decode_responses=True)
+        init_redis(self.redis)
+        self.queue = JobQueue('test-jobs', max_attempts=3, backoff_base=10, claim_idle=30)
+        self.handler = AsyncMock()
+        self.queue.register('greet', self.handler)
+        await self.queue.ensure_group(self.redis)
+
+    def tearDown(self):
+        init_redis(None)
+
+    async def test_enqueue_and_run(self):
+        job_id = await self.queue.enqueue('greet', email='user@example.com', n=1)
+        self.assertIsNotNone(job_id)
+        self.assertEqual(await self.queue.work_once(self.redis, 'c1', 10), 1)
+        self.handler.assert_awaited_once_with(email='user@example.com', n=1)
+        # acknowledged jobs are removed from the stream
+        self.assertEqual(await self.queue.refresh_depth(self.redis),
+                         {'queued': 0, 'pending': 0, 'delayed': 0, 'dead': 0})
+        self.assertEqual(self.queue.stats()['succeeded'], 1)
+
+    async def test_enqueue_without_redis(self):
+        init_redis(None)
+        self.assertIsNone(await self.queue.enqueue('greet'))
+        self.assertEqual(self.queue.stats()['enqueue_failed'], 1)
+
+    async def test_failed_job_is_retried_with_backoff(self):
+        self.handler.side_effect = [ConnectionError('smtp down'), None]
+        await self.queue.enqueue('greet', n=1)
+        with patch('src.services.jobs.time.time', return_value=1000.0):
+            await self.queue.work_once(self.redis, 'c1', 10)
+        self.assertEqual((await self.queue.refresh_depth(self.redis))['delayed'], 1)
+        score = (await self.redis.zrange(self.queue.delayed, 0, -1, withscores=True))[0][1]
+        self.assertTrue(1005 <= score <= 1010)
+
+        self.assertEqual(await self.queue.promote(self.redis), 1)
+        self.assertEqual(await self.queue.work_once(self.redis, 'c1', 10), 1)
+        self.assertEqual(self.handler.await_count, 2)
+        self.assertEqual(self.queue.stats()['retried'], 1)
+        self.assertEqual(self.queue.stats()['succeeded'], 1)
+
+    async def test_job_is_not_promoted_before_it_is_due(self):
+        self.handler.side_effect = ConnectionError('smtp down')
+        await self.queue.enqueue('greet')
+        await self.queue.work_once(self.redis, 'c1', 10)
+        self.assertEqual(await self.queue.promote(self.redis), 0)
+        self.assertEqual(await self.queue.work_once(self.redis, 'c1', 10), 0)
+
+    async def test_dead_letter_after_max_attempts(self):
+        self.handler.side_effect = ValueError('bad address')
+        await self.queue.enqueue('greet', email='bad')
+        await self.queue.work_once(self.redis, 'c1', 10)
+        for _ in range(2):
+            # make the retry due at once
+            member, = await self.redis.zrange(self.queue.delayed, 0, -1)
+            await self.redis.zadd(self.queue.delayed, {member: 0})
+            await self.queue.promote(self.redis)
+            await self.queue.work_once(self.redis, 'c1', 10)
+        self.assertEqual(self.handler.await_count, 3)
+        depth = await self.queue.refresh_depth(self.redis)
+        self.assertEqual(depth, {'queued': 0, 'pending': 0, 'delayed': 0, 'dead': 1})
+        (_, dead), = await self.redis.xrange(self.queue.dead)
+        self.assertEqual(dead['name'], 'greet')
+        self.assertEqual(json.loads(dead['args']), {'email': 'bad'})
+        self.assertEqual(dead['attempts'], '3')
+        self.assertIn('bad address', dead['error'])
+
+    async def test_unknown_job_is_dead_lettered(self):
+        await self.queue.enqueue('unknown')
+        await self.queue.work_once(self.redis, 'c1', 10)
+        self.assertEqual((await self.queue.refresh_depth(self.redis))['dead'], 1)
+
+    async def test_jobs_of_dead_worker_are_claimed(self):
+        await self.queue.enqueue('greet', n=1)
+        # c1 receives the job and dies before acknowledging it
+        await self.redis.xreadgroup(self.queue.group, 'c1', {self.queue.stream: '>'}, count=10)
+        self.assertEqual((await self.queue.refresh_depth(self.redis))['pending'], 1)
+        self.assertEqual(await self.queue.claim(self.redis, 'c2', 10), 0)
+        self.queue.claim_idle = 0
+        self.assertEqual(await self.queue.claim(self.redis, 'c2', 10), 1)
+        self.handler.assert_awaited_once_with(n=1)
+        self.assertEqual((await self.queue.refresh_depth(self.redis))['pending'], 0)
+
+    async def test_run_until_stopped(self):
+        stop = asyncio.Event()
+
+        async def greet(n):
+            if n == 2:
+                stop.set()
+
+        self.queue.register('greet', greet)
+        for n in range(3):
+            await self.queue.enqueue('greet', n=n)
+        # no blocking reads: fakeredis loses the entries already in the stream when XREADGROUP blocks
+        await asyncio.wait_for(self.queue.run('c1', stop, concurrency=10, block=0), 5)
+        self.assertEqual(self.queue.stats()['succeeded'], 3)
+        self.assertEqual(self.queue.stats()['depth_queued'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
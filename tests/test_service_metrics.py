@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+
+import pytest
+from fakeredis import aioredis, FakeServer
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from redis.asyncio import ConnectionPool, Redis
+
+from main import app, read_metrics
+from src.conf.config import settings
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.services.metrics import MetricsRegistry, MetricsMiddleware, RedisRoundTripCounter, request_counters, \
+    RequestCounters, instrument_engine
+
+
+def make_app(registry: MetricsRegistry) -> FastAPI:
+    test_app = FastAPI()
+    test_app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @test_app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    @test_app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    return test_app
+
+
+def test_latency_by_route_template():
+    registry = MetricsRegistry()
+    client = TestClient(make_app(registry), raise_server_exceptions=False)
+    for item_id in (1, 2, 3):
+        assert client.get(f"/items/{item_id}").status_code == 200
+    client.get("/items/x")
+    client.get("/missing")
+    client.get("/boom")
+    series = registry.latency.series
+    assert series[("GET", "/items/{item_id}", 200)][-1] == 3
+    assert series[("GET", "/items/{item_id}", 422)][-1] == 1
+    assert series[("GET", "unmatched", 404)][-1] == 1
+    assert series[("GET", "/boom", 500)][-1] == 1
+    assert registry.in_flight == 0
+
+    page = registry.render()
+    assert '# TYPE http_request_duration_seconds histogram' in page
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items/{item_id}",status="200",le="+Inf"} 3' \
+           in page
+    assert 'http_request_db_queries_count{method="GET",route="/items/{item_id}"} 4' in page
+    assert 'http_requests_in_flight 0' in page
+
+
+def test_workers_are_merged(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+    registry.register_collector("cache", lambda: {"hits": 5, "enabled": True})
+    registry.latency.observe(("GET", "/", 200), 0.002)
+    exited_worker = registry.snapshot()
+    exited_worker["pid"] = 2 ** 22 + 1
+    exited_worker["gauges"]["http_requests_in_flight"] = 7
+    (tmp_path / f"{exited_worker['pid']}.json").write_text(json.dumps(exited_worker))
+
+    page = registry.render()
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"} 2' in page
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/",status="200",le="0.001"} 0' in page
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/",status="200",le="0.0025"} 2' in page
+    # gauges only of running workers
+    assert 'http_requests_in_flight 0' in page
+    assert f'cache_hits{{worker="{os.getpid()}"}} 5' in page
+    assert 'cache_enabled' not in page
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_db_queries_are_counted_per_request():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    instrument_engine(engine.sync_engine)
+    instrument_engine(engine.sync_engine)
+    registry = MetricsRegistry()
+    test_app = make_app(registry)
+
+    @test_app.get("/queries")
+    async def queries():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 2"))
+        return {}
+
+    TestClient(test_app).get("/queries")
+    TestClient(test_app).get("/items/1")
+    assert registry.db_queries.series[("GET", "/queries")][-2:] == [2, 1]
+    assert registry.db_queries.series[("GET", "/items/{item_id}")][-2:] == [0, 1]
+
+
+class FakeRoundTripCounter(RedisRoundTripCounter, aioredis.FakeConnection):
+    pass
+
+
+def test_redis_round_trips_are_counted():
+    async def run():
+        client = Redis(connection_pool=ConnectionPool(connection_class=FakeRoundTripCounter, server=FakeServer()))
+        counters = RequestCounters()
+        token = request_counters.set(counters)
+        await client.set("a", 1)
+        await client.get("a")
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.get("a")
+            pipe.delete("a")
+            await pipe.execute()
+        request_counters.reset(token)
+        await client.get("a")
+        return counters.redis
+
+    assert asyncio.run(run()) == 3
+
+
+def test_metrics_endpoint_is_local_only(client, monkeypatch):
+    response = client.get("/metrics")
+    assert response.status_code == 404
+    monkeypatch.setattr(settings, "metrics_local_only", False)
+    client.get("/api/contacts/search/", params={"q": "x"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'route="/api/contacts/search/",status="401"' in response.text
+    assert "db_pool_checkouts" in response.text
+
+
+def test_metrics_endpoint_without_client_address():
+    # e.g. a request over a Unix socket has no client address
+    request = Request({"type": "http", "method": "GET", "path": "/metrics", "headers": []})
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(read_metrics(request))
+    assert err.value.status_code == 404
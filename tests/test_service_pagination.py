@@ -0,0 +1,32 @@
+import unittest
+
+from fastapi import HTTPException
+
+from src.database.models import Contact
+from src.services.pagination import encode_cursor, decode_cursor, next_cursor
+
+
+class TestPagination(unittest.TestCase):
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor(42)
+        self.assertNotIn('42', cursor)
+        self.assertEqual(decode_cursor(cursor, 1), (42,))
+
+    def test_decode_invalid_cursor(self):
+        for cursor in ('not a cursor', encode_cursor(1, 2), encode_cursor('x')):
+            with self.assertRaises(HTTPException) as err:
+                decode_cursor(cursor, 1)
+            self.assertEqual(err.exception.status_code, 400)
+
+    def test_next_cursor_full_page(self):
+        contacts = [Contact(id=1), Contact(id=5)]
+        self.assertEqual(decode_cursor(next_cursor(contacts, 2, 'id'), 1), (5,))
+
+    def test_next_cursor_last_page(self):
+        self.assertIsNone(next_cursor([Contact(id=1)], 2, 'id'))
+        self.assertIsNone(next_cursor([], 2, 'id'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.passwords import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hasher = PasswordHasher(rounds=4, workers=2, max_pending=4)
+
+    def tearDown(self):
+        self.hasher.executor.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash('qwerty23')
+        self.assertTrue(hashed.startswith('$2b$04$'))
+        self.assertTrue(await self.hasher.verify('qwerty23', hashed))
+        self.assertFalse(await self.hasher.verify('qwerty', hashed))
+
+    async def test_verify_and_update_same_cost(self):
+        hashed = await self.hasher.hash('qwerty23')
+        self.assertEqual(await self.hasher.verify_and_update('qwerty23', hashed), (True, None))
+
+    async def test_verify_and_update_other_cost(self):
+        hashed = PasswordHasher(rounds=5).context.hash('qwerty23')
+        verified, new_hash = await self.hasher.verify_and_update('qwerty23', hashed)
+        self.assertTrue(verified)
+        self.assertTrue(new_hash.startswith('$2b$04$'))
+        self.assertEqual(await self.hasher.verify_and_update('wrong', hashed), (False, None))
+
+    async def test_runs_off_the_event_loop(self):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.create_task(ticker())
+        slow = PasswordHasher(rounds=10, workers=1)
+        await slow.hash('qwerty23')
+        task.cancel()
+        slow.executor.shutdown()
+        self.assertGreater(ticks, 5)
+
+    async def test_rejects_when_queue_is_full(self):
+        hashes = await asyncio.gather(*(self.hasher.hash(str(i)) for i in range(6)), return_exceptions=True)
+        rejected = [error for error in hashes if isinstance(error, HTTPException)]
+        self.assertEqual(len(rejected), 2)
+        self.assertEqual(rejected[0].status_code, 503)
+        stats = self.hasher.stats()
+        self.assertEqual(stats['peak_pending'], 4)
+        self.assertEqual(stats['completed'], 4)
+        self.assertEqual(stats['rejected'], 2)
+        self.assertEqual(stats['pending'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import AsyncMock
+
+from src.database.models import Contact
+from src.services.suggest import PrefixIndex, SuggestIndex, normalize
+
+CONTACTS = [
+    (1, 'Olena', 'Petrenko', 'olena@test.com'),
+    (2, 'Oleh', 'Shevchenko', 'shev@test.com'),
+    (3, 'Zoë', 'Olejnik', 'zoe@test.com'),
+]
+
+
+class TestPrefixIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex(CONTACTS)
+
+    def ids(self, prefix, limit=10):
+        return [c['id'] for c in self.index.lookup(prefix, limit)]
+
+    def test_normalize(self):
+        self.assertEqual(normalize('ZOË Straße'), 'zoe strasse')
+
+    def test_lookup_by_any_name_or_email(self):
+        self.assertEqual(self.ids('ole'), [2, 3, 1])
+        self.assertEqual(self.ids('olena p'), [1])
+        self.assertEqual(self.ids('SHEV'), [2])
+        self.assertEqual(self.ids('zoe'), [3])
+        self.assertEqual(self.ids('x'), [])
+        self.assertEqual(self.ids(' '), [])
+
+    def test_lookup_result_and_limit(self):
+        self.assertEqual(self.index.lookup('petr', 10),
+                         [{'id': 1, 'firstname': 'Olena', 'lastname': 'Petrenko', 'email': 'olena@test.com'}])
+        self.assertEqual(len(self.index.lookup('ole', 2)), 2)
+
+    def test_add_and_remove(self):
+        self.index.add((2, 'Taras', 'Shevchenko', 'taras@test.com'))
+        self.assertEqual(self.ids('ole'), [3, 1])
+        self.assertEqual(self.ids('taras'), [2])
+        self.index.remove(1)
+        self.index.remove(100)
+        self.assertEqual(self.ids('ole'), [3])
+        self.assertEqual(self.ids('olena'), [])
+
+
+class TestSuggestIndex(unittest.IsolatedAsyncioTestCase):
+
+    async def test_lazy_load_and_update(self):
+        cache = SuggestIndex(max_users=10, ttl=60)
+        loader = AsyncMock(return_value=CONTACTS)
+        await cache.get(1, loader)
+        cache.saved(1, Contact(id=4, firstname='Petro', lastname='Ivanenko', email='petro@test.com'))
+        cache.removed(1, 1)
+        index = await cache.get(1, loader)
+        loader.assert_awaited_once()
+        self.assertEqual([c['id'] for c in index.lookup('pet', 10)], [4])
+
+    async def test_lru_eviction(self):
+        cache = SuggestIndex(max_users=2, ttl=60)
+        for user_id in (1, 2, 1, 3):
+            await cache.get(user_id, AsyncMock(return_value=[]))
+        self.assertEqual(list(cache.indexes), [1, 3])
+
+    async def test_expired_index_is_reloaded(self):
+        cache = SuggestIndex(max_users=10, ttl=0)
+        loader = AsyncMock(return_value=CONTACTS)
+        await cache.get(1, loader)
+        await cache.get(1, loader)
+        self.assertEqual(loader.await_count, 2)
+
+    async def test_write_during_load_is_not_cached(self):
+        cache = SuggestIndex(max_users=10, ttl=60)
+
+        async def loader():
+            cache.removed(1, 1)
+            return CONTACTS
+
+        await cache.get(1, loader)
+        self.assertNotIn(1, cache.indexes)
+
+
+if __name__ == '__main__':
+    unittest.main()
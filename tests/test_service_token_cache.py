@@ -0,0 +1,104 @@
+import time
+import unittest
+from unittest.mock import patch, AsyncMock
+
+from fastapi import HTTPException
+
+from src.database.models import User
+from src.services import auth as auth_module
+from src.services.auth import auth_service
+from src.services.token_cache import TokenCache
+
+
+def claims(sub='deadpool@example.com', ttl=60):
+    return {'sub': sub, 'scope': 'access_token', 'exp': time.time() + ttl}
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache(max_entries=2)
+
+    def test_hit_until_expiry(self):
+        self.cache.put('token', claims())
+        self.cache.put('expired', claims(ttl=-1))
+        self.assertEqual(self.cache.get('token')['sub'], 'deadpool@example.com')
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertIsNone(self.cache.get('unknown'))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_stores_digest_not_token(self):
+        self.cache.put('token', claims())
+        self.assertNotIn('token', self.cache.entries)
+        self.assertEqual(len(next(iter(self.cache.entries))), 32)
+
+    def test_bounded(self):
+        for token in ('a', 'b', 'c'):
+            self.cache.put(token, claims())
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_invalidate_subject(self):
+        self.cache.put('a', claims('a@example.com'))
+        self.cache.put('b', claims('b@example.com'))
+        self.cache.invalidate('a@example.com')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+
+    def test_check_racing_with_invalidation_is_not_served(self):
+        generation = self.cache.subject_generation('a@example.com')
+        # the user changes while the token is being checked
+        self.cache.invalidate('a@example.com')
+        self.cache.put('a', claims('a@example.com'), generation)
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', claims('a@example.com'), self.cache.subject_generation('a@example.com'))
+        self.assertIsNotNone(self.cache.get('a'))
+
+    def test_clear(self):
+        self.cache.put('a', claims())
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.generation, 1)
+
+    def test_disabled(self):
+        cache = TokenCache(max_entries=0)
+        cache.put('a', claims())
+        self.assertIsNone(cache.get('a'))
+
+
+class TestAuthTokenCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        auth_service.token_cache.clear()
+        self.user = User(id=1, email='deadpool@example.com')
+        self.loader = patch.object(auth_module.user_cache, 'get_or_load', AsyncMock(return_value=self.user))
+        self.loader.start()
+
+    def tearDown(self):
+        self.loader.stop()
+
+    async def test_token_is_decoded_once(self):
+        token = await auth_service.create_access_token(data={'sub': self.user.email})
+        with patch.object(auth_module.jwt, 'decode', wraps=auth_module.jwt.decode) as decode:
+            for _ in range(3):
+                self.assertIs(await auth_service.get_current_user(token, None), self.user)
+        self.assertEqual(decode.call_count, 1)
+
+    async def test_invalid_tokens_are_not_cached(self):
+        token = await auth_service.create_refresh_token(data={'sub': self.user.email})
+        for bad in (token, token[:-2] + 'xx'):
+            with self.assertRaises(HTTPException):
+                await auth_service.get_current_user(bad, None)
+        self.assertEqual(auth_service.token_cache.entries, {})
+
+    async def test_expired_entry_is_verified_again(self):
+        token = await auth_service.create_access_token(data={'sub': self.user.email}, expires_delta=60)
+        await auth_service.get_current_user(token, None)
+        with patch('src.services.token_cache.time.time', return_value=time.time() + 120), \
+                patch.object(auth_module.jwt, 'decode', side_effect=auth_module.JWTError('expired')):
+            with self.assertRaises(HTTPException):
+                await auth_service.get_current_user(token, None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from fakeredis import aioredis, FakeServer
+from redis.exceptions import ConnectionError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User, Role
+from src.database.redis_db import init_redis
+from src.repository.users import update_avatar
+from src.services.auth import auth_service
+from src.services.user_cache import UserCache, LocalCache, INVALIDATION_CHANNEL, codec, user_cache
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = aioredis.FakeRedis(server=FakeServer(), decode_responses=True)
+        init_redis(self.redis)
+        user_cache.local.clear()
+        self.cache = UserCache(ttl=60)
+        self.user = User(id=7, username='deadpool', email='deadpool@example.com', password='hash',
+                         refresh_token='token', avatar='https://avatar', roles=Role.moderator, confirmed=True)
+
+    def tearDown(self):
+        init_redis(None)
+
+    async def test_round_trip_keeps_only_route_fields(self):
+        await self.cache.set(self.user)
+        cached = await self.cache.get(self.user.email)
+        self.assertEqual((cached.id, cached.username, cached.email, cached.avatar, cached.roles, cached.confirmed),
+                         (7, 'deadpool', 'deadpool@example.com', 'https://avatar', Role.moderator, True))
+        self.assertIsNone(cached.password)
+        self.assertIsNone(cached.refresh_token)
+        self.assertNotIn('hash', await self.redis.get('user:deadpool@example.com'))
+
+    async def test_set_with_expiry(self):
+        await self.cache.set(self.user)
+        self.assertTrue(0 < await self.redis.ttl('user:deadpool@example.com') <= 60)
+
+    async def test_other_version_is_a_miss(self):
+        await self.redis.set('user:deadpool@example.com', json.dumps([codec.version + 1, 7]))
+        self.assertIsNone(await self.cache.get(self.user.email))
+        await self.redis.set('user:deadpool@example.com', 'not json')
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_invalidate(self):
+        await self.cache.set(self.user)
+        await self.cache.invalidate(self.user.email)
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_redis_errors_are_misses(self):
+        broken = MagicMock()
+        broken.get = AsyncMock(side_effect=ConnectionError())
+        broken.set = AsyncMock(side_effect=ConnectionError())
+        init_redis(broken)
+        await self.cache.set(self.user)
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_without_redis(self):
+        init_redis(None)
+        await self.cache.set(self.user)
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_repository_update_invalidates(self):
+        await user_cache.set(self.user)
+        session = AsyncMock(spec=AsyncSession)
+        session.execute.return_value.scalar_one_or_none = MagicMock(return_value=self.user)
+        await update_avatar(self.user.email, 'https://new-avatar', session)
+        self.assertIsNone(await self.redis.get('user:deadpool@example.com'))
+
+    async def test_current_user_is_served_from_cache(self):
+        token = await auth_service.create_access_token(data={'sub': self.user.email})
+        session = AsyncMock(spec=AsyncSession)
+        session.execute.return_value.scalar_one_or_none = MagicMock(return_value=self.user)
+        first = await auth_service.get_current_user(token, session)
+        second = await auth_service.get_current_user(token, session)
+        self.assertEqual(session.execute.await_count, 1)
+        self.assertEqual((first.id, first.roles), (second.id, second.roles))
+
+
+    async def test_get_or_load_levels(self):
+        loader = AsyncMock(return_value=self.user)
+        self.assertEqual((await self.cache.get_or_load(self.user.email, loader)).id, 7)
+        await self.cache.get_or_load(self.user.email, loader)
+        self.cache.local.clear()
+        await self.cache.get_or_load(self.user.email, loader)
+        self.assertEqual(loader.await_count, 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['l1_hits'], stats['l2_hits']), (1, 1, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
+
+    async def test_get_or_load_unknown_user(self):
+        self.assertIsNone(await self.cache.get_or_load('nobody@example.com', AsyncMock(return_value=None)))
+        self.assertEqual(self.cache.local.entries, {})
+
+    async def test_invalidation_while_loading_skips_l1(self):
+        async def loader():
+            await self.cache.invalidate(self.user.email)
+            return self.user
+
+        await self.cache.get_or_load(self.user.email, loader)
+        self.assertIsNone(self.cache.local.get(self.user.email))
+
+    async def test_invalidate_publishes(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        await pubsub.get_message(timeout=1)
+        await self.cache.invalidate(self.user.email)
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+        self.assertEqual(message['data'], self.user.email)
+        await pubsub.close()
+
+    async def test_listener_drops_entries_of_other_workers(self):
+        other_worker = UserCache(ttl=60)
+        await other_worker.get_or_load(self.user.email, AsyncMock(return_value=self.user))
+        listener = asyncio.create_task(other_worker.listen())
+        await asyncio.sleep(0.05)
+        await other_worker.get_or_load(self.user.email, AsyncMock(return_value=self.user))
+        await self.cache.invalidate(self.user.email)
+        for _ in range(50):
+            if other_worker.local.get(self.user.email) is None:
+                break
+            await asyncio.sleep(0.01)
+        listener.cancel()
+        self.assertIsNone(other_worker.local.get(self.user.email))
+
+
+class TestLocalCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = LocalCache(max_entries=2, ttl=60, max_bytes=2 ** 20)
+        cache.put('a', '1')
+        cache.put('b', '2')
+        cache.get('a')
+        cache.put('c', '3')
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_memory_budget(self):
+        entry = LocalCache.entry_size('a', 'x' * 100)
+        cache = LocalCache(max_entries=100, ttl=60, max_bytes=entry * 2)
+        for key in 'abc':
+            cache.put(key, 'x' * 100)
+        self.assertEqual(list(cache.entries), ['b', 'c'])
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        cache.put('d', 'x' * 1000)
+        self.assertIsNone(cache.get('d'))
+
+    def test_ttl(self):
+        cache = LocalCache(max_entries=10, ttl=-1, max_bytes=2 ** 20)
+        cache.put('a', '1')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Job worker: runs the background jobs (confirmation emails) the web workers put on the Redis job stream.
+Start as many processes as needed, each of them is a separate consumer:
+
+    python worker.py
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+import redis.asyncio as redis
+
+from src.conf.config import settings
+from src.database.redis_db import init_redis
+from src.services.email import mail_sender  # registers the email jobs
+from src.services.jobs import job_queue
+from src.services.metrics import metrics
+
+
+async def main():
+    client = redis.Redis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password, db=0,
+                         encoding="utf-8", decode_responses=True)
+    init_redis(client)
+    metrics.register_collector('jobs', job_queue.stats)
+    metrics.register_collector('mail_sender', mail_sender.stats)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    flush = asyncio.create_task(metrics.flush_periodically(settings.metrics_flush_interval))
+    try:
+        # jobs running when stop is set are finished before the loop returns
+        await job_queue.run(f"{socket.gethostname()}-{os.getpid()}", stop, settings.jobs_concurrency)
+    finally:
+        flush.cancel()
+        metrics.flush()
+        await mail_sender.close()
+        init_redis(None)
+        await client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(main())